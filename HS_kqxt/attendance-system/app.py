@@ -1,49 +1,154 @@
 import streamlit as st
 from streamlit.components.v1 import html
 import os
-import json
-from modules import auth, employees, rules, reports
+import time
+from datetime import date
+from modules import auth, dashboard, frontend, jobs, live_dashboard, migrations, tracing
 
 # 确保数据目录存在
 os.makedirs('data', exist_ok=True)
 
-# 初始化数据库表
-def init_all_tables():
-    """初始化所有数据库表结构"""
-    auth.init_users_table()
-    employees.init_employees_table()
-    rules.init_attendance_rules()
-    reports.init_attendance_records()
-
-# 读取前端HTML文件
-def load_frontend_html():
-    """加载前端HTML模板文件"""
-    try:
-        with open(os.path.join("frontend", "index.html"), "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        st.error("前端模板文件未找到，请确保frontend/index.html存在")
-        return "<h1>前端资源加载失败</h1>"
+# 有后台任务执行时，页面轮询任务状态的间隔(秒)
+JOB_POLL_SECONDS = 2
+# 局部刷新：Streamlit 1.37 起为 st.fragment，1.33–1.36 为 st.experimental_fragment，更早的版本没有
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+# 管理员在调试面板中为本会话开启追踪时使用的会话状态键
+TRACE_SESSION_KEY = "trace_enabled"
 
 # 准备后端数据
 def get_backend_data():
     """获取需要传递给前端的后端数据"""
-    attendance_rules = rules.get_attendance_rules()
-    # 调试：打印获取到的考勤规则
-    print("考勤规则数据:", attendance_rules)
+    snapshot = dashboard.dashboard_snapshot()
+    # 调试数据只在开启追踪时记录（调试面板和追踪日志中可见）
+    tracing.note("attendance_rules", snapshot["attendance_rules"])
     return {
         "current_user": st.session_state.get("username", "管理员"),
         "user_role": st.session_state.get("role", "admin"),
-        "stats": {
-            "total_employees": employees.get_total_count(),
-            "today_attendance": reports.get_today_attendance(),
-            "late_count": reports.get_late_count(),
-            "overtime_hours": reports.get_overtime_hours()
-        },
-        "attendance_rules": rules.get_attendance_rules(),
-        "recent_records": reports.get_recent_records()
+        "stats": snapshot["stats"],
+        "attendance_rules": snapshot["attendance_rules"],
+        "recent_records": snapshot["recent_records"]
     }
 
+# 月报导出
+def export_month_report():
+    """按部门和日期范围导出“上下班打卡_月报”格式的 Excel/CSV（后台任务生成，完成后在任务列表下载）"""
+    with st.expander("导出考勤月报"):
+        today = date.today()
+        first_day = today.replace(day=1)
+        col1, col2, col3, col4 = st.columns(4)
+        start_date = col1.date_input("开始日期", value=first_day, key="export_start")
+        end_date = col2.date_input("结束日期", value=today, key="export_end")
+        department = col3.text_input("部门（留空为全部）", key="export_department").strip() or None
+        file_format = col4.radio("格式", ["xlsx", "csv"], horizontal=True, key="export_format")
+
+        if st.button("生成导出文件", key="export_build"):
+            if start_date > end_date:
+                st.error("开始日期不能晚于结束日期")
+                return
+            job_id, created = jobs.submit_export(
+                start_date, end_date, department, file_format,
+                created_by=st.session_state.get("username")
+            )
+            if created:
+                st.info(f"已加入导出队列（任务 #{job_id}），完成后在“后台任务”中下载")
+            else:
+                st.info(f"相同的导出任务 #{job_id} 正在进行中")
+
+# 考勤文件导入
+def import_uploaded_files(uploaded_files):
+    """上传的文件提交为后台导入任务，按文件内容去重，页面重跑不会重复导入"""
+    job_id, created = jobs.submit_import(
+        [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files],
+        created_by=st.session_state.get("username")
+    )
+    if created:
+        st.info(f"已加入导入队列（任务 #{job_id}）")
+        return
+    job = jobs.get_job(job_id)
+    if job["status"] == jobs.DONE:
+        st.success(f"这些文件已导入过（任务 #{job_id}）：{job['message']}")
+    else:
+        st.info(f"这些文件正在导入（任务 #{job_id}）")
+
+# 后台任务
+def own_active_jobs():
+    """当前用户提交的任务是否还在排队或进行中（只为自己的任务轮询）"""
+    return jobs.has_active_jobs(created_by=st.session_state.get("username"))
+
+def job_panel():
+    """导入、重新处理、导出任务的进度、取消和下载"""
+    active = own_active_jobs()
+    with st.expander("后台任务", expanded=active):
+        col1, col2, col3 = st.columns([1, 1, 1])
+        today = date.today()
+        start_date = col1.date_input("重新处理开始日期", value=today.replace(day=1), key="reprocess_start")
+        end_date = col2.date_input("重新处理结束日期", value=today, key="reprocess_end")
+        if col3.button("按班次重新处理", key="reprocess_submit"):
+            if start_date > end_date:
+                st.error("开始日期不能晚于结束日期")
+            else:
+                job_id, created = jobs.submit_reprocess(
+                    start_date, end_date, created_by=st.session_state.get("username")
+                )
+                st.info(f"已加入队列（任务 #{job_id}）" if created else f"相同的任务 #{job_id} 正在进行中")
+                active = True
+
+        if _fragment is None:
+            job_list(False)
+        else:
+            # 本用户有任务在执行时只定时重跑任务列表，不重跑整个页面
+            _fragment(run_every=JOB_POLL_SECONDS if active else None)(job_list)(active)
+
+def job_list(poll):
+    """任务列表；poll 为 True 时作为局部刷新片段定时重跑"""
+    if poll and not own_active_jobs():
+        # 本用户的任务都已结束：整页重跑一次，刷新仪表盘数据并停止轮询
+        st.rerun()
+    # 只列出本用户提交的任务，不能取消其他用户的任务
+    for job in jobs.list_jobs(created_by=st.session_state.get("username")):
+        label = (f"#{job['id']} {jobs.KIND_LABELS.get(job['kind'], job['kind'])} · "
+                 f"{jobs.STATUS_LABELS.get(job['status'], job['status'])}")
+        if job["kind"] == "import":
+            label += " · " + "、".join(f["name"] for f in job["payload"].get("files", []))
+        col1, col2 = st.columns([4, 1])
+        if job["status"] in jobs.ACTIVE_STATUSES:
+            col1.progress(job["progress"] / 100, text=f"{label}（{job['progress']:.0f}%）")
+            if col2.button("取消", key=f"job_cancel_{job['id']}"):
+                success, msg = jobs.cancel(job["id"])
+                (st.success if success else st.warning)(msg)
+        else:
+            col1.write(f"{label}：{job['message'] or ''}")
+            result = job["result"] or {}
+            if job["kind"] == "export" and job["status"] == jobs.DONE and os.path.exists(result.get("path", "")):
+                with open(result["path"], "rb") as f:
+                    col2.download_button("下载", f, file_name=result["file_name"],
+                                         key=f"job_download_{job['id']}")
+
+# 调试面板
+def debug_panel():
+    """管理员可见：开启本会话的追踪，查看最近几次运行的阶段耗时和最慢的数据库语句"""
+    if st.session_state.get("role") != "admin":
+        return
+    with st.expander("调试：性能追踪"):
+        st.checkbox("为本会话开启追踪（记录每次运行的阶段耗时和数据库语句）", key=TRACE_SESSION_KEY,
+                    disabled=tracing.ENABLED)
+        st.caption(f"追踪日志：{tracing.LOG_PATH}（JSON 行格式，自动轮转）")
+        runs = tracing.recent_runs()
+        if not runs:
+            st.write("暂无追踪记录，开启后刷新页面即可看到")
+            return
+        labels = [f"{r['started_at']} · {r['label']} · {r['total_ms']:.0f} ms · {r['query_count']} 条语句"
+                  for r in runs]
+        index = st.selectbox("运行记录", range(len(runs)), format_func=labels.__getitem__, key="trace_run")
+        run = runs[index]
+        st.write(f"总耗时 {run['total_ms']:.1f} ms，其中数据库 {run['query_ms']:.1f} ms")
+        st.dataframe(run["phases"], use_container_width=True)
+        st.dataframe(tracing.summarize_queries(run), use_container_width=True)
+        if run["dropped_queries"]:
+            st.caption(f"另有 {run['dropped_queries']} 条语句超出记录上限，只计入总数")
+        if run["notes"]:
+            st.json(run["notes"], expanded=False)
+
 # 主应用
 def main():
     # 设置页面配置
@@ -52,154 +157,116 @@ def main():
         initial_sidebar_state="collapsed",  # 折叠侧边栏
         menu_items={"Get help": None, "Report a bug": None, "About": None}
     )
-    # 初始化数据库
-    init_all_tables()
+    # 开启追踪时记录本次运行各阶段的耗时和数据库语句（modules.tracing）
+    with tracing.run("main", tracing.ENABLED or st.session_state.get(TRACE_SESSION_KEY, False)):
+        render_app()
+
+    # 不支持局部刷新的旧版 Streamlit：本用户有任务在执行时整页定时重跑
+    if _fragment is None and st.session_state.get("logged_in") and own_active_jobs():
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+def render_app():
+    """页面主体，按阶段计时：初始化、控件、数据获取、模板填充、渲染"""
+    with tracing.phase("table_init"):
+        # 检查数据库结构（每个进程只执行一次迁移）
+        migrations.ensure_schema()
+        # 后台任务线程（每个进程只启动一个）
+        jobs.start_worker()
     
     # 检查登录状态
     if "logged_in" not in st.session_state or not st.session_state["logged_in"]:
         # 显示登录页面
-        auth.login_page()
+        with tracing.phase("login"):
+            auth.login_page()
     else:
-        uploaded_file = st.file_uploader("上传考勤Excel", type=["xlsx"])
-        if uploaded_file:
-            from modules.import_excel import import_attendance_from_excel
-            success, msg = import_attendance_from_excel(uploaded_file)
-            if success:
-                st.success(msg)
-            else:
-                st.error(msg)
+        with tracing.phase("widgets"):
+            uploaded_files = st.file_uploader("上传考勤Excel", type=["xlsx"], accept_multiple_files=True)
+            if uploaded_files:
+                import_uploaded_files(uploaded_files)
+            export_month_report()
+            job_panel()
+            debug_panel()
         # 获取后端数据
-        backend_data = get_backend_data()
-        # 将后端数据转换为JavaScript变量
-        data_script = f"window.backendData = {json.dumps(backend_data)};"
-        
-        # 加载并修改HTML内容
-        html_content = load_frontend_html()
-        # 将数据脚本插入到HTML头部
-        html_content = html_content.replace("</head>", f"<script>{data_script}</script></head>")
-        
-        # 添加前后端交互脚本
-        interaction_script = """
-        <script>
-            const rules = window.backendData.attendance_rules;
-            if (rules) {
-                document.querySelector('input[value="09:00"]').value = rules.work_start_time;
-                document.querySelector('input[value="18:00"]').value = rules.work_end_time;
-                document.querySelector('input[value="15"][min="0"][max="60"]').value = rules.late_threshold;
-                document.querySelector('input[value="12:00"]').value = rules.lunch_start_time;
-            }
-            // 填充统计数据
-            if (window.backendData) {
-                // 更新用户信息
-                document.querySelector('.font-medium.text-sm').textContent = window.backendData.current_user;
-                
-                // 更新统计卡片
-                const stats = window.backendData.stats;
-                document.querySelector('.stats-total-employees').textContent = stats.total_employees;
-                document.querySelector('.stats-today-attendance').textContent = stats.today_attendance;
-                document.querySelector('.stats-late-count').textContent = stats.late_count;
-                document.querySelector('.stats-overtime-hours').textContent = stats.overtime_hours + 'h';
-                // 更新最近打卡记录
-                updateRecentRecords(window.backendData.recent_records);
-            }
-            
-            // 更新打卡记录表格
-            function updateRecentRecords(records) {
-                const tableBody = document.querySelector('#recent-records-table tbody');
-                if (!tableBody) return;
-                
-                tableBody.innerHTML = '';
-                records.forEach(record => {
-                    const row = document.createElement('tr');
-                    row.className = 'hover:bg-light-1/50 transition-colors';
-                    row.innerHTML = `
-                        <td class="px-6 py-4">
-                            <div class="flex items-center gap-3">
-                                <img src="${record.avatar}" alt="员工头像" class="w-8 h-8 rounded-full">
-                                <span>${record.name}</span>
-                            </div>
-                        </td>
-                        <td class="px-6 py-4">${record.department}</td>
-                        <td class="px-6 py-4">${record.type}</td>
-                        <td class="px-6 py-4">${record.time}</td>
-                        <td class="px-6 py-4">
-                            <span class="px-2 py-1 ${record.status_class} text-xs rounded-full">${record.status}</span>
-                        </td>
-                        <td class="px-6 py-4">
-                            <button class="text-primary hover:text-primary/80">详情</button>
-                        </td>
-                    `;
-                    tableBody.appendChild(row);
-                });
-            }
-        </script>
-        """
+        with tracing.phase("data_fetch"):
+            backend_data = get_backend_data()
+        live = live_dashboard.DASHBOARD_MODE == "live"
+        if not live:
+            # 把后端数据填入预先拆分好的模板（模板和交互脚本每个进程只读取一次）
+            with tracing.phase("template_load"):
+                try:
+                    html_content = frontend.render_page(backend_data)
+                except FileNotFoundError:
+                    st.error("前端模板文件未找到，请确保frontend/index.html存在")
+                    html_content = "<h1>前端资源加载失败</h1>"
         
-        # 将交互脚本插入到HTML底部
-        html_content = html_content.replace("</body>", f"{interaction_script}</body>")
-        
-        # 自定义Streamlit样式，移除默认边距和限制
-        st.markdown("""
-            <style>
-                * {
-                    margin: 0;
-                    padding: 0;
-                    box-sizing: border-box;
-                }
-                .reportview-container .main .block-container,
-                .reportview-container .main 
-                #app-container ,
-                main.flex-1,
-                .horizontal-container {
-                    max-width: 100% !important;
-                    width: 100% !important;
-                    margin: 0 !important;
-                    padding: 0 !important;
-                }
-                .reportview-container {
-                    padding: 0 !important;
-                    margin: 0 !important;
-                }
-                html, body {
-                    overflow: auto !important;
-                    width: 100% !important;
-                    height: 100% !important;
-                    margin: 0 !important;
-                    padding: 0 !important;
-                }
-                #app-container {
-                    display: flex !important;
-                    height: 100vh !important;
-                    overflow: hidden !important;
-                }
-                #sidebar {
-                    margin: 0 !important;
-                    padding: 0 !important;
-                    flex-shrink: 0 !important;
-                }
-                #app-container main.flex-1 {
-                    margin-left: 0 !important;
-                    padding-left: 0 !important;
-                    overflow-y: auto !important;
-                    flex: 1 1 auto !important;
-                }
-                iframe {
-                    width: 100% !important;
-                    height: 100vh !important;
-                    overflow: hidden !important; 
-                    border: none !important;
-                }
-                #MainMenu, .stDeployButton, footer {
-                    display: none !important;
-                }
-                #page-content {
-                    height: 100% !important;
-                    overflow-y: auto !important;
-                }
-            </style>
-        """, unsafe_allow_html=True)
-        # 渲染完整页面
-        html(html_content, height=0, scrolling=True)
+        with tracing.phase("render"):
+            # 自定义Streamlit样式，移除默认边距和限制
+            st.markdown("""
+                <style>
+                    * {
+                        margin: 0;
+                        padding: 0;
+                        box-sizing: border-box;
+                    }
+                    .reportview-container .main .block-container,
+                    .reportview-container .main 
+                    #app-container ,
+                    main.flex-1,
+                    .horizontal-container {
+                        max-width: 100% !important;
+                        width: 100% !important;
+                        margin: 0 !important;
+                        padding: 0 !important;
+                    }
+                    .reportview-container {
+                        padding: 0 !important;
+                        margin: 0 !important;
+                    }
+                    html, body {
+                        overflow: auto !important;
+                        width: 100% !important;
+                        height: 100% !important;
+                        margin: 0 !important;
+                        padding: 0 !important;
+                    }
+                    #app-container {
+                        display: flex !important;
+                        height: 100vh !important;
+                        overflow: hidden !important;
+                    }
+                    #sidebar {
+                        margin: 0 !important;
+                        padding: 0 !important;
+                        flex-shrink: 0 !important;
+                    }
+                    #app-container main.flex-1 {
+                        margin-left: 0 !important;
+                        padding-left: 0 !important;
+                        overflow-y: auto !important;
+                        flex: 1 1 auto !important;
+                    }
+                    iframe {
+                        width: 100% !important;
+                        height: 100vh !important;
+                        overflow: hidden !important; 
+                        border: none !important;
+                    }
+                    #MainMenu, .stDeployButton, footer {
+                        display: none !important;
+                    }
+                    #page-content {
+                        height: 100% !important;
+                        overflow-y: auto !important;
+                    }
+                </style>
+            """, unsafe_allow_html=True)
+            if live:
+                # 双向组件：页面只加载一次，之后只推送变化的统计和打卡记录
+                live_dashboard.render(backend_data)
+            else:
+                # 渲染完整页面
+                html(html_content, height=0, scrolling=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
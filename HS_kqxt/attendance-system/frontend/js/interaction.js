@@ -0,0 +1,73 @@
+// frontend/js/interaction.js
+// 用后端数据填充考勤规则、统计卡片和最近打卡记录（由 modules/frontend.py 内联到页面底部）
+
+// 填充考勤规则表单
+function updateRules(rules) {
+  if (!rules) return;
+  document.querySelector('input[value="09:00"]').value = rules.work_start_time;
+  document.querySelector('input[value="18:00"]').value = rules.work_end_time;
+  document.querySelector('input[value="15"][min="0"][max="60"]').value = rules.late_threshold;
+  document.querySelector('input[value="12:00"]').value = rules.lunch_start_time;
+}
+
+// 更新统计卡片，只更新传入的字段
+function updateStats(stats) {
+  const cards = {
+    total_employees: '.stats-total-employees',
+    today_attendance: '.stats-today-attendance',
+    late_count: '.stats-late-count',
+    overtime_hours: '.stats-overtime-hours'
+  };
+  Object.keys(cards).forEach(key => {
+    if (!(key in stats)) return;
+    const element = document.querySelector(cards[key]);
+    if (element) element.textContent = key === 'overtime_hours' ? stats[key] + 'h' : stats[key];
+  });
+}
+
+// 一条打卡记录对应的表格行
+function buildRecordRow(record) {
+  const row = document.createElement('tr');
+  row.className = 'hover:bg-light-1/50 transition-colors';
+  if (record.id !== undefined) row.dataset.recordId = record.id;
+  row.innerHTML = `
+    <td class="px-6 py-4">
+      <div class="flex items-center gap-3">
+        <img src="${record.avatar}" alt="员工头像" class="w-8 h-8 rounded-full">
+        <span>${record.name}</span>
+      </div>
+    </td>
+    <td class="px-6 py-4">${record.department}</td>
+    <td class="px-6 py-4">${record.type}</td>
+    <td class="px-6 py-4">${record.time}</td>
+    <td class="px-6 py-4">
+      <span class="px-2 py-1 ${record.status_class} text-xs rounded-full">${record.status}</span>
+    </td>
+    <td class="px-6 py-4">
+      <button class="text-primary hover:text-primary/80">详情</button>
+    </td>
+  `;
+  return row;
+}
+
+// 更新打卡记录表格
+function updateRecentRecords(records) {
+  const tableBody = document.querySelector('#recent-records-table tbody');
+  if (!tableBody) return;
+
+  tableBody.innerHTML = '';
+  records.forEach(record => tableBody.appendChild(buildRecordRow(record)));
+}
+
+// 一次性填充全部后端数据
+function applyBackendData(data) {
+  updateRules(data.attendance_rules);
+  // 更新用户信息
+  document.querySelector('.font-medium.text-sm').textContent = data.current_user;
+  updateStats(data.stats);
+  updateRecentRecords(data.recent_records);
+}
+
+if (window.backendData) {
+  applyBackendData(window.backendData);
+}
@@ -0,0 +1,76 @@
+// frontend/js/live.js
+// 双向组件模式：页面只加载一次，之后按后端推送的增量就地更新统计卡片和最近打卡记录
+// 增量格式见 modules/live_dashboard.py
+(function () {
+  let appliedSeq = 0;
+
+  function send(type, data) {
+    window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, data), '*');
+  }
+
+  // 本地状态与增量的基准不一致（如 iframe 被重新加载）时请求全量数据
+  function requestFull() {
+    send('streamlit:setComponentValue', {
+      value: { need_full: true, request: Date.now() + '-' + Math.random() },
+      dataType: 'json'
+    });
+  }
+
+  // 按记录 id 新增或替换行，再按 record_ids 的顺序排列并删除已不在列表中的行
+  function patchRecords(records, recordIds) {
+    const tableBody = document.querySelector('#recent-records-table tbody');
+    if (!tableBody) return;
+
+    const rows = {};
+    tableBody.querySelectorAll('tr[data-record-id]').forEach(row => {
+      rows[row.dataset.recordId] = row;
+    });
+    records.forEach(record => {
+      const row = buildRecordRow(record);
+      const existing = rows[record.id];
+      if (existing) existing.replaceWith(row);
+      rows[record.id] = row;
+    });
+
+    const keep = new Set(recordIds.map(String));
+    Object.keys(rows).forEach(id => {
+      if (!keep.has(id)) rows[id].remove();
+    });
+    // 已在正确位置的行不移动，避免无谓的重排
+    recordIds.forEach((id, index) => {
+      const row = rows[id];
+      if (row && tableBody.children[index] !== row) {
+        tableBody.insertBefore(row, tableBody.children[index] || null);
+      }
+    });
+  }
+
+  function applyPatch(patch) {
+    if (patch.full) {
+      const tableBody = document.querySelector('#recent-records-table tbody');
+      if (tableBody) tableBody.innerHTML = '';
+    }
+    if ('current_user' in patch) {
+      document.querySelector('.font-medium.text-sm').textContent = patch.current_user;
+    }
+    if ('attendance_rules' in patch) updateRules(patch.attendance_rules);
+    if (patch.stats) updateStats(patch.stats);
+    if (patch.record_ids) patchRecords(patch.records || [], patch.record_ids);
+  }
+
+  window.addEventListener('message', event => {
+    if (!event.data || event.data.type !== 'streamlit:render') return;
+    const patch = event.data.args.patch;
+    // 每次重跑都会收到参数，已应用过的增量直接忽略
+    if (!patch || patch.seq <= appliedSeq) return;
+    if (!patch.full && patch.base_seq !== appliedSeq) {
+      requestFull();
+      return;
+    }
+    applyPatch(patch);
+    appliedSeq = patch.seq;
+  });
+
+  send('streamlit:componentReady', { apiVersion: 1 });
+  send('streamlit:setFrameHeight', { height: window.innerHeight });
+})();
@@ -0,0 +1,312 @@
+import calendar
+import operator
+import os
+import re
+import shutil
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import date
+from modules import db, pagination, summaries
+
+# 归档的明细表及其日期列；汇总表、员工、规则等留在热库（多年的汇总报表不需要读取归档）
+ARCHIVED_TABLES = [
+    ('attendance_records', 'work_date'),
+    ('production_morning_records', 'check_date'),
+    ('logistics_records', 'check_date'),
+]
+# 命令行默认保留在热库中的月数（含本月）
+KEEP_MONTHS = 3
+# 未设置连接上限时 SQLite 默认最多附加 10 个数据库
+DEFAULT_ATTACH_LIMIT = 10
+
+_MONTH = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def archive_dir():
+    """归档目录：数据库文件所在目录下的 archive/（默认 data/archive/）"""
+    return os.path.join(os.path.dirname(db.DB_PATH), 'archive')
+
+
+def partition_file(month):
+    return f"attendance_{month}.db"
+
+
+def month_bounds(month):
+    """'2025-07' -> ('2025-07-01', '2025-07-31')"""
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{month}-01", f"{month}-{calendar.monthrange(year, number)[1]:02d}"
+
+
+def partitions(start_date=None, end_date=None):
+    """与日期范围重叠的已归档月份 [(月份, 文件路径)]，按月份升序；不限日期时返回全部"""
+    conditions, params = [], []
+    if start_date:
+        conditions.append("month >= ?")
+        params.append(str(start_date)[:7])
+    if end_date:
+        conditions.append("month <= ?")
+        params.append(str(end_date)[:7])
+    query = "SELECT month, file_name FROM archive_partitions"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    with db.get_connection() as conn:
+        rows = conn.execute(query + " ORDER BY month", params).fetchall()
+    return [(month, os.path.join(archive_dir(), file_name)) for month, file_name in rows]
+
+
+def ensure_not_archived(start_date, end_date):
+    """日期范围涉及已归档的月份时抛出 ValueError（归档月份的明细只读，不再写入热库）"""
+    found = partitions(start_date, end_date)
+    if found:
+        months = "、".join(month for month, _ in found)
+        raise ValueError(f"{months} 已归档，不能再写入该月的考勤记录")
+
+
+def table_columns(conn, table, schema='main'):
+    """表的列名（按定义顺序），表不存在时返回空列表"""
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def _schema(month):
+    return "archive_" + month.replace('-', '_')
+
+
+def _attach(conn, month, path):
+    """附加一个月的归档文件，返回模式名；文件缺失时报错（ATTACH 会静默创建空库）"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"归档文件不存在: {path}")
+    schema = _schema(month)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    return schema
+
+
+@contextmanager
+def attached(conn, start_date=None, end_date=None):
+    """
+    在连接上附加与日期范围重叠的归档月份，返回模式名列表（归档按月份升序，最后是 'main'），
+    退出时分离。ATTACH 不能在事务中执行，需在 read_transaction() 之前调用
+    """
+    found = partitions(start_date, end_date)
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else DEFAULT_ATTACH_LIMIT
+    if len(found) > limit:
+        raise ValueError(f"查询范围涉及 {len(found)} 个归档月份，超过同时附加的上限 {limit}，请缩小日期范围")
+    schemas = []
+    try:
+        for month, path in found:
+            schemas.append(_attach(conn, month, path))
+        yield schemas + ['main']
+    finally:
+        for schema in schemas:
+            conn.execute(f"DETACH DATABASE {schema}")
+
+
+def union_source(conn, table, date_column, schemas, start_date, end_date):
+    """
+    各模式中同一张表在日期范围内的行合并为一个子查询，返回 (SQL, 参数)
+    按热库表的列名逐列选取，归档文件建立之后热库新增的列在归档分支中为 NULL
+    日期条件写在每个分支内，各分区分别使用自己的日期索引
+    """
+    columns = table_columns(conn, table)
+    branches = []
+    for schema in schemas:
+        present = set(table_columns(conn, table, schema))
+        select = ", ".join(column if column in present else f"NULL AS {column}" for column in columns)
+        branches.append(f"SELECT {select} FROM {schema}.{table} WHERE {date_column} BETWEEN ? AND ?")
+    return "(" + " UNION ALL ".join(branches) + ")", [str(start_date), str(end_date)] * len(schemas)
+
+
+def fetch_page(conn, query, params, limit, key_columns, start_date=None, end_date=None, cursor=None):
+    """
+    跨热库和归档分页：query 中的 {schema} 依次替换为 main 和与日期范围重叠的归档月份（从新到旧），
+    各来源分别多取一行后按排序键（第一个为日期，降序）合并。用法同 pagination.fetch_page
+    已取满且剩下的归档月份都早于已取到的行时不再附加更早的月份；游标之后的月份直接跳过
+    """
+    if cursor:
+        cursor_date = pagination.decode_cursor(cursor, len(key_columns))[0]
+        end_date = min(str(end_date), cursor_date) if end_date else cursor_date
+    sources = [('main', None)] + list(reversed(partitions(start_date, end_date)))
+    sort_key = operator.itemgetter(*key_columns)
+    rows = []
+    for month, path in sources:
+        if path is not None and len(rows) > limit and month_bounds(month)[1] < rows[limit][key_columns[0]]:
+            break
+        schema = 'main' if path is None else _attach(conn, month, path)
+        try:
+            # 每个来源都多取一行，合并后与 pagination.fetch_page 相同地判断是否还有下一页
+            sql_cursor = conn.cursor()
+            sql_cursor.execute(query.format(schema=schema) + " LIMIT ?", list(params) + [limit + 1])
+            columns = [desc[0] for desc in sql_cursor.description]
+            rows.extend(dict(zip(columns, row)) for row in sql_cursor.fetchall())
+        finally:
+            if path is not None:
+                conn.execute(f"DETACH DATABASE {schema}")
+        rows.sort(key=sort_key, reverse=True)
+        del rows[limit + 1:]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, pagination.encode_cursor(rows[-1][column] for column in key_columns)
+
+
+def _sync_columns(conn, table):
+    """
+    已有的归档文件与热库表结构对齐：补上热库后来新增的列，删除热库已删除的列
+    （删除的列可能有 NOT NULL 约束，不删除时按列名复制会失败）
+    """
+    hot_columns = list(conn.execute(f"PRAGMA hot.table_info({table})"))
+    hot_names = {row[1] for row in hot_columns}
+    present = table_columns(conn, table)
+    for _, name, column_type, _, default, _ in hot_columns:
+        if name not in present:
+            conn.execute(f"ALTER TABLE main.{table} ADD COLUMN {name} {column_type}"
+                         + (f" DEFAULT {default}" if default is not None else ""))
+    for name in present:
+        if name not in hot_names:
+            conn.execute(f"ALTER TABLE main.{table} DROP COLUMN {name}")
+
+
+def _copy_month(path, month, existing):
+    """
+    用单独的连接把热库中该月的明细复制到归档文件（新文件先按热库的表结构建表和索引）
+    唯一键相同时热库中的记录覆盖归档中的旧记录（如重新处理过的班次结果），返回 {表名: 复制行数}
+    """
+    first, last = month_bounds(month)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS hot", (db.DB_PATH,))
+        counts = {}
+        with conn:
+            if not existing:
+                for table, _ in ARCHIVED_TABLES:
+                    ddl = conn.execute(
+                        "SELECT sql FROM hot.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                        "AND type IN ('table', 'index') ORDER BY type = 'index'",
+                        (table,)
+                    ).fetchall()
+                    for (sql,) in ddl:
+                        conn.execute(sql)
+            for table, column in ARCHIVED_TABLES:
+                _sync_columns(conn, table)
+                names = ", ".join(table_columns(conn, table, 'hot'))
+                counts[table] = conn.execute(
+                    f"INSERT OR REPLACE INTO main.{table} ({names}) "
+                    f"SELECT {names} FROM hot.{table} WHERE {column} BETWEEN ? AND ?",
+                    (first, last)
+                ).rowcount
+        conn.execute("DETACH DATABASE hot")
+    finally:
+        conn.close()
+    return counts
+
+
+def archive_month(month):
+    """
+    把一个已结束月份的考勤明细和班次处理结果移到归档文件，返回 (是否成功, 提示信息)
+    已归档的月份再次归档时追加后来写入热库的记录
+    归档期间持有热库写锁：先把该月数据复制到临时文件并落盘，替换为正式文件后才从热库删除，
+    中途失败时热库数据不变。归档月份的汇总保留在热库，规则变更不再重算已归档的月份
+    """
+    if not _MONTH.match(str(month)):
+        return False, f"月份格式应为 YYYY-MM: {month}"
+    if month >= date.today().strftime('%Y-%m'):
+        return False, f"{month} 尚未结束，只能归档已结束的月份"
+
+    first, last = month_bounds(month)
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    file_name = partition_file(month)
+    path = os.path.join(directory, file_name)
+    temp_path = path + '.tmp'
+
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        # 先让汇总表包含该月的最终数据，归档后汇总不再随明细变化
+        summaries.refresh_dirty()
+        cursor.execute("SELECT file_name FROM archive_partitions WHERE month = ?", (month,))
+        existing = cursor.fetchone() is not None
+        if existing:
+            shutil.copyfile(path, temp_path)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+        try:
+            counts = _copy_month(temp_path, month, existing)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if not any(counts.values()):
+            os.remove(temp_path)
+            return False, f"{month} 没有需要归档的记录"
+        os.replace(temp_path, path)
+
+        for table, column in ARCHIVED_TABLES:
+            cursor.execute(f"DELETE FROM {table} WHERE {column} BETWEEN ? AND ?", (first, last))
+        # 删除触发器标记的待刷新日期，否则下次刷新会清掉该月的汇总
+        cursor.execute("DELETE FROM summary_dirty_days WHERE work_date BETWEEN ? AND ?", (first, last))
+        cursor.execute('''
+        INSERT INTO archive_partitions (month, file_name, attendance_rows, morning_rows, logistics_rows)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(month) DO UPDATE SET
+            attendance_rows = attendance_rows + excluded.attendance_rows,
+            morning_rows = morning_rows + excluded.morning_rows,
+            logistics_rows = logistics_rows + excluded.logistics_rows,
+            archived_at = CURRENT_TIMESTAMP
+        ''', (month, file_name, counts['attendance_records'], counts['production_morning_records'],
+              counts['logistics_records']))
+    return True, (f"已归档 {month}：考勤记录 {counts['attendance_records']} 条，"
+                  f"早班 {counts['production_morning_records']} 条，后勤 {counts['logistics_records']} 条")
+
+
+def archivable_months(keep_months=KEEP_MONTHS, today=None):
+    """热库中早于最近 keep_months 个月（含本月）的有数据的月份，按月份升序"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - (max(keep_months, 1) - 1)
+    cutoff = f"{index // 12:04d}-{index % 12 + 1:02d}"
+    with db.get_connection() as conn:
+        earliest = [conn.execute(f"SELECT MIN({column}) FROM {table}").fetchone()[0]
+                    for table, column in ARCHIVED_TABLES]
+    earliest = [value[:7] for value in earliest if value]
+    if not earliest:
+        return []
+    months = []
+    year, number = int(min(earliest)[:4]), int(min(earliest)[5:7])
+    while f"{year:04d}-{number:02d}" < cutoff:
+        months.append(f"{year:04d}-{number:02d}")
+        year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return months
+
+
+def archive_closed_months(keep_months=KEEP_MONTHS):
+    """归档热库中早于最近 keep_months 个月的全部月份，返回 [(月份, 是否成功, 提示信息)]"""
+    return [(month,) + archive_month(month) for month in archivable_months(keep_months)]
+
+
+def vacuum():
+    """归档删除大量记录后整理热库文件，释放磁盘空间"""
+    with db.get_connection() as conn:
+        conn.execute("VACUUM")
+
+
+if __name__ == '__main__':
+    # 命令行：python -m modules.archive [YYYY-MM ...] [--keep-months N] [--vacuum]
+    from modules import migrations
+    migrations.ensure_schema()
+    args = sys.argv[1:]
+    keep = KEEP_MONTHS
+    if '--keep-months' in args:
+        position = args.index('--keep-months')
+        keep = int(args[position + 1])
+        del args[position:position + 2]
+    run_vacuum = '--vacuum' in args
+    months = [arg for arg in args if arg != '--vacuum']
+    results = [(month,) + archive_month(month) for month in months] if months else archive_closed_months(keep)
+    for _, _, message in results:
+        print(message)
+    if not results:
+        print("没有需要归档的月份")
+    if run_vacuum:
+        vacuum()
+        print("已整理热库文件")
+    sys.exit(0 if all(success for _, success, _ in results) else 1)
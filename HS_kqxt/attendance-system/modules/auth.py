@@ -1,41 +1,6 @@
-import sqlite3
-import os
 from hashlib import sha256
 import streamlit as st
-
-# 数据库文件路径
-DB_PATH = os.path.join("data", "attendance.db")
-
-def init_users_table():
-    """初始化用户表，创建管理员默认账户"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 创建用户表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        role TEXT NOT NULL DEFAULT 'user',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_login TIMESTAMP
-    )
-    ''')
-    
-    # 检查是否存在管理员账户，不存在则创建
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        # 默认密码是 'admin123'，已加密
-        admin_password = sha256('admin123'.encode()).hexdigest()
-        cursor.execute(
-            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-            ('admin', admin_password, 'admin')
-        )
-        print("已创建默认管理员账户: 用户名 admin, 密码 admin123")
-    
-    conn.commit()
-    conn.close()
+from modules import db
 
 def hash_password(password):
     """对密码进行SHA256加密"""
@@ -45,25 +10,22 @@ def verify_credentials(username, password):
     """验证用户名和密码是否正确"""
     hashed_pw = hash_password(password)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "SELECT id, username, role FROM users WHERE username = ? AND password = ?",
-        (username, hashed_pw)
-    )
-    
-    user = cursor.fetchone()
-    
-    # 如果验证成功，更新最后登录时间
-    if user:
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute(
-            "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?",
-            (user[0],)
+            "SELECT id, username, role FROM users WHERE username = ? AND password = ?",
+            (username, hashed_pw)
         )
-        conn.commit()
-    
-    conn.close()
+        
+        user = cursor.fetchone()
+        
+        # 如果验证成功，更新最后登录时间
+        if user:
+            cursor.execute(
+                "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?",
+                (user[0],)
+            )
     
     return user
 
@@ -162,15 +124,10 @@ def change_password(username, old_password, new_password):
     # 加密新密码并更新
     hashed_new_pw = hash_password(new_password)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "UPDATE users SET password = ? WHERE username = ?",
-        (hashed_new_pw, username)
-    )
-    
-    conn.commit()
-    conn.close()
+    with db.get_connection() as conn:
+        conn.execute(
+            "UPDATE users SET password = ? WHERE username = ?",
+            (hashed_new_pw, username)
+        )
     
     return True, "密码修改成功"
\ No newline at end of file
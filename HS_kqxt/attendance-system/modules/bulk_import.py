@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from modules import dashboard, db, import_excel, rules, shift_engine
+
+# 写入进程每个事务提交的记录数（多个文件的结果合并提交）
+BULK_BATCH_SIZE = 50000
+
+# 工作进程内的考勤规则版本和班次表，由 _init_worker 设置，工作进程不访问数据库
+_worker_rule_versions = None
+_worker_engine = None
+
+
+def _init_worker(rule_versions, engine):
+    global _worker_rule_versions, _worker_engine
+    _worker_rule_versions = rule_versions
+    _worker_engine = engine
+
+
+def _parse_file(task):
+    """
+    工作进程：解析一个月报文件并按部门班次处理打卡
+    返回 {'file', 'employees', 'records', 'morning', 'logistics', 'error'}
+    """
+    path, file_name = task
+    result = {'file': file_name, 'employees': [], 'records': [],
+              'morning': [], 'logistics': [], 'error': None}
+    # 任何异常（损坏的文件、openpyxl 解析错误、班次处理出错）只记为该文件失败，不中断其他文件
+    try:
+        for employees, records in import_excel.iter_record_batches(path, file_name, _worker_rule_versions):
+            result['employees'].extend(employees)
+            result['records'].extend(records)
+
+        department_of = {employee['employee_id']: employee['department'] for employee in result['employees']}
+        departments = {}
+        for record in result['records']:
+            department = department_of[record[0]]
+            if department in _worker_engine:
+                columns = departments.setdefault(department, ([], [], []))
+                columns[0].append(record[0])
+                columns[1].append(record[3])
+                columns[2].append(record[9])
+
+        for department, (employee_ids, check_dates, punch_blobs) in departments.items():
+            shift = _worker_engine[department]
+            shift_results = shift_engine.run_shift(shift, employee_ids, check_dates, punch_blobs)
+            result['logistics' if shift.kind == 'attendance' else 'morning'].extend(shift_results)
+    except Exception as e:
+        return {'file': file_name, 'employees': [], 'records': [], 'morning': [], 'logistics': [],
+                'error': str(e) or type(e).__name__}
+    return result
+
+
+class _Writer:
+    """单一写入方：累计各工作进程的结果，满 BULK_BATCH_SIZE 条记录提交一次"""
+
+    def __init__(self, batch_size=BULK_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.employee_ids = set()
+        self.record_count = 0
+        self._clear()
+
+    def _clear(self):
+        self.employees = []
+        # 按 (员工, 日期) 去重，同一批内后面文件的结果覆盖前面的
+        # （班次结果同一批内有重复键时，UPSERT 会让汇总触发器的 INSERT OR IGNORE 失效）
+        self.records, self.morning, self.logistics = {}, {}, {}
+
+    def add(self, result):
+        self.employees.extend(result['employees'])
+        self.records.update(((record[0], record[3]), record) for record in result['records'])
+        for key in ('morning', 'logistics'):
+            getattr(self, key).update(
+                ((item['employee_id'], item['check_date']), item) for item in result[key]
+            )
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.records and not self.employees:
+            return
+        # 记录和班次结果在同一个事务内写入
+        with db.get_connection():
+            import_excel.write_records(self.employees, list(self.records.values()))
+            if self.morning:
+                rules.save_morning_shift_results(list(self.morning.values()))
+            if self.logistics:
+                rules.save_logistics_results(list(self.logistics.values()))
+        self.employee_ids.update(e['employee_id'] for e in self.employees)
+        self.record_count += len(self.records)
+        self._clear()
+
+
+def bulk_import(files, workers=None, progress=None):
+    """
+    多进程批量导入月报文件
+    files: 文件路径列表，或 (文件路径, 原始文件名) 列表（文件名用于识别统计周期）
+    workers: 进程数，默认 CPU 核数
+    progress: 可选回调 progress(已完成文件数, 文件总数, 文件名)
+    返回 (是否全部成功, 提示信息)
+    """
+    tasks = [task if isinstance(task, tuple) else (task, os.path.basename(task)) for task in files]
+    if not tasks:
+        return False, "没有需要导入的文件"
+    rule_versions = rules.get_rule_versions()
+    if not rule_versions:
+        return False, "未找到考勤规则，请先设置考勤规则"
+    engine = shift_engine.get_engine()
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    writer = _Writer()
+    failed = []
+    # spawn 启动的工作进程不继承父进程的数据库连接和线程
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(rule_versions, engine)) as executor:
+            # map 按提交顺序返回，同一员工同一天出现在多个文件时以后面的文件为准
+            for done, result in enumerate(executor.map(_parse_file, tasks), 1):
+                if result['error']:
+                    failed.append(f"{result['file']}: {result['error']}")
+                else:
+                    writer.add(result)
+                if progress:
+                    progress(done, len(tasks), result['file'])
+        writer.flush()
+    except ValueError as e:
+        # 写入已归档的月份等，已提交的批次保留
+        return False, f"导入失败: {e}"
+    finally:
+        if writer.record_count:
+            dashboard.invalidate_cache()
+
+    msg = (f"导入完成：{len(tasks) - len(failed)}个文件，"
+           f"{len(writer.employee_ids)}名员工，{writer.record_count}条打卡记录")
+    if failed:
+        return False, msg + "；以下文件导入失败：" + "；".join(failed)
+    return True, msg
+
+
+if __name__ == '__main__':
+    # 命令行：python -m modules.bulk_import [--workers N] 文件1.xlsx 文件2.xlsx ...
+    from modules import migrations
+    args = sys.argv[1:]
+    workers = None
+    if len(args) >= 2 and args[0] == '--workers':
+        workers = int(args[1])
+        args = args[2:]
+    if not args:
+        print("用法: python -m modules.bulk_import [--workers N] 文件1.xlsx [文件2.xlsx ...]")
+        sys.exit(1)
+    migrations.ensure_schema()
+    success, msg = bulk_import(
+        args, workers,
+        progress=lambda done, total, name: print(f"[{done}/{total}] {name}")
+    )
+    print(msg)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,105 @@
+import threading
+import time as _time
+from datetime import datetime
+from modules import db, reports, rules
+
+# 仪表盘快照缓存时间(秒)，所有会话共用同一份快照
+DASHBOARD_CACHE_TTL = 15
+
+_cache_lock = threading.Lock()
+_cache = {
+    'key': None,      # 快照对应的日期，跨天自动失效
+    'expires': 0.0,
+    'data': None,
+    'generation': 0,  # 每次失效递增，防止失效前发起的查询把旧数据写回缓存
+}
+
+# 一次聚合查询算出仪表盘的全部统计数据，只按 work_date 索引读取今日记录
+DASHBOARD_STATS_SQL = """
+    WITH rule AS (
+        SELECT CAST(strftime('%s', :today || ' ' || work_start_time) AS INTEGER)
+               + late_threshold * 60 AS late_cutoff
+        FROM attendance_rule_versions
+        WHERE department IS NULL AND effective_from <= :today
+        ORDER BY effective_from DESC, id DESC LIMIT 1
+    ),
+    today_records AS (
+        SELECT employee_id, check_in_ts, check_out_ts, overtime_hours
+        FROM attendance_records
+        WHERE work_date = :today
+    )
+    SELECT
+        (SELECT COUNT(*) FROM employees) AS total_employees,
+        COUNT(DISTINCT CASE WHEN t.check_in_ts IS NOT NULL
+                            THEN t.employee_id END) AS today_attendance,
+        COUNT(DISTINCT CASE WHEN t.check_in_ts > COALESCE(
+                                 r.late_cutoff,
+                                 CAST(strftime('%s', :today || ' 09:00') AS INTEGER) + 15 * 60)
+                            THEN t.employee_id END) AS late_count,
+        COALESCE(SUM(CASE WHEN t.check_out_ts IS NOT NULL
+                          THEN t.overtime_hours END), 0) AS overtime_hours
+    FROM today_records t
+    LEFT JOIN rule r ON 1 = 1
+"""
+
+
+def _query_snapshot(today):
+    """在一个读事务内读取统计数据、考勤规则和最近打卡记录"""
+    with db.read_transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(DASHBOARD_STATS_SQL, {'today': today})
+        total_employees, today_attendance, late_count, overtime_hours = cursor.fetchone()
+
+        cursor.execute(f"""
+            SELECT {rules.RULE_VERSION_COLUMNS} FROM attendance_rule_versions
+            WHERE department IS NULL AND effective_from <= ?
+            ORDER BY effective_from DESC, id DESC LIMIT 1
+        """, (today,))
+        rule = cursor.fetchone()
+        attendance_rules = dict(zip([desc[0] for desc in cursor.description], rule)) if rule else None
+
+        recent_records = reports.get_recent_records()
+
+    return {
+        'stats': {
+            'total_employees': total_employees,
+            'today_attendance': today_attendance,
+            'late_count': late_count,
+            'overtime_hours': round(overtime_hours, 2)
+        },
+        'attendance_rules': attendance_rules,
+        'recent_records': recent_records
+    }
+
+
+def dashboard_snapshot():
+    """
+    获取仪表盘快照（统计数据、考勤规则、最近打卡记录）
+    结果在进程内缓存 DASHBOARD_CACHE_TTL 秒，导入记录或修改规则时调用 invalidate_cache()
+    返回的字典为各会话共享，调用方不要修改
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    now = _time.monotonic()
+    with _cache_lock:
+        if _cache['key'] == today and _cache['expires'] > now:
+            return _cache['data']
+        generation = _cache['generation']
+
+    data = _query_snapshot(today)
+
+    with _cache_lock:
+        if _cache['generation'] != generation:
+            return data
+        _cache['key'] = today
+        _cache['expires'] = now + DASHBOARD_CACHE_TTL
+        _cache['data'] = data
+    return data
+
+
+def invalidate_cache():
+    """使仪表盘快照缓存失效"""
+    with _cache_lock:
+        _cache['key'] = None
+        _cache['expires'] = 0.0
+        _cache['data'] = None
+        _cache['generation'] += 1
@@ -0,0 +1,133 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from modules import tracing
+
+# 数据库文件路径（所有模块共用）
+DB_PATH = os.path.join("data", "attendance.db")
+
+# 连接池参数
+POOL_SIZE = 8                  # 池中保留的空闲连接数上限
+BUSY_TIMEOUT_MS = 5000         # 写锁等待时间(毫秒)，避免并发导入时报 "database is locked"
+STATEMENT_CACHE_SIZE = 256     # 每个连接缓存的预编译语句数量
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_pool_lock = threading.Lock()
+_pool_generation = 0           # 切换数据库文件后递增，旧连接归还时直接关闭
+_local = threading.local()
+
+
+def _create_connection():
+    """创建一个新连接并设置 WAL、同步级别和忙等待"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        check_same_thread=False,  # 连接由池独占借出，可跨线程复用
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def _acquire():
+    """从池中取出一个连接，池为空时新建"""
+    with _pool_lock:
+        generation = _pool_generation
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _create_connection()
+    return conn, generation
+
+
+def _release(conn, generation):
+    """归还连接，池已满或数据库已切换时关闭"""
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        stale = generation != _pool_generation
+    if stale:
+        conn.close()
+        return
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+@contextmanager
+def get_connection():
+    """
+    获取当前线程的数据库连接
+    同一线程内嵌套调用复用同一个连接；最外层正常退出时提交，异常时回滚，
+    随后连接归还连接池而不是关闭
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.depth += 1
+        try:
+            yield conn
+        finally:
+            _local.depth -= 1
+        return
+
+    raw_conn, generation = _acquire()
+    # 开启追踪时借出的是记录耗时的包装连接（modules.tracing）
+    conn = tracing.attach(raw_conn)
+    _local.conn = conn
+    _local.depth = 1
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.conn = None
+        _local.depth = 0
+        if conn is not raw_conn:
+            tracing.detach(raw_conn)
+        _release(raw_conn, generation)
+
+
+@contextmanager
+def read_transaction():
+    """在同一个读事务内执行多条查询，保证读到的是同一份数据快照"""
+    with get_connection() as conn:
+        started = not conn.in_transaction
+        if started:
+            conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            if started and conn.in_transaction:
+                conn.commit()
+
+
+def pool_generation():
+    """当前数据库文件的代数，set_db_path 后变化，供进程内缓存判断是否失效"""
+    with _pool_lock:
+        return _pool_generation
+
+
+def set_db_path(path):
+    """切换数据库文件（测试、命令行工具使用），并清空连接池"""
+    global DB_PATH, _pool_generation
+    with _pool_lock:
+        DB_PATH = path
+        _pool_generation += 1
+    close_all()
+
+
+def close_all():
+    """关闭池中所有空闲连接"""
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
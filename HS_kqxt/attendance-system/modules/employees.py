@@ -1,221 +1,265 @@
-import sqlite3
-import os
 from datetime import datetime
 import streamlit as st
+from modules import db, pagination
 
-# 数据库文件路径（与auth.py保持一致）
-DB_PATH = os.path.join("data", "attendance.db")
-
-def init_employees_table():
-    """初始化员工表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 创建员工表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS employees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id TEXT UNIQUE NOT NULL, 
-        name TEXT NOT NULL,
-        department TEXT NOT NULL,
-        position TEXT NOT NULL,
-        hire_date DATE NOT NULL,
-        status TEXT NOT NULL DEFAULT 'active',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        avatar TEXT DEFAULT 'https://picsum.photos/id/237/40/40'
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("员工表初始化完成")
+# 按相关度搜索时默认返回的条数
+SEARCH_LIMIT = 20
 
 def get_total_count():
     """获取员工总数"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM employees")
-    count = cursor.fetchone()[0]
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT COUNT(*) FROM employees")
+        count = cursor.fetchone()[0]
     
-    conn.close()
     return count
 
 def get_all_employees():
     """获取所有员工列表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, employee_id, name, department, position, hire_date, status 
+            FROM employees 
+            ORDER BY created_at DESC
+        """)
+        employees = cursor.fetchall()
+        
+        # 转换为字典列表
+        columns = [desc[0] for desc in cursor.description]
+        result = [dict(zip(columns, row)) for row in employees]
     
-    cursor.execute("""
+    return result
+
+def get_employees_page(department=None, status=None, cursor=None, limit=pagination.DEFAULT_PAGE_SIZE):
+    """
+    分页获取员工列表（按 ID 倒序，即最新添加的在前）
+    cursor: 上一页返回的游标，第一页传 None
+    返回 (员工字典列表, 下一页游标)，没有下一页时游标为 None
+    """
+    limit = pagination.page_size(limit)
+    conditions, params = [], []
+    if department:
+        conditions.append("department = ?")
+        params.append(department)
+    if status:
+        conditions.append("status = ?")
+        params.append(status)
+    keyset, keyset_params = pagination.keyset_condition(['id'], cursor)
+    if keyset:
+        conditions.append(keyset)
+        params.extend(keyset_params)
+    
+    query = """
         SELECT id, employee_id, name, department, position, hire_date, status 
         FROM employees 
-        ORDER BY created_at DESC
-    """)
-    employees = cursor.fetchall()
-    
-    # 转换为字典列表
-    columns = [desc[0] for desc in cursor.description]
-    result = [dict(zip(columns, row)) for row in employees]
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY id DESC"
     
-    conn.close()
-    return result
+    with db.get_connection() as conn:
+        return pagination.fetch_page(conn.cursor(), query, params, limit, ['id'])
 
 def get_employee_by_id(employee_id):
     """通过员工编号获取员工信息"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, employee_id, name, department, position, hire_date, status, avatar 
-        FROM employees 
-        WHERE employee_id = ?
-    """, (employee_id,))
-    
-    employee = cursor.fetchone()
-    if not employee:
-        conn.close()
-        return None
-    
-    # 转换为字典
-    columns = [desc[0] for desc in cursor.description]
-    result = dict(zip(columns, employee))
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, employee_id, name, department, position, hire_date, status, avatar 
+            FROM employees 
+            WHERE employee_id = ?
+        """, (employee_id,))
+        
+        employee = cursor.fetchone()
+        if not employee:
+            return None
+        
+        # 转换为字典
+        columns = [desc[0] for desc in cursor.description]
+        result = dict(zip(columns, employee))
     
-    conn.close()
     return result
 
 def add_employee(employee_data):
     """添加新员工"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 检查员工编号是否已存在
-        cursor.execute("SELECT id FROM employees WHERE employee_id = ?", 
-                      (employee_data['employee_id'],))
-        if cursor.fetchone():
-            conn.close()
-            return False, "员工编号已存在"
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 检查员工编号是否已存在
+            cursor.execute("SELECT id FROM employees WHERE employee_id = ?", 
+                          (employee_data['employee_id'],))
+            if cursor.fetchone():
+                return False, "员工编号已存在"
+            
+            # 插入新员工
+            cursor.execute("""
+                INSERT INTO employees 
+                (employee_id, name, department, position, hire_date, status, avatar)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                employee_data['employee_id'],
+                employee_data['name'],
+                employee_data['department'],
+                employee_data['position'],
+                employee_data['hire_date'],
+                employee_data.get('status', 'active'),
+                employee_data.get('avatar', 'https://picsum.photos/id/237/40/40')
+            ))
         
-        # 插入新员工
-        cursor.execute("""
-            INSERT INTO employees 
-            (employee_id, name, department, position, hire_date, status, avatar)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            employee_data['employee_id'],
-            employee_data['name'],
-            employee_data['department'],
-            employee_data['position'],
-            employee_data['hire_date'],
-            employee_data.get('status', 'active'),
-            employee_data.get('avatar', 'https://picsum.photos/id/237/40/40')
-        ))
-        
-        conn.commit()
-        conn.close()
         return True, "员工添加成功"
     
     except Exception as e:
-        conn.rollback()
-        conn.close()
         return False, f"添加失败: {str(e)}"
 
 def update_employee(employee_id, update_data):
     """更新员工信息"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 检查员工是否存在
-        cursor.execute("SELECT id FROM employees WHERE employee_id = ?", (employee_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return False, "员工不存在"
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 检查员工是否存在
+            cursor.execute("SELECT id FROM employees WHERE employee_id = ?", (employee_id,))
+            if not cursor.fetchone():
+                return False, "员工不存在"
+            
+            # 构建更新语句
+            update_fields = []
+            values = []
+            
+            for key, value in update_data.items():
+                if key in ['name', 'department', 'position', 'hire_date', 'status', 'avatar']:
+                    update_fields.append(f"{key} = ?")
+                    values.append(value)
+            
+            if not update_fields:
+                return True, "没有需要更新的字段"
+            
+            values.append(employee_id)
+            query = f"UPDATE employees SET {', '.join(update_fields)} WHERE employee_id = ?"
+            
+            cursor.execute(query, tuple(values))
         
-        # 构建更新语句
-        update_fields = []
-        values = []
-        
-        for key, value in update_data.items():
-            if key in ['name', 'department', 'position', 'hire_date', 'status', 'avatar']:
-                update_fields.append(f"{key} = ?")
-                values.append(value)
-        
-        if not update_fields:
-            conn.close()
-            return True, "没有需要更新的字段"
-        
-        values.append(employee_id)
-        query = f"UPDATE employees SET {', '.join(update_fields)} WHERE employee_id = ?"
-        
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        conn.close()
         return True, "员工信息更新成功"
     
     except Exception as e:
-        conn.rollback()
-        conn.close()
         return False, f"更新失败: {str(e)}"
 
 def delete_employee(employee_id):
     """删除员工"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # 检查员工是否存在
+            cursor.execute("SELECT id FROM employees WHERE employee_id = ?", (employee_id,))
+            if not cursor.fetchone():
+                return False, "员工不存在"
+            
+            cursor.execute("DELETE FROM employees WHERE employee_id = ?", (employee_id,))
         
-        # 检查员工是否存在
-        cursor.execute("SELECT id FROM employees WHERE employee_id = ?", (employee_id,))
-        if not cursor.fetchone():
-            conn.close()
-            return False, "员工不存在"
-        
-        cursor.execute("DELETE FROM employees WHERE employee_id = ?", (employee_id,))
-        conn.commit()
-        conn.close()
         return True, "员工删除成功"
     
     except Exception as e:
-        conn.rollback()
-        conn.close()
         return False, f"删除失败: {str(e)}"
 
 def get_employees_by_department(department):
     """按部门获取员工"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT employee_id, name, position 
-        FROM employees 
-        WHERE department = ? AND status = 'active'
-        ORDER BY name
-    """, (department,))
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT employee_id, name, position 
+            FROM employees 
+            WHERE department = ? AND status = 'active'
+            ORDER BY name
+        """, (department,))
+        
+        employees = cursor.fetchall()
     
-    employees = cursor.fetchall()
-    conn.close()
     return employees
 
-def search_employees(keyword):
-    """搜索员工（支持员工编号、姓名、部门搜索）"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    query = """
-        SELECT id, employee_id, name, department, position, hire_date, status 
-        FROM employees 
-        WHERE 
-            employee_id LIKE ? OR 
-            name LIKE ? OR 
-            department LIKE ?
-        ORDER BY created_at DESC
+def _fts_query(keyword):
+    """
+    把搜索词转换为 FTS5 查询：按空白拆分，每段作为短语（trigram 下即子串）同时匹配
+    trigram 至少需要 3 个字符，有更短的片段时返回 None，由调用方改用 LIKE
+    """
+    terms = keyword.split()
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def search_employees_ranked(keyword, limit=SEARCH_LIMIT):
     """
-    search_term = f"%{keyword}%"
-    cursor.execute(query, (search_term, search_term, search_term))
+    按相关度搜索员工（员工编号、姓名、部门），最多返回 limit 条
+    员工编号和姓名的匹配权重高于部门
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return []
     
-    employees = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    result = [dict(zip(columns, row)) for row in employees]
+    fts_query = _fts_query(keyword)
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        if fts_query:
+            cursor.execute("""
+                SELECT e.id, e.employee_id, e.name, e.department, e.position, e.hire_date, e.status
+                FROM employees_fts
+                JOIN employees e ON e.id = employees_fts.rowid
+                WHERE employees_fts MATCH ?
+                ORDER BY bm25(employees_fts, 10.0, 5.0, 1.0), e.id DESC
+                LIMIT ?
+            """, (fts_query, limit))
+        else:
+            # 一两个字的姓名无法使用 trigram 索引，按原方式匹配但限制条数
+            search_term = f"%{keyword}%"
+            cursor.execute("""
+                SELECT id, employee_id, name, department, position, hire_date, status
+                FROM employees
+                WHERE employee_id LIKE ? OR name LIKE ? OR department LIKE ?
+                ORDER BY (name = ?) DESC, created_at DESC
+                LIMIT ?
+            """, (search_term, search_term, search_term, keyword, limit))
+        
+        employees = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        result = [dict(zip(columns, row)) for row in employees]
     
-    conn.close()
-    return result
\ No newline at end of file
+    return result
+
+def search_employees(keyword):
+    """搜索员工（支持员工编号、姓名、部门搜索）"""
+    fts_query = _fts_query((keyword or '').strip())
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        if fts_query:
+            # 三个字符以上走全文索引
+            cursor.execute("""
+                SELECT id, employee_id, name, department, position, hire_date, status 
+                FROM employees 
+                WHERE id IN (SELECT rowid FROM employees_fts WHERE employees_fts MATCH ?)
+                ORDER BY created_at DESC
+            """, (fts_query,))
+        else:
+            query = """
+                SELECT id, employee_id, name, department, position, hire_date, status 
+                FROM employees 
+                WHERE 
+                    employee_id LIKE ? OR 
+                    name LIKE ? OR 
+                    department LIKE ?
+                ORDER BY created_at DESC
+            """
+            search_term = f"%{keyword}%"
+            cursor.execute(query, (search_term, search_term, search_term))
+        
+        employees = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        result = [dict(zip(columns, row)) for row in employees]
+    
+    return result
@@ -0,0 +1,284 @@
+import csv
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from modules import archive, db, import_excel, punches as punch_codec, rules
+
+# 与钉钉“上下班打卡_月报”一致的表头
+MONTHLY_SHEET = import_excel.MONTHLY_SHEET
+FIXED_COLUMNS = ['姓名', '账号', '所属规则']
+SUMMARY_COLUMNS = [
+    '部门', '应出勤天数(天)', '实际出勤天数(天)', '休息天数(天)', '正常天数(天)', '异常天数(天)',
+    '标准工作时长(小时)', '实际工作时长(小时)', '异常合计(次)', '迟到次数(次)', '迟到时长(分钟)',
+    '早退次数(次)', '早退时长(分钟)', '旷工次数(次)', '旷工时长(分钟)', '缺卡次数(次)',
+    '地点异常(次)', '设备异常(次)', '补卡次数(次)', '审批打卡次数(次)', '外勤次数(次)',
+    '加班时长(小时)', '工作日加班时长(小时)',
+]
+# 分组表头：(名称, 起始列, 结束列)，列号从 1 开始，“打卡明细”的结束列按天数计算
+SUMMARY_GROUPS = [('基础信息', 4, 4), ('考勤概况', 5, 11), ('异常统计', 12, 21),
+                  ('假勤统计', 22, 24), ('加班统计', 25, 26)]
+WEEKDAYS = '一二三四五六日'
+EMPTY = '--'
+# 每导出多少名员工报告一次进度
+PROGRESS_EMPLOYEES = 100
+# 某天没有适用的考勤规则时计算迟到/早退分钟数使用的上下班时间(秒)和标准工时
+DEFAULT_WORK_START = 9 * 3600
+DEFAULT_WORK_END = 18 * 3600
+DEFAULT_STANDARD_HOURS = 8.0
+
+# 按员工、日期顺序读取，游标逐行消费，内存占用与导出人数无关
+# {records} 为考勤记录来源：只涉及热库时是 attendance_records，涉及已归档月份时是各分区的 UNION ALL
+EXPORT_QUERY = """
+    SELECT e.employee_id, e.name, e.department,
+           ar.work_date, ar.status, ar.punches, ar.check_in_time, ar.check_out_time,
+           ar.check_in_ts, ar.check_out_ts, ar.work_hours, ar.overtime_hours
+    FROM employees e
+    LEFT JOIN {records} ar
+           ON ar.employee_id = e.employee_id AND ar.work_date BETWEEN ? AND ?
+    {where}
+    ORDER BY e.employee_id, ar.work_date, ar.id
+"""
+
+
+def export_file_name(start_date, end_date, extension='xlsx'):
+    """与源文件相同的命名，导出的文件可以直接重新导入"""
+    return f"{MONTHLY_SHEET}_{start_date:%Y%m%d}-{end_date:%Y%m%d}.{extension}"
+
+
+def _day_header(day):
+    return f"{day.day}\n星期{WEEKDAYS[day.weekday()]}"
+
+
+def header_rows(start_date, end_date):
+    """月报的四行表头：标题、统计时间、分组表头、明细表头"""
+    days = (end_date - start_date).days + 1
+    width = len(FIXED_COLUMNS) + len(SUMMARY_COLUMNS) + days
+    title = [MONTHLY_SHEET] + [None] * (width - 1)
+    period = [
+        f"统计时间:{start_date:%m-%d} ～ {end_date:%m-%d}     "
+        f"制表时间:{datetime.now():%Y-%m-%d %H:%M}(UTC+8)"
+    ] + [None] * (width - 1)
+    groups = FIXED_COLUMNS + [None] * (width - len(FIXED_COLUMNS))
+    for name, first, _ in SUMMARY_GROUPS + [('打卡明细', width - days + 1, width)]:
+        groups[first - 1] = name
+    detail = [None] * len(FIXED_COLUMNS) + SUMMARY_COLUMNS + [
+        _day_header(start_date + timedelta(days=n)) for n in range(days)
+    ]
+    return [title, period, groups, detail]
+
+
+def _punch_text(punch_blob, check_in_time, check_out_time):
+    """打卡时间转换为月报格式 '07:59; 12:01; 次日00:30'"""
+    if punch_blob:
+        return punch_codec.to_text(punch_blob, '; ')
+    parts = [value.split(' ')[1][:5] for value in (check_in_time, check_out_time) if value]
+    return '; '.join(parts)
+
+
+def _cell(value):
+    """月报中 0 显示为 '--'"""
+    return value if value else EMPTY
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60
+
+
+def _day_rules(day_list, department, resolve):
+    """
+    统计周期内每天对该部门生效的规则：{日期: (上班秒数, 下班秒数, 标准工时, 是否工作日)}
+    过去的日期使用当时的规则版本；没有适用规则的日期不算工作日
+    """
+    result = {}
+    for day in day_list:
+        rule_set = resolve(day, department)
+        if rule_set is None:
+            result[day] = (DEFAULT_WORK_START, DEFAULT_WORK_END, DEFAULT_STANDARD_HOURS, False)
+        else:
+            result[day] = (_seconds(rule_set.work_start), _seconds(rule_set.work_end),
+                           rule_set.daily_standard_hours,
+                           date.fromisoformat(day).isoweekday() in rule_set.work_days)
+    return result
+
+
+class _EmployeeMonth:
+    """逐条累计一名员工在统计周期内的记录，生成月报的一行；day_rules 见 _day_rules"""
+
+    def __init__(self, employee_id, name, department, day_rules):
+        self.employee_id = employee_id
+        self.name = name
+        self.department = department
+        self.day_rules = day_rules
+        self.days = {}
+        self.normal_days = 0
+        self.late_count = self.late_minutes = 0
+        self.early_count = self.early_minutes = 0
+        self.missing_count = 0
+        self.work_hours = self.overtime_hours = self.workday_overtime = 0.0
+
+    def add(self, work_date, status, punches, check_in_ts, check_out_ts, work_hours, overtime_hours):
+        work_start, work_end, _, is_work_day = self.day_rules[work_date]
+        status = status or '正常'
+        previous = self.days.get(work_date)
+        self.days[work_date] = f"{previous}; {punches}" if previous else f"{status}- {punches}"
+        if previous:
+            return self._add_hours(work_hours, overtime_hours, is_work_day)
+
+        if status == '正常':
+            self.normal_days += 1
+        elif status == '迟到' and check_in_ts is not None:
+            self.late_count += 1
+            self.late_minutes += max(0, (check_in_ts % 86400 - work_start) // 60)
+        elif status == '早退' and check_out_ts is not None:
+            self.early_count += 1
+            self.early_minutes += max(0, (work_end - check_out_ts % 86400) // 60)
+        elif status == '缺卡':
+            self.missing_count += 1
+        self._add_hours(work_hours, overtime_hours, is_work_day)
+
+    def _add_hours(self, work_hours, overtime_hours, is_work_day):
+        self.work_hours += work_hours or 0
+        self.overtime_hours += overtime_hours or 0
+        if is_work_day:
+            self.workday_overtime += overtime_hours or 0
+
+    def row(self, day_list):
+        """生成一行：固定列、汇总列和每天的打卡明细"""
+        work_days = {day for day in day_list if self.day_rules[day][3]}
+        standard_hours = sum(self.day_rules[day][2] for day in work_days)
+        attended = len(self.days)
+        absent_work_days = sum(1 for day in work_days if day not in self.days)
+        # 工作日没有打卡按上下班两次缺卡计
+        missing = self.missing_count + absent_work_days * 2
+        abnormal_days = attended - self.normal_days + absent_work_days
+        details = []
+        for day in day_list:
+            if day in self.days:
+                details.append(self.days[day])
+            elif day in work_days:
+                details.append('缺卡(上班); \n 缺卡(下班);')
+            else:
+                details.append('正常（未排班）')
+        return [
+            self.name, self.employee_id, '', self.department,
+            len(work_days), f"{attended:.1f}", str(len(day_list) - len(work_days)),
+            str(self.normal_days), str(abnormal_days),
+            _cell(round(standard_hours, 1)), f"{self.work_hours:.1f}",
+            _cell(self.late_count + self.early_count + missing),
+            _cell(self.late_count), _cell(self.late_minutes),
+            _cell(self.early_count), _cell(self.early_minutes),
+            EMPTY, EMPTY, _cell(missing), EMPTY, EMPTY, EMPTY, EMPTY, EMPTY,
+            _cell(round(self.overtime_hours, 1)), _cell(round(self.workday_overtime, 1)),
+        ] + details
+
+
+def iter_month_rows(start_date, end_date, department=None, progress=None):
+    """
+    按员工逐行产出月报数据行（不含表头），数据库游标边读边产出
+    progress 为可选回调 progress(已导出员工数, 员工总数)
+    """
+    # 每天按员工部门选用当天生效的规则版本（与导入相同），同一部门只解析一次
+    resolve = rules.rule_resolver()
+    department_rules = {}
+    day_list = [(start_date + timedelta(days=n)).isoformat()
+                for n in range((end_date - start_date).days + 1)]
+
+    where, params = "", [start_date.isoformat(), end_date.isoformat()]
+    if department:
+        where = "WHERE e.department = ?"
+        params.append(department)
+
+    current = None
+    done = 0
+    # 归档文件需在读事务开始前附加
+    with db.get_connection() as conn, archive.attached(conn, start_date, end_date) as schemas, \
+            db.read_transaction():
+        records, source_params = 'attendance_records', []
+        if len(schemas) > 1:
+            records, source_params = archive.union_source(
+                conn, 'attendance_records', 'work_date', schemas, start_date, end_date)
+        total = conn.execute(
+            "SELECT COUNT(*) FROM employees e " + where, params[2:]
+        ).fetchone()[0] if progress else 0
+        rows = conn.execute(EXPORT_QUERY.format(records=records, where=where), source_params + params)
+        for (employee_id, name, employee_department, work_date, status, punch_blob,
+             check_in_time, check_out_time, check_in_ts, check_out_ts,
+             work_hours, overtime_hours) in rows:
+            if current is None or current.employee_id != employee_id:
+                if current is not None:
+                    yield current.row(day_list)
+                    done += 1
+                    if progress and done % PROGRESS_EMPLOYEES == 0:
+                        progress(done, total)
+                if employee_department not in department_rules:
+                    department_rules[employee_department] = _day_rules(day_list, employee_department, resolve)
+                current = _EmployeeMonth(employee_id, name, employee_department,
+                                         department_rules[employee_department])
+            if work_date:
+                current.add(work_date, status, _punch_text(punch_blob, check_in_time, check_out_time),
+                            check_in_ts, check_out_ts, work_hours, overtime_hours)
+        if current is not None:
+            yield current.row(day_list)
+
+
+def write_month_report_xlsx(target, start_date, end_date, department=None, progress=None):
+    """
+    以只写模式生成月报 Excel，逐行写入，内存占用恒定
+    target: 文件路径或二进制文件对象；返回导出的员工数
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(MONTHLY_SHEET)
+    headers = header_rows(start_date, end_date)
+    for row in headers:
+        sheet.append(row)
+
+    width = len(headers[0])
+    last = get_column_letter(width)
+    for merged in (f"A1:{last}1", f"A2:{last}2", "A3:A4", "B3:B4", "C3:C4"):
+        sheet.merged_cells.add(merged)
+    days = (end_date - start_date).days + 1
+    for _, first, end in SUMMARY_GROUPS + [('打卡明细', width - days + 1, width)]:
+        if end > first:
+            sheet.merged_cells.add(f"{get_column_letter(first)}3:{get_column_letter(end)}3")
+
+    count = 0
+    for row in iter_month_rows(start_date, end_date, department, progress):
+        sheet.append(row)
+        count += 1
+    workbook.save(target)
+    return count
+
+
+def write_month_report_csv(target, start_date, end_date, department=None, progress=None):
+    """
+    生成 CSV 格式的月报（一行表头，列与 Excel 明细表头一致），逐行写入
+    target: 以 newline='' 打开的文本文件对象；返回导出的员工数
+    """
+    writer = csv.writer(target)
+    headers = header_rows(start_date, end_date)
+    writer.writerow(FIXED_COLUMNS + headers[3][len(FIXED_COLUMNS):])
+    count = 0
+    for row in iter_month_rows(start_date, end_date, department, progress):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def export_to_file(path, start_date, end_date, department=None, file_format='xlsx', progress=None):
+    """导出到指定路径，返回导出的员工数"""
+    if file_format == 'csv':
+        # utf-8-sig 让 Excel 正确识别中文
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            return write_month_report_csv(f, start_date, end_date, department, progress)
+    return write_month_report_xlsx(path, start_date, end_date, department, progress)
+
+
+def export_to_tempfile(start_date, end_date, department=None, file_format='xlsx'):
+    """导出到临时文件，返回 (文件路径, 下载文件名, 员工数)，调用方负责删除文件"""
+    extension = 'csv' if file_format == 'csv' else 'xlsx'
+    fd, path = tempfile.mkstemp(suffix='.' + extension)
+    os.close(fd)
+    count = export_to_file(path, start_date, end_date, department, extension)
+    return path, export_file_name(start_date, end_date, extension), count
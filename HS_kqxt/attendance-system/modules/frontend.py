@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+# 前端模板和交互脚本（相对于应用运行目录）
+INDEX_HTML = os.path.join("frontend", "index.html")
+INTERACTION_JS = os.path.join("frontend", "js", "interaction.js")
+LIVE_JS = os.path.join("frontend", "js", "live.js")
+# 双向组件模式的静态页面生成目录（由 Streamlit 组件服务直接提供）
+LIVE_BUILD_DIR = os.path.join("data", "frontend_live")
+
+# 开发时设置 ATTENDANCE_TEMPLATE_RELOAD=1，文件修改后自动重新加载模板
+AUTO_RELOAD = os.environ.get("ATTENDANCE_TEMPLATE_RELOAD") == "1"
+
+_template_lock = threading.Lock()
+_template = {
+    'mtimes': None,   # 加载时两个文件的修改时间
+    'prefix': None,   # 数据脚本之前的静态部分
+    'suffix': None,   # 数据脚本之后的静态部分（含交互脚本）
+}
+
+
+def _mtimes():
+    """模板文件的修改时间"""
+    return tuple(os.stat(path).st_mtime_ns for path in (INDEX_HTML, INTERACTION_JS))
+
+
+def _compile_template():
+    """
+    读取 index.html 和交互脚本，预先拼好数据插槽前后的静态部分
+    window.backendData 放在 </head> 前，交互脚本放在 </body> 前
+    """
+    with open(INDEX_HTML, "r", encoding="utf-8") as f:
+        page = f.read()
+    with open(INTERACTION_JS, "r", encoding="utf-8") as f:
+        interaction_script = f.read()
+
+    head_end = page.index("</head>")
+    body_end = page.rindex("</body>")
+    prefix = page[:head_end] + "<script>window.backendData = "
+    suffix = (
+        ";</script>" + page[head_end:body_end]
+        + "<script>\n" + interaction_script + "</script>" + page[body_end:]
+    )
+    return prefix, suffix
+
+
+def _get_template():
+    """获取编译好的模板，进程内只加载一次（AUTO_RELOAD 时按修改时间重新加载）"""
+    with _template_lock:
+        if _template['prefix'] is None or AUTO_RELOAD:
+            mtimes = _mtimes()
+            if mtimes != _template['mtimes']:
+                _template['prefix'], _template['suffix'] = _compile_template()
+                _template['mtimes'] = mtimes
+        return _template['prefix'], _template['suffix']
+
+
+def reload_template():
+    """丢弃已加载的模板，下次渲染时重新读取文件"""
+    with _template_lock:
+        _template['mtimes'] = None
+        _template['prefix'] = None
+        _template['suffix'] = None
+
+
+def render_page(backend_data):
+    """
+    把后端数据填入模板，返回完整页面
+    模板文件不存在时抛出 FileNotFoundError
+    """
+    prefix, suffix = _get_template()
+    # 中文不转义以减少传输字节；转义 "</" 防止数据中的 </script> 提前结束脚本
+    payload = json.dumps(backend_data, ensure_ascii=False).replace("</", "<\\/")
+    return prefix + payload + suffix
+
+
+def build_live_page(build_dir=LIVE_BUILD_DIR):
+    """
+    生成双向组件模式使用的静态页面（不含数据，数据由 live.js 按增量推送）
+    内容未变化时不重写文件，返回页面所在目录
+    """
+    with open(INDEX_HTML, "r", encoding="utf-8") as f:
+        page = f.read()
+    scripts = []
+    for path in (INTERACTION_JS, LIVE_JS):
+        with open(path, "r", encoding="utf-8") as f:
+            scripts.append("<script>\n" + f.read() + "</script>")
+
+    body_end = page.rindex("</body>")
+    content = page[:body_end] + "".join(scripts) + page[body_end:]
+
+    os.makedirs(build_dir, exist_ok=True)
+    target = os.path.join(build_dir, "index.html")
+    try:
+        with open(target, "r", encoding="utf-8") as f:
+            unchanged = f.read() == content
+    except FileNotFoundError:
+        unchanged = False
+    if not unchanged:
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(content)
+    return build_dir
@@ -0,0 +1,211 @@
+import os
+import re
+from datetime import date, datetime, time, timedelta
+from openpyxl import load_workbook
+from modules import archive, db, dashboard, punches as punch_codec, rules, rules_batch, summaries
+
+# 月报工作表名称（钉钉导出的“上下班打卡_月报”）
+MONTHLY_SHEET = '上下班打卡_月报'
+# 每个写事务提交的记录数
+BATCH_SIZE = 5000
+# 新导入员工的默认职位
+DEFAULT_POSITION = '未设置'
+# 每读取多少行员工报告一次进度
+PROGRESS_ROWS = 50
+
+_PERIOD_IN_FILENAME = re.compile(r'(\d{8})-(\d{8})')
+_PERIOD_IN_TITLE = re.compile(r'统计时间:\s*(\d{2})-(\d{2})\s*～\s*(\d{2})-(\d{2})')
+_MADE_AT_IN_TITLE = re.compile(r'制表时间:\s*(\d{4})-(\d{2})-(\d{2})')
+_DAY_HEADER = re.compile(r'^\s*(\d{1,2})\s*\n')
+_PLAIN_PUNCHES = re.compile(r'^[\s\d:;次日]+$')
+
+
+def parse_punch_cell(value):
+    """
+    解析月报中的一个打卡单元格，返回按时间排序的分钟数元组
+    如 '正常- 07:59; 12:01; 12:23; 20:31' -> (479, 721, 743, 1231)
+    “次日”打卡记为 1440 + 分钟数；缺卡、未排班等没有打卡的单元格返回空元组
+    """
+    if value is None:
+        return ()
+    if isinstance(value, time):
+        return (value.hour * 60 + value.minute,)
+
+    text = str(value)
+    # 状态与打卡时间以第一个“-”分隔，如“正常(补卡)- 08:00; ...”
+    _, sep, tail = text.partition('-')
+    if sep:
+        text = tail
+    elif not _PLAIN_PUNCHES.match(text):
+        return ()
+    # 换行后是缺卡说明，“补卡申请（07-11 08:00）”中的时间不是打卡时间
+    text = text.split('\n', 1)[0].split('补卡申请', 1)[0]
+
+    return tuple(punch_codec.find_minutes(text))
+
+
+def _parse_period(file_name, title):
+    """从文件名（上下班打卡_月报_20250701-20250731.xlsx）或表头“统计时间”解析统计周期"""
+    match = _PERIOD_IN_FILENAME.search(file_name or '')
+    if match:
+        start, end = (datetime.strptime(m, '%Y%m%d').date() for m in match.groups())
+        return start, end
+
+    period = _PERIOD_IN_TITLE.search(title or '')
+    made_at = _MADE_AT_IN_TITLE.search(title or '')
+    if not period or not made_at:
+        return None, None
+    start_month, start_day, end_month, end_day = (int(x) for x in period.groups())
+    made_year, made_month = int(made_at.group(1)), int(made_at.group(2))
+    # 制表时间在统计周期之后，周期月份大于制表月份说明跨年
+    end_year = made_year if end_month <= made_month else made_year - 1
+    start_year = end_year if start_month <= end_month else end_year - 1
+    return date(start_year, start_month, start_day), date(end_year, end_month, end_day)
+
+
+def _department_of(value):
+    """“公司/部门”格式只保留最后一级部门"""
+    if not value:
+        return '无'
+    return str(value).split('/')[-1].strip() or '无'
+
+
+def iter_month_report(file, file_name=None, progress=None):
+    """
+    以只读模式逐行读取月报，逐个产出 (员工信息, 日期, 打卡分钟数元组)
+    不会把整张表读入内存；progress 为可选回调 progress(已读行数, 总行数)
+    """
+    file_name = file_name or getattr(file, 'name', None) or (file if isinstance(file, str) else '')
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook[MONTHLY_SHEET] if MONTHLY_SHEET in workbook.sheetnames else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+
+        # 前四行是标题、统计时间、分组表头和明细表头
+        head = [next(rows, ()) for _ in range(4)]
+        title = str(head[1][0]) if head[1] and head[1][0] else ''
+        group_header, detail_header = head[2], head[3]
+
+        start, end = _parse_period(os.path.basename(str(file_name)), title)
+        if not start:
+            raise ValueError("无法识别统计周期，请使用“上下班打卡_月报_YYYYMMDD-YYYYMMDD.xlsx”格式的文件")
+
+        name_col = group_header.index('姓名')
+        account_col = group_header.index('账号')
+        department_col = detail_header.index('部门')
+        day_cols = [i for i, h in enumerate(detail_header) if isinstance(h, str) and _DAY_HEADER.match(h)]
+        day_dates = [start + timedelta(days=n) for n in range(len(day_cols))]
+        if day_dates and day_dates[-1] != end:
+            raise ValueError(f"打卡明细列数({len(day_cols)})与统计周期 {start} ～ {end} 不一致")
+
+        total_rows = sheet.max_row or 0
+        for row_number, row in enumerate(rows, 5):
+            if progress and total_rows and row_number % PROGRESS_ROWS == 0:
+                progress(row_number, total_rows)
+            if not row or not row[account_col]:
+                continue
+            employee = {
+                'employee_id': str(row[account_col]).strip(),
+                'name': str(row[name_col] or '').strip(),
+                'department': _department_of(row[department_col]),
+                'hire_date': start.isoformat(),
+            }
+            for col, day in zip(day_cols, day_dates):
+                punches = parse_punch_cell(row[col] if col < len(row) else None)
+                if punches:
+                    yield employee, day, punches
+    finally:
+        workbook.close()
+
+
+def write_records(employee_batch, record_batch, refresh_summaries=True):
+    """
+    在一个事务内写入一批员工和打卡记录
+    refresh_summaries 为 False 时只由触发器标记待刷新日期，汇总表留到读取汇总或空闲时再刷新
+    记录日期涉及已归档的月份时抛出 ValueError，不写入任何记录（否则分页读取时与归档中的记录重复）
+    """
+    if record_batch:
+        dates = [r[3] for r in record_batch]
+        archive.ensure_not_archived(min(dates), max(dates))
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+        INSERT INTO employees (employee_id, name, department, position, hire_date)
+        VALUES (:employee_id, :name, :department, :position, :hire_date)
+        ON CONFLICT(employee_id) DO UPDATE SET
+            name = excluded.name,
+            department = excluded.department
+        ''', [dict(e, position=DEFAULT_POSITION) for e in employee_batch])
+
+        # 同一员工同一天重复导入时覆盖原记录（记录 id 不变），保证导入幂等
+        cursor.executemany('''
+        INSERT INTO attendance_records
+        (employee_id, check_in_time, check_out_time, work_date, check_in_ts, check_out_ts,
+         work_hours, overtime_hours, status, punches, rule_version_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(employee_id, work_date) DO UPDATE SET
+            check_in_time = excluded.check_in_time,
+            check_out_time = excluded.check_out_time,
+            check_in_ts = excluded.check_in_ts,
+            check_out_ts = excluded.check_out_ts,
+            work_hours = excluded.work_hours,
+            overtime_hours = excluded.overtime_hours,
+            status = excluded.status,
+            punches = excluded.punches,
+            rule_version_id = excluded.rule_version_id
+        ''', record_batch)
+
+        # 与本批记录在同一事务内更新汇总表
+        if refresh_summaries:
+            summaries.refresh_dirty()
+
+
+def iter_record_batches(file, file_name, versions, progress=None, batch_size=BATCH_SIZE):
+    """
+    逐批产出 (本批新出现的员工信息列表, attendance_records 行元组列表)，每批最多 batch_size 条记录
+    员工信息只在该员工的第一条记录所在的批次产出；每天按员工部门和日期选用当时生效的规则版本，
+    状态、工时和加班由 rules_batch.build_records 按规则版本批量计算
+    """
+    resolve = rules.rule_resolver(versions)
+    last_employee_id = None
+    employees, entries = [], []
+    for employee, day, punches in iter_month_report(file, file_name, progress):
+        if employee['employee_id'] != last_employee_id:
+            last_employee_id = employee['employee_id']
+            employees.append(employee)
+        rule_set = resolve(day, employee['department'])
+        if rule_set is None:
+            raise ValueError(f"未找到 {day} 适用的考勤规则")
+        entries.append((last_employee_id, day, punches, rule_set))
+        if len(entries) >= batch_size:
+            yield employees, rules_batch.build_records(entries)
+            employees, entries = [], []
+    if employees or entries:
+        yield employees, rules_batch.build_records(entries)
+
+
+def import_attendance_from_excel(file, file_name=None, progress=None):
+    """
+    导入“上下班打卡_月报”Excel 文件
+    file: 文件路径或 Streamlit 上传的文件对象
+    progress: 可选回调 progress(已读行数, 总行数)
+    返回 (是否成功, 提示信息)
+    """
+    versions = rules.get_rule_versions()
+    if not versions:
+        return False, "未找到考勤规则，请先设置考勤规则"
+
+    employee_ids = set()
+    record_count = 0
+    try:
+        for employee_batch, record_batch in iter_record_batches(file, file_name, versions, progress):
+            write_records(employee_batch, record_batch)
+            employee_ids.update(employee['employee_id'] for employee in employee_batch)
+            record_count += len(record_batch)
+    except (ValueError, KeyError) as e:
+        return False, f"导入失败: {str(e)}"
+    finally:
+        if record_count:
+            dashboard.invalidate_cache()
+
+    return True, f"导入完成：{len(employee_ids)}名员工，{record_count}条打卡记录"
@@ -0,0 +1,410 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from datetime import date
+from modules import db
+
+# 上传文件和导出结果的保存目录（工作线程/进程重启后仍可继续处理）
+JOB_DIR = os.path.join("data", "jobs")
+UPLOAD_DIR = os.path.join(JOB_DIR, "uploads")
+EXPORT_DIR = os.path.join(JOB_DIR, "exports")
+
+# 没有任务时的轮询间隔(秒)
+POLL_SECONDS = 1.0
+# 运行中的任务超过该时间没有心跳，视为工作进程已退出，重新排队
+STALE_SECONDS = 600
+# 进度至少间隔多少秒写一次数据库（百分比变化时立即写）
+PROGRESS_INTERVAL = 1.0
+# 任务执行期间定时写心跳的间隔(秒)，与是否报告进度无关
+HEARTBEAT_SECONDS = 30
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+STATUS_LABELS = {
+    QUEUED: '排队中',
+    RUNNING: '进行中',
+    DONE: '已完成',
+    FAILED: '失败',
+    CANCELLED: '已取消',
+}
+KIND_LABELS = {
+    'import': '导入',
+    'reprocess': '重新处理',
+    'export': '导出',
+    'recompute': '重新计算',
+}
+
+_worker_lock = threading.Lock()
+_worker = None
+_wake = threading.Event()
+
+
+class JobCancelled(Exception):
+    """任务被取消时由进度回调抛出，中止正在执行的任务"""
+
+
+def _hash_payload(kind, payload):
+    raw = json.dumps([kind, payload], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _dedupe_statuses(kind):
+    """导入按文件内容去重，已完成的也算；重新处理和导出只与未完成的任务去重"""
+    if kind == 'import':
+        return (QUEUED, RUNNING, DONE)
+    return ACTIVE_STATUSES
+
+
+def submit(kind, payload, dedupe_key=None, created_by=None):
+    """
+    提交任务，返回 (任务 id, 是否新建)
+    有相同 dedupe_key 的任务排队中、进行中（导入还包括已完成）时返回已有任务
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"未知的任务类型: {kind}")
+    dedupe_key = dedupe_key or _hash_payload(kind, payload)
+    statuses = _dedupe_statuses(kind)
+    with db.get_connection() as conn:
+        # 写锁下检查并插入，多个会话同时提交同一文件时只会建一个任务
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(f'''
+            SELECT id FROM jobs
+            WHERE kind = ? AND dedupe_key = ? AND status IN ({', '.join('?' for _ in statuses)})
+            ORDER BY id DESC LIMIT 1
+        ''', (kind, dedupe_key) + statuses).fetchone()
+        if row:
+            return row[0], False
+        job_id = conn.execute(
+            "INSERT INTO jobs (kind, dedupe_key, payload, created_by) VALUES (?, ?, ?, ?)",
+            (kind, dedupe_key, json.dumps(payload, ensure_ascii=False), created_by)
+        ).lastrowid
+    _wake.set()
+    return job_id, True
+
+
+def submit_import(files, created_by=None):
+    """
+    提交导入任务，files 为 [(原始文件名, 文件内容 bytes), ...]
+    文件按内容哈希保存到 UPLOAD_DIR，同样内容的文件只导入一次
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    saved = []
+    for file_name, content in files:
+        digest = hashlib.sha256(content).hexdigest()
+        path = os.path.join(UPLOAD_DIR, digest + '.xlsx')
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        saved.append({'path': path, 'name': file_name, 'sha256': digest})
+    if len(saved) == 1:
+        dedupe_key = saved[0]['sha256']
+    else:
+        dedupe_key = hashlib.sha256(''.join(f['sha256'] for f in saved).encode('ascii')).hexdigest()
+    return submit('import', {'files': saved}, dedupe_key, created_by)
+
+
+def submit_reprocess(start_date, end_date, created_by=None):
+    """提交按班次重新处理一段日期的任务"""
+    return submit('reprocess', {'start': str(start_date), 'end': str(end_date)},
+                  created_by=created_by)
+
+
+def submit_export(start_date, end_date, department=None, file_format='xlsx', created_by=None):
+    """提交月报导出任务，完成后结果中有导出文件路径"""
+    return submit('export', {
+        'start': str(start_date), 'end': str(end_date),
+        'department': department, 'format': 'csv' if file_format == 'csv' else 'xlsx',
+    }, created_by=created_by)
+
+
+def submit_recompute(start_date, end_date=None, departments=None, created_by=None):
+    """提交按规则版本重新计算考勤记录的任务（end_date 为 None 表示不限结束日期）"""
+    return submit('recompute', {
+        'start': str(start_date), 'end': str(end_date) if end_date else None,
+        'departments': sorted(departments) if departments else None,
+    }, created_by=created_by)
+
+
+def cancel(job_id):
+    """取消任务：排队中的直接取消，进行中的在下一次报告进度时中止。返回 (是否成功, 提示信息)"""
+    with db.get_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = CURRENT_TIMESTAMP, message = '已取消' "
+            "WHERE id = ? AND status = ?", (CANCELLED, job_id, QUEUED)
+        )
+        if cursor.rowcount:
+            return True, "任务已取消"
+        cursor = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+        )
+        if cursor.rowcount:
+            return True, "已请求取消，任务将在当前步骤完成后停止"
+    return False, "任务已结束，无法取消"
+
+
+def _job_dict(cursor, row):
+    job = dict(zip([desc[0] for desc in cursor.description], row))
+    job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def get_job(job_id):
+    """获取一个任务，不存在返回 None"""
+    with db.get_connection() as conn:
+        cursor = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        return _job_dict(cursor, row) if row else None
+
+
+def list_jobs(limit=20, created_by=None):
+    """最近的任务（新的在前）"""
+    sql = "SELECT * FROM jobs"
+    params = []
+    if created_by:
+        sql += " WHERE created_by = ?"
+        params.append(created_by)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    with db.get_connection() as conn:
+        cursor = conn.execute(sql, params)
+        return [_job_dict(cursor, row) for row in cursor.fetchall()]
+
+
+def has_active_jobs(created_by=None):
+    """是否还有排队中或进行中的任务，指定 created_by 时只看该用户提交的（页面据此决定是否继续轮询）"""
+    sql = "SELECT 1 FROM jobs WHERE status IN (?, ?)"
+    params = list(ACTIVE_STATUSES)
+    if created_by:
+        sql += " AND created_by = ?"
+        params.append(created_by)
+    with db.get_connection() as conn:
+        return conn.execute(sql + " LIMIT 1", params).fetchone() is not None
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_next():
+    """
+    领取最早排队的任务并标记为进行中，没有任务返回 None
+    在写锁下领取，多个工作线程/进程不会领到同一个任务
+    """
+    with db.get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # 心跳超时的任务重新排队
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL "
+            "WHERE status = ? AND heartbeat_at < datetime('now', ?)",
+            (QUEUED, RUNNING, f'-{STALE_SECONDS} seconds')
+        )
+        row = conn.execute(
+            "SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute('''
+            UPDATE jobs SET status = ?, worker = ?, progress = 0, message = NULL,
+                   started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (RUNNING, _worker_name(), row[0]))
+    return row[0], row[1], json.loads(row[2])
+
+
+def _progress_reporter(job_id):
+    """生成进度回调 report(已完成, 总数)：写入百分比和心跳，发现取消请求时抛出 JobCancelled"""
+    state = {'percent': None, 'written': 0.0}
+
+    def report(done, total):
+        percent = round(min(100.0, done * 100.0 / total), 1) if total else 0.0
+        now = time.monotonic()
+        if percent == state['percent'] and now - state['written'] < PROGRESS_INTERVAL:
+            return
+        state['percent'], state['written'] = percent, now
+        with db.get_connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (percent, job_id)
+            )
+            cancel_requested = conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0]
+        if cancel_requested:
+            raise JobCancelled()
+
+    return report
+
+
+def _finish(job_id, status, message, result=None):
+    with db.get_connection() as conn:
+        conn.execute('''
+            UPDATE jobs SET status = ?, message = ?, result = ?,
+                   progress = CASE WHEN ? = 'done' THEN 100 ELSE progress END,
+                   finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (status, message, json.dumps(result, ensure_ascii=False) if result else None,
+              status, job_id))
+
+
+def _remove_uploads(job_id, files):
+    """删除任务的上传文件；其他未完成的导入任务也用到同一文件时保留"""
+    for f in files:
+        with db.get_connection() as conn:
+            in_use = conn.execute(
+                "SELECT 1 FROM jobs WHERE id != ? AND kind = 'import' AND status IN (?, ?) "
+                "AND instr(payload, ?) > 0 LIMIT 1",
+                (job_id,) + ACTIVE_STATUSES + (f['sha256'],)
+            ).fetchone()
+        if not in_use and os.path.exists(f['path']):
+            os.remove(f['path'])
+
+
+def _run_import(job_id, payload, report):
+    from modules import bulk_import, import_excel
+    files = payload['files']
+    try:
+        if len(files) == 1:
+            success, msg = import_excel.import_attendance_from_excel(
+                files[0]['path'], files[0]['name'], progress=report
+            )
+        else:
+            success, msg = bulk_import.bulk_import(
+                [(f['path'], f['name']) for f in files],
+                progress=lambda done, total, name: report(done, total)
+            )
+    finally:
+        # 导入结束（包括失败、取消）后上传文件不再需要，重新提交时会再次保存
+        _remove_uploads(job_id, files)
+    return success, msg, None
+
+
+def _run_reprocess(job_id, payload, report):
+    from modules import shift_engine
+    report(0, 1)
+    processed = shift_engine.process_range(payload['start'], payload['end'], progress=report)
+    if not processed:
+        return True, "所选日期内没有需要按班次处理的打卡记录", processed
+    detail = "，".join(f"{department}{count}条" for department, count in processed.items())
+    return True, f"重新处理完成：{detail}", processed
+
+
+def _run_export(job_id, payload, report):
+    from modules import export_report
+    start_date = date.fromisoformat(payload['start'])
+    end_date = date.fromisoformat(payload['end'])
+    extension = payload['format']
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{job_id}.{extension}")
+    count = export_report.export_to_file(
+        path, start_date, end_date, payload.get('department'), extension, progress=report
+    )
+    file_name = export_report.export_file_name(start_date, end_date, extension)
+    return True, f"导出完成：{count}名员工", {'path': path, 'file_name': file_name, 'count': count}
+
+
+def _run_recompute(job_id, payload, report):
+    from modules import rules_batch
+    report(0, 1)
+    count = rules_batch.recompute_range(
+        payload['start'], payload.get('end'), payload.get('departments'), progress=report
+    )
+    return True, f"重新计算完成：更新{count}条考勤记录", {'updated': count}
+
+
+# 任务类型 -> 处理函数 handler(任务 id, 参数, 进度回调)，返回 (是否成功, 提示信息, 结果)
+HANDLERS = {
+    'import': _run_import,
+    'reprocess': _run_reprocess,
+    'export': _run_export,
+    'recompute': _run_recompute,
+}
+
+
+def _heartbeat(job_id, stop):
+    """任务执行期间每 HEARTBEAT_SECONDS 秒写一次心跳，长时间不报告进度的任务也不会被当作已退出"""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            with db.get_connection() as conn:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                    (job_id, RUNNING)
+                )
+        except sqlite3.OperationalError as e:
+            # 数据库暂时被锁，下一次再写
+            print(f"写入任务心跳失败: {e}")
+
+
+def run_job(job_id, kind, payload):
+    """执行一个已领取的任务并记录结果"""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stop),
+                                 name=f'attendance-job-{job_id}-heartbeat', daemon=True)
+    heartbeat.start()
+    try:
+        success, msg, result = HANDLERS[kind](job_id, payload, _progress_reporter(job_id))
+    except JobCancelled:
+        _finish(job_id, CANCELLED, '已取消')
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, FAILED, f"任务执行出错: {e}")
+    else:
+        _finish(job_id, DONE if success else FAILED, msg, result)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+
+def run_pending(stop_when_idle=False):
+    """循环领取并执行任务；stop_when_idle 为 True 时队列为空即返回（命令行、测试使用）"""
+    while True:
+        try:
+            job = claim_next()
+        except sqlite3.OperationalError as e:
+            # 数据库暂时被锁或尚未迁移，稍后重试
+            print(f"领取任务失败: {e}")
+            job = None
+        if job is not None:
+            run_job(*job)
+            continue
+        if stop_when_idle:
+            return
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+
+
+def start_worker():
+    """启动进程内的后台工作线程（重复调用只启动一个）"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=run_pending, name='attendance-jobs', daemon=True)
+            _worker.start()
+
+
+if __name__ == '__main__':
+    # 命令行：python -m modules.jobs [worker|drain]，在独立进程中执行任务
+    from modules import migrations
+    migrations.ensure_schema()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'worker'
+    if command == 'worker':
+        run_pending()
+    elif command == 'drain':
+        run_pending(stop_when_idle=True)
+    else:
+        print("用法: python -m modules.jobs [worker|drain]")
+        sys.exit(1)
@@ -0,0 +1,103 @@
+import os
+import threading
+import streamlit as st
+from streamlit.components.v1 import declare_component
+from modules import frontend
+
+# 仪表盘渲染方式：static 为每次重跑整页重发（默认），live 为双向组件增量更新
+DASHBOARD_MODE = os.environ.get("ATTENDANCE_DASHBOARD_MODE", "static")
+
+COMPONENT_KEY = "live_dashboard"
+_STATE_KEY = "_live_dashboard_state"
+
+_component_lock = threading.Lock()
+_component = None
+
+
+def _get_component():
+    """声明双向组件，页面由 frontend.build_live_page 生成，进程内只声明一次"""
+    global _component
+    with _component_lock:
+        if _component is None:
+            _component = declare_component(
+                "attendance_dashboard", path=os.path.abspath(frontend.build_live_page())
+            )
+        return _component
+
+
+def _new_state():
+    """会话内记录的、前端当前应当显示的内容"""
+    return {
+        'seq': 0,             # 最近一次推送的增量序号
+        'current_user': None,
+        'stats': {},
+        'attendance_rules': None,
+        'records': {},        # 记录 id -> 行数据
+        'record_ids': [],
+        'patch': None,        # 最近一次推送的增量，数据未变化时原样重发
+        'handled_request': None,
+    }
+
+
+def build_patch(state, backend_data, full=False):
+    """
+    对比会话状态和最新数据，生成增量并更新会话状态；数据没有变化时返回 None
+    增量格式：
+        seq / base_seq   本次序号和所基于的序号，前端 base_seq 不匹配时请求全量
+        full             为 True 时前端先清空再按本增量重建
+        current_user / attendance_rules   有变化时才出现
+        stats            只含变化的统计字段
+        records          新增或内容变化的打卡记录（按 id）
+        record_ids       当前应显示的全部记录 id（按顺序），前端据此删除和排序
+    """
+    patch = {}
+    if full or backend_data['current_user'] != state['current_user']:
+        patch['current_user'] = backend_data['current_user']
+    if full or backend_data['attendance_rules'] != state['attendance_rules']:
+        patch['attendance_rules'] = backend_data['attendance_rules']
+
+    stats = {
+        key: value for key, value in backend_data['stats'].items()
+        if full or state['stats'].get(key) != value
+    }
+    if stats:
+        patch['stats'] = stats
+
+    records = backend_data['recent_records']
+    record_ids = [record['id'] for record in records]
+    changed = [record for record in records if full or state['records'].get(record['id']) != record]
+    if changed or record_ids != state['record_ids']:
+        patch['records'] = changed
+        patch['record_ids'] = record_ids
+
+    if not patch and not full:
+        return None
+
+    patch['full'] = full
+    patch['base_seq'] = state['seq']
+    patch['seq'] = state['seq'] + 1
+    state.update(
+        seq=patch['seq'],
+        current_user=backend_data['current_user'],
+        stats=dict(backend_data['stats']),
+        attendance_rules=backend_data['attendance_rules'],
+        records={record['id']: record for record in records},
+        record_ids=record_ids,
+        patch=patch,
+    )
+    return patch
+
+
+def render(backend_data):
+    """以双向组件渲染仪表盘：页面只加载一次，之后每次重跑只推送增量"""
+    state = st.session_state.setdefault(_STATE_KEY, _new_state())
+
+    # 前端发现增量对不上（如 iframe 重新加载）时会通过组件值请求全量
+    request = st.session_state.get(COMPONENT_KEY)
+    need_full = state['patch'] is None
+    if request and request.get('need_full') and request.get('request') != state['handled_request']:
+        state['handled_request'] = request.get('request')
+        need_full = True
+
+    build_patch(state, backend_data, full=need_full)
+    _get_component()(patch=state['patch'], key=COMPONENT_KEY, default=None)
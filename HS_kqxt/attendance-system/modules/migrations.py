@@ -0,0 +1,706 @@
+import threading
+from hashlib import sha256
+from modules import db
+
+# 每个进程只执行一次迁移检查
+_migrate_lock = threading.Lock()
+_migrated = False
+
+
+def _add_column_if_missing(cursor, table, column, column_type):
+    """表中缺少该列时补充（兼容旧版本 init 函数建好的表）"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
+def _create_base_tables(cursor):
+    """v1: 基础表结构、默认管理员和默认考勤规则"""
+    # 用户表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'user',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP
+    )
+    ''')
+
+    # 默认管理员账户，默认密码是 'admin123'，已加密
+    cursor.execute("SELECT id FROM users WHERE username = 'admin'")
+    if not cursor.fetchone():
+        admin_password = sha256('admin123'.encode()).hexdigest()
+        cursor.execute(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            ('admin', admin_password, 'admin')
+        )
+        print("已创建默认管理员账户: 用户名 admin, 密码 admin123")
+
+    # 员工表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        department TEXT NOT NULL,
+        position TEXT NOT NULL,
+        hire_date DATE NOT NULL,
+        status TEXT NOT NULL DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        avatar TEXT DEFAULT 'https://picsum.photos/id/237/40/40'
+    )
+    ''')
+
+    # 考勤规则表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        work_start_time TIME NOT NULL DEFAULT '09:00',  -- 上班时间
+        work_end_time TIME NOT NULL DEFAULT '18:00',    -- 下班时间
+        late_threshold INTEGER NOT NULL DEFAULT 15,     -- 迟到阈值(分钟)
+        early_leave_threshold INTEGER NOT NULL DEFAULT 15,  -- 早退阈值(分钟)
+        lunch_start_time TIME NOT NULL DEFAULT '12:00', -- 午休开始时间
+        lunch_end_time TIME NOT NULL DEFAULT '13:00',   -- 午休结束时间
+        overtime_start_time TIME NOT NULL DEFAULT '19:00',  -- 加班开始时间
+        daily_standard_hours REAL NOT NULL DEFAULT 8.0,  -- 每日标准工时(小时)
+        work_days TEXT NOT NULL DEFAULT '1,2,3,4,5',    -- 工作日(1-周一, 7-周日)
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- 最后更新时间
+    )
+    ''')
+
+    cursor.execute("SELECT id FROM attendance_rules LIMIT 1")
+    if not cursor.fetchone():
+        cursor.execute("INSERT INTO attendance_rules DEFAULT VALUES")
+        print("已创建默认考勤规则")
+
+    # 考勤记录表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT NOT NULL,
+        check_in_time TIMESTAMP,
+        check_out_time TIMESTAMP,
+        work_hours REAL,
+        overtime_hours REAL,
+        status TEXT,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
+    )
+    ''')
+
+    # 班次表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shifts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,  -- 班次名称：早班、中班、夜班
+        department TEXT NOT NULL,   -- 所属部门
+        system_rest_time TIME NOT NULL,  -- 系统休息时间
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 详细打卡规则表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shift_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shift_id INTEGER NOT NULL,
+        rule_type TEXT NOT NULL,  -- 上班、午休、下班等
+        start_time TIME,
+        end_time TIME,
+        processing_logic TEXT NOT NULL,  -- 处理逻辑标识
+        FOREIGN KEY (shift_id) REFERENCES shifts(id)
+    )
+    ''')
+
+    # 生产部早班记录特殊表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS production_morning_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT NOT NULL,
+        check_date DATE NOT NULL,
+        original_check_times TEXT NOT NULL,  -- 原始打卡时间，分号分隔
+        work_start_time TIME,  -- 计算后的上班时间
+        work_end_time TIME,    -- 计算后的下班时间
+        noon_leave_time TIME,  -- 午休下班时间
+        noon_start_time TIME,  -- 午休上班时间
+        day_overtime_hours REAL DEFAULT 0,  -- 白天加班时长
+        night_overtime_hours REAL DEFAULT 0,  -- 晚上加班时长
+        status TEXT,  -- 出勤状态
+        status_note TEXT,  -- 状态说明
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
+    )
+    ''')
+
+    # 后勤部打卡记录表
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS logistics_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id TEXT NOT NULL,
+        check_date DATE NOT NULL,
+        has_check_in INTEGER NOT NULL,  -- 1表示有打卡，0表示无打卡
+        status TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
+    )
+    ''')
+
+
+def _add_attendance_derived_columns(cursor):
+    """v2: attendance_records 的 work_date / 整数秒派生列、索引和触发器"""
+    # work_date 为出勤日期，*_ts 为打卡时间的整数秒
+    # （按 strftime('%s') 的口径把本地时间当作 UTC 换算，Python 端用 reports.to_epoch 保持一致）
+    _add_column_if_missing(cursor, 'attendance_records', 'work_date', 'DATE')
+    _add_column_if_missing(cursor, 'attendance_records', 'check_in_ts', 'INTEGER')
+    _add_column_if_missing(cursor, 'attendance_records', 'check_out_ts', 'INTEGER')
+
+    # 回填已有数据
+    cursor.execute('''
+    UPDATE attendance_records SET
+        work_date = DATE(COALESCE(check_in_time, check_out_time)),
+        check_in_ts = CAST(strftime('%s', check_in_time) AS INTEGER),
+        check_out_ts = CAST(strftime('%s', check_out_time) AS INTEGER)
+    WHERE work_date IS NULL
+      AND (check_in_time IS NOT NULL OR check_out_time IS NOT NULL)
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_work_date_employee
+    ON attendance_records (work_date, employee_id, check_in_ts)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_created_at
+    ON attendance_records (created_at)
+    ''')
+
+    # 写入方未提供派生列时由触发器补齐
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_records_derive_insert
+    AFTER INSERT ON attendance_records
+    WHEN NEW.work_date IS NULL
+      OR (NEW.check_in_time IS NOT NULL AND NEW.check_in_ts IS NULL)
+      OR (NEW.check_out_time IS NOT NULL AND NEW.check_out_ts IS NULL)
+    BEGIN
+        UPDATE attendance_records SET
+            work_date = COALESCE(NEW.work_date, DATE(COALESCE(NEW.check_in_time, NEW.check_out_time))),
+            check_in_ts = CAST(strftime('%s', NEW.check_in_time) AS INTEGER),
+            check_out_ts = CAST(strftime('%s', NEW.check_out_time) AS INTEGER)
+        WHERE id = NEW.id;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_attendance_records_derive_update
+    AFTER UPDATE OF check_in_time, check_out_time ON attendance_records
+    BEGIN
+        UPDATE attendance_records SET
+            work_date = DATE(COALESCE(NEW.check_in_time, NEW.check_out_time)),
+            check_in_ts = CAST(strftime('%s', NEW.check_in_time) AS INTEGER),
+            check_out_ts = CAST(strftime('%s', NEW.check_out_time) AS INTEGER)
+        WHERE id = NEW.id;
+    END
+    ''')
+
+
+def _add_attendance_check_times(cursor):
+    """v3: attendance_records 保存当天全部打卡时间，供班次处理使用"""
+    # 分号分隔的打卡时间，跨天打卡带“次日”前缀，如 '17:21;次日06:31'
+    _add_column_if_missing(cursor, 'attendance_records', 'check_times', 'TEXT')
+
+
+def _add_shift_result_unique_keys(cursor):
+    """v4: 班次处理结果按 (员工, 日期) 唯一，支持重复处理时覆盖写入"""
+    for table in ('production_morning_records', 'logistics_records'):
+        # 清理历史重复数据，只保留每人每天最后写入的一条
+        cursor.execute(f'''
+        DELETE FROM {table}
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM {table} GROUP BY employee_id, check_date
+        )
+        ''')
+        cursor.execute(f'''
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_employee_date
+        ON {table} (employee_id, check_date)
+        ''')
+
+
+def _seed_default_shifts(cursor):
+    """v5: 写入生产部早班和后勤部的班次规则，供 shift_engine 编译"""
+    default_shifts = [
+        ('生产部早班', '生产部', '05:00', [
+            ('上班', '00:00', '08:00', 'start_on_time'),
+            ('迟到', '08:00', '12:00', 'start_late'),
+            ('午休', '12:00', '13:30', 'noon'),
+            ('午休提前上班', '12:00', '12:30', 'noon_early_return'),
+            ('下班', '13:30', '05:00', 'end'),
+            ('晚上加班', '17:30', '23:59', 'night_overtime'),
+        ]),
+        ('后勤部常日班', '后勤部', '05:00', [
+            ('出勤', '00:00', '23:59', 'any_punch'),
+        ]),
+    ]
+    for name, department, system_rest_time, shift_rules in default_shifts:
+        cursor.execute("SELECT id FROM shifts WHERE name = ?", (name,))
+        if cursor.fetchone():
+            continue
+        cursor.execute(
+            "INSERT INTO shifts (name, department, system_rest_time) VALUES (?, ?, ?)",
+            (name, department, system_rest_time)
+        )
+        shift_id = cursor.lastrowid
+        cursor.executemany('''
+        INSERT INTO shift_rules (shift_id, rule_type, start_time, end_time, processing_logic)
+        VALUES (?, ?, ?, ?, ?)
+        ''', [(shift_id,) + rule for rule in shift_rules])
+
+
+def _add_summary_tables(cursor):
+    """v6: 按员工/日和部门/月预聚合的汇总表，以及标记待刷新日期的触发器"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_employee_summary (
+        employee_id TEXT NOT NULL,
+        work_date DATE NOT NULL,
+        department TEXT NOT NULL,
+        record_count INTEGER NOT NULL,
+        check_in_ts INTEGER,                      -- 当天最早上班打卡
+        check_out_ts INTEGER,                     -- 当天最晚下班打卡
+        is_late INTEGER NOT NULL DEFAULT 0,
+        is_early_leave INTEGER NOT NULL DEFAULT 0,
+        is_missing INTEGER NOT NULL DEFAULT 0,
+        work_hours REAL NOT NULL DEFAULT 0,
+        overtime_hours REAL NOT NULL DEFAULT 0,
+        day_overtime_hours REAL NOT NULL DEFAULT 0,   -- 班次处理结果（生产部早班）
+        night_overtime_hours REAL NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (employee_id, work_date)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_daily_employee_summary_department_date
+    ON daily_employee_summary (department, work_date)
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS monthly_department_summary (
+        month TEXT NOT NULL,                      -- YYYY-MM
+        department TEXT NOT NULL,
+        employee_count INTEGER NOT NULL,
+        attendance_days INTEGER NOT NULL,
+        late_count INTEGER NOT NULL,
+        early_leave_count INTEGER NOT NULL,
+        missing_count INTEGER NOT NULL,
+        work_hours REAL NOT NULL,
+        overtime_hours REAL NOT NULL,
+        day_overtime_hours REAL NOT NULL,
+        night_overtime_hours REAL NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (month, department)
+    )
+    ''')
+
+    # 待刷新的 (员工, 日期)，由触发器写入，summaries.refresh_dirty() 消费
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS summary_dirty_days (
+        employee_id TEXT NOT NULL,
+        work_date DATE NOT NULL,
+        PRIMARY KEY (employee_id, work_date)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_attendance_insert
+    AFTER INSERT ON attendance_records
+    WHEN NEW.work_date IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days VALUES (NEW.employee_id, NEW.work_date);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_attendance_update
+    AFTER UPDATE ON attendance_records
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days
+        SELECT OLD.employee_id, OLD.work_date WHERE OLD.work_date IS NOT NULL;
+        INSERT OR IGNORE INTO summary_dirty_days
+        SELECT NEW.employee_id, NEW.work_date WHERE NEW.work_date IS NOT NULL;
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_attendance_delete
+    AFTER DELETE ON attendance_records
+    WHEN OLD.work_date IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days VALUES (OLD.employee_id, OLD.work_date);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_morning_insert
+    AFTER INSERT ON production_morning_records
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days VALUES (NEW.employee_id, NEW.check_date);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_morning_update
+    AFTER UPDATE ON production_morning_records
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days VALUES (NEW.employee_id, NEW.check_date);
+    END
+    ''')
+    # 员工调动部门后，其全部日期都要计入新部门
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_summary_employee_department
+    AFTER UPDATE OF department ON employees
+    WHEN OLD.department IS NOT NEW.department
+    BEGIN
+        INSERT OR IGNORE INTO summary_dirty_days
+        SELECT DISTINCT employee_id, work_date FROM attendance_records
+        WHERE employee_id = NEW.employee_id AND work_date IS NOT NULL;
+    END
+    ''')
+
+    # 已有数据全部标记为待刷新，首次读取汇总时生成
+    cursor.execute('''
+    INSERT OR IGNORE INTO summary_dirty_days
+    SELECT DISTINCT employee_id, work_date FROM attendance_records
+    WHERE work_date IS NOT NULL
+    ''')
+
+
+def _add_employee_search_index(cursor):
+    """v7: 员工全文检索（FTS5 trigram，中文姓名可按任意连续子串匹配），由触发器与 employees 同步"""
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5(
+        employee_id, name, department,
+        content='employees', content_rowid='id',
+        tokenize='trigram'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_employees_fts_insert
+    AFTER INSERT ON employees
+    BEGIN
+        INSERT INTO employees_fts (rowid, employee_id, name, department)
+        VALUES (NEW.id, NEW.employee_id, NEW.name, NEW.department);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_employees_fts_delete
+    AFTER DELETE ON employees
+    BEGIN
+        INSERT INTO employees_fts (employees_fts, rowid, employee_id, name, department)
+        VALUES ('delete', OLD.id, OLD.employee_id, OLD.name, OLD.department);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_employees_fts_update
+    AFTER UPDATE OF employee_id, name, department ON employees
+    BEGIN
+        INSERT INTO employees_fts (employees_fts, rowid, employee_id, name, department)
+        VALUES ('delete', OLD.id, OLD.employee_id, OLD.name, OLD.department);
+        INSERT INTO employees_fts (rowid, employee_id, name, department)
+        VALUES (NEW.id, NEW.employee_id, NEW.name, NEW.department);
+    END
+    ''')
+    # 为已有员工建立索引
+    cursor.execute("INSERT INTO employees_fts (employees_fts) VALUES ('rebuild')")
+
+
+def _add_pagination_indexes(cursor):
+    """v8: 列表分页（按日期/ID 倒序的 keyset 翻页）使用的索引"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_employees_department_id
+    ON employees (department, id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_date_id
+    ON attendance_records (work_date, id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_employee_date
+    ON attendance_records (employee_id, work_date, id)
+    ''')
+    for table in ('production_morning_records', 'logistics_records'):
+        cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_{table}_date_id
+        ON {table} (check_date, id)
+        ''')
+
+
+def _add_jobs_table(cursor):
+    """v9: 后台任务队列（导入、重新处理、导出）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,                        -- import / reprocess / export
+        status TEXT NOT NULL DEFAULT 'queued',     -- queued / running / done / failed / cancelled
+        dedupe_key TEXT,                           -- 导入为文件内容哈希，其余为参数哈希
+        payload TEXT NOT NULL,                     -- 任务参数(JSON)
+        progress REAL NOT NULL DEFAULT 0,          -- 0-100
+        message TEXT,
+        result TEXT,                               -- 任务结果(JSON)，如导出文件路径
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        heartbeat_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_id
+    ON jobs (status, id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_jobs_dedupe
+    ON jobs (kind, dedupe_key, status)
+    ''')
+
+
+def _add_punch_blobs(cursor):
+    """
+    v10: 打卡时间增加二进制列（升序 uint16 分钟数，见 modules.punches）
+    班次处理直接解码，不再逐条解析字符串；早班结果表不再重复保存打卡字符串
+    """
+    from modules import punches
+    _add_column_if_missing(cursor, 'attendance_records', 'punches', 'BLOB')
+    _add_column_if_missing(cursor, 'production_morning_records', 'original_punches', 'BLOB')
+
+    rows = cursor.execute(
+        "SELECT id, check_times FROM attendance_records WHERE check_times IS NOT NULL"
+    ).fetchall()
+    cursor.executemany(
+        "UPDATE attendance_records SET punches = ? WHERE id = ?",
+        [(punches.pack_text(check_times), record_id) for record_id, check_times in rows]
+    )
+    rows = cursor.execute(
+        "SELECT id, original_check_times FROM production_morning_records"
+    ).fetchall()
+    # 原字符串列有 NOT NULL 约束，转换后置为空字符串
+    cursor.executemany(
+        "UPDATE production_morning_records SET original_punches = ?, original_check_times = '' "
+        "WHERE id = ?",
+        [(punches.pack_text(check_times), record_id) for record_id, check_times in rows]
+    )
+
+
+def _add_rule_versions(cursor):
+    """
+    v11: 按生效日期保存的考勤规则版本，考勤记录记下计算时使用的版本
+    修改规则时新增版本而不是覆盖，已过去的日期继续使用当时的规则
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS attendance_rule_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        effective_from DATE NOT NULL,     -- 生效日期（含）
+        department TEXT,                  -- 适用部门，NULL 为全部部门
+        work_start_time TIME NOT NULL,
+        work_end_time TIME NOT NULL,
+        late_threshold INTEGER NOT NULL,
+        early_leave_threshold INTEGER NOT NULL,
+        lunch_start_time TIME NOT NULL,
+        lunch_end_time TIME NOT NULL,
+        overtime_start_time TIME NOT NULL,
+        daily_standard_hours REAL NOT NULL,
+        work_days TEXT NOT NULL,
+        created_by TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_attendance_rule_versions_effective
+    ON attendance_rule_versions (effective_from, id)
+    ''')
+
+    # 原有的规则作为覆盖全部历史的第一个版本
+    cursor.execute('''
+    INSERT INTO attendance_rule_versions
+    (effective_from, department, work_start_time, work_end_time, late_threshold,
+     early_leave_threshold, lunch_start_time, lunch_end_time, overtime_start_time,
+     daily_standard_hours, work_days, created_at)
+    SELECT '0001-01-01', NULL, work_start_time, work_end_time, late_threshold,
+           early_leave_threshold, lunch_start_time, lunch_end_time, overtime_start_time,
+           daily_standard_hours, work_days, updated_at
+    FROM attendance_rules
+    ORDER BY updated_at DESC LIMIT 1
+    ''')
+
+    # 已有记录都是按原有规则计算的
+    _add_column_if_missing(cursor, 'attendance_records', 'rule_version_id', 'INTEGER')
+    cursor.execute('''
+    UPDATE attendance_records SET rule_version_id = (
+        SELECT MIN(id) FROM attendance_rule_versions
+    )
+    WHERE rule_version_id IS NULL
+    ''')
+
+
+def _add_archive_partitions(cursor):
+    """v12: 已归档月份的登记表（每个月一个 data/archive/attendance_YYYY-MM.db，见 modules.archive）"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive_partitions (
+        month TEXT PRIMARY KEY,                    -- YYYY-MM
+        file_name TEXT NOT NULL,                   -- 归档目录下的文件名
+        attendance_rows INTEGER NOT NULL DEFAULT 0,
+        morning_rows INTEGER NOT NULL DEFAULT 0,
+        logistics_rows INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+
+def _drop_punch_text_columns(cursor):
+    """
+    v13: 打卡时间只保存二进制列，删除不再写入的字符串列
+    attendance_records.check_times（v3）和 production_morning_records.original_check_times（v1，
+    v10 起只写空字符串占位）。删除前把仍只有字符串的行转换为二进制（DROP COLUMN 需要 SQLite 3.35+）
+    """
+    from modules import punches
+    for table, text_column, blob_column in (
+        ('attendance_records', 'check_times', 'punches'),
+        ('production_morning_records', 'original_check_times', 'original_punches'),
+    ):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if text_column not in {row[1] for row in cursor.fetchall()}:
+            continue
+        rows = cursor.execute(
+            f"SELECT id, {text_column} FROM {table} WHERE {blob_column} IS NULL AND {text_column} != ''"
+        ).fetchall()
+        cursor.executemany(
+            f"UPDATE {table} SET {blob_column} = ? WHERE id = ?",
+            [(punches.pack_text(text), record_id) for record_id, text in rows]
+        )
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {text_column}")
+
+
+def _add_attendance_unique_key(cursor):
+    """
+    v14: 考勤记录按 (员工, 日期) 唯一，写入改为 UPSERT，重复写入同一天时记录 id 不变
+    已有的重复记录只保留最新的一条；派生列触发器改为只在写入方改了打卡时间但没有提供派生列时补齐
+    （UPSERT 同时写入打卡时间和派生列，不能再按上班时间改写出勤日期）；
+    标记待刷新日期的触发器不再依赖 INSERT OR IGNORE
+    """
+    cursor.execute('''
+    DELETE FROM attendance_records
+    WHERE work_date IS NOT NULL AND id NOT IN (
+        SELECT MAX(id) FROM attendance_records WHERE work_date IS NOT NULL
+        GROUP BY employee_id, work_date
+    )
+    ''')
+    cursor.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_records_employee_date
+    ON attendance_records (employee_id, work_date)
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS trg_attendance_records_derive_update")
+    cursor.execute('''
+    CREATE TRIGGER trg_attendance_records_derive_update
+    AFTER UPDATE OF check_in_time, check_out_time ON attendance_records
+    WHEN (NEW.check_in_time IS NOT OLD.check_in_time OR NEW.check_out_time IS NOT OLD.check_out_time)
+      AND NEW.check_in_ts IS OLD.check_in_ts AND NEW.check_out_ts IS OLD.check_out_ts
+    BEGIN
+        UPDATE attendance_records SET
+            work_date = DATE(COALESCE(NEW.check_in_time, NEW.check_out_time)),
+            check_in_ts = CAST(strftime('%s', NEW.check_in_time) AS INTEGER),
+            check_out_ts = CAST(strftime('%s', NEW.check_out_time) AS INTEGER)
+        WHERE id = NEW.id;
+    END
+    ''')
+
+    # UPSERT 语句的冲突处理会覆盖触发器内 INSERT OR IGNORE 的 IGNORE，
+    # 待刷新日期已存在时整条 UPSERT 失败；改为先判断是否已存在
+    dirty_triggers = [
+        ('trg_summary_attendance_insert', 'AFTER INSERT ON attendance_records', [('NEW', 'work_date')]),
+        ('trg_summary_attendance_update', 'AFTER UPDATE ON attendance_records',
+         [('OLD', 'work_date'), ('NEW', 'work_date')]),
+        ('trg_summary_attendance_delete', 'AFTER DELETE ON attendance_records', [('OLD', 'work_date')]),
+        ('trg_summary_morning_insert', 'AFTER INSERT ON production_morning_records', [('NEW', 'check_date')]),
+        ('trg_summary_morning_update', 'AFTER UPDATE ON production_morning_records', [('NEW', 'check_date')]),
+    ]
+    for name, event, rows in dirty_triggers:
+        body = "".join(f'''
+        INSERT INTO summary_dirty_days
+        SELECT {row}.employee_id, {row}.{column}
+        WHERE {row}.{column} IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM summary_dirty_days
+            WHERE employee_id = {row}.employee_id AND work_date = {row}.{column}
+        );''' for row, column in rows)
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {event} BEGIN{body}\n    END")
+
+
+# 按版本号顺序执行的迁移步骤：(版本号, 说明, 函数)
+# 已发布的步骤不要修改，表结构变化一律追加新版本
+MIGRATIONS = [
+    (1, '基础表结构', _create_base_tables),
+    (2, '考勤记录派生列与索引', _add_attendance_derived_columns),
+    (3, '考勤记录原始打卡时间', _add_attendance_check_times),
+    (4, '班次处理结果唯一键', _add_shift_result_unique_keys),
+    (5, '默认班次规则', _seed_default_shifts),
+    (6, '日/月汇总表', _add_summary_tables),
+    (7, '员工全文检索', _add_employee_search_index),
+    (8, '分页索引', _add_pagination_indexes),
+    (9, '后台任务队列', _add_jobs_table),
+    (10, '打卡时间二进制存储', _add_punch_blobs),
+    (11, '考勤规则版本', _add_rule_versions),
+    (12, '冷数据按月归档', _add_archive_partitions),
+    (13, '删除打卡时间字符串列', _drop_punch_text_columns),
+    (14, '考勤记录按员工和日期唯一', _add_attendance_unique_key),
+]
+
+
+def get_schema_version():
+    """获取数据库当前的结构版本号，未迁移过返回0"""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        return cursor.fetchone()[0] or 0
+
+
+def migrate():
+    """
+    执行所有未应用的迁移步骤，每个步骤一个写事务
+    使用 BEGIN IMMEDIATE 加写锁，多个进程同时启动时只有一个会真正执行
+    返回本次执行的版本号列表
+    """
+    applied = []
+    get_schema_version()
+    with db.get_connection() as conn:
+        for version, name, step in MIGRATIONS:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("SELECT MAX(version) FROM schema_version")
+                if (cursor.fetchone()[0] or 0) >= version:
+                    conn.commit()
+                    continue
+                step(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (version, name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+            print(f"已执行数据库迁移 v{version}: {name}")
+    return applied
+
+
+def ensure_schema():
+    """进程内只检查一次数据库结构，之后的调用直接返回"""
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if not _migrated:
+            migrate()
+            _migrated = True
@@ -0,0 +1,56 @@
+import base64
+import json
+
+# 每页条数上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values):
+    """把上一页最后一行的排序键编码为不透明的游标字符串"""
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, size):
+    """解析游标，返回排序键列表；cursor 为空返回 None，格式不对抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ValueError("无效的分页游标")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("无效的分页游标")
+    return values
+
+
+def keyset_condition(columns, cursor):
+    """
+    按 columns 降序翻页时的条件：排序键严格小于上一页最后一行
+    返回 (SQL 条件, 参数)，第一页返回 (None, [])
+    """
+    values = decode_cursor(cursor, len(columns))
+    if values is None:
+        return None, []
+    placeholders = ', '.join('?' for _ in columns)
+    return f"({', '.join(columns)}) < ({placeholders})", values
+
+
+def page_size(limit):
+    """把调用方传入的条数限制在 1..MAX_PAGE_SIZE"""
+    return max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+def fetch_page(cursor, query, params, limit, key_columns):
+    """
+    执行已拼好 ORDER BY 的查询并多取一行判断是否还有下一页
+    key_columns 为结果中排序键的列名，返回 (本页字典列表, 下一页游标或 None)
+    """
+    cursor.execute(query + " LIMIT ?", list(params) + [limit + 1])
+    columns = [desc[0] for desc in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][column] for column in key_columns)
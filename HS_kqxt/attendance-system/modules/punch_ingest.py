@@ -0,0 +1,252 @@
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from modules import dashboard, db, import_excel, punches, rules, rules_batch, summaries
+
+# 组提交参数：攒够 FLUSH_ROWS 条或第一条入队后等待 FLUSH_INTERVAL 秒即写入一次
+FLUSH_ROWS = 2000
+FLUSH_INTERVAL = 0.005
+# 内存中最多排队的打卡数，队列满时 ENQUEUE_TIMEOUT 秒内仍放不进去则拒绝（背压）
+MAX_PENDING = 20000
+ENQUEUE_TIMEOUT = 1.0
+# 等待写入确认的默认时间(秒)
+ACK_TIMEOUT = 10.0
+# 早于该时刻（分钟）的打卡记入前一个出勤日的“次日”打卡，与班次处理的系统休息时间 05:00 一致
+DAY_CUTOFF_MINUTES = 5 * 60
+# IN 查询每次最多的参数个数
+LOOKUP_CHUNK = 500
+
+_queue = queue.Queue(maxsize=MAX_PENDING)
+_writer_lock = threading.Lock()
+_writer = None
+_stop = threading.Event()
+_stats_lock = threading.Lock()
+_stats = {'flushes': 0, 'punches': 0, 'rejected': 0, 'last_batch': 0, 'max_batch': 0}
+
+
+class PunchTicket:
+    """一次打卡的写入凭证：wait() 在打卡已提交到数据库（或被拒绝）后返回 (是否成功, 提示信息)"""
+
+    __slots__ = ('employee_id', 'punched_at', '_done', '_result')
+
+    def __init__(self, employee_id, punched_at):
+        self.employee_id = employee_id
+        self.punched_at = punched_at
+        self._done = threading.Event()
+        self._result = None
+
+    def resolve(self, success, msg):
+        self._result = (success, msg)
+        self._done.set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=ACK_TIMEOUT):
+        if not self._done.wait(timeout):
+            return False, "等待写入超时，打卡状态未知，请稍后查询确认"
+        return self._result
+
+
+def work_day_of(punched_at):
+    """打卡时间所属的出勤日和相对该日 00:00 的分钟数（凌晨 05:00 前记为前一天的“次日”打卡）"""
+    minute = punched_at.hour * 60 + punched_at.minute
+    if minute < DAY_CUTOFF_MINUTES:
+        return punched_at.date() - timedelta(days=1), minute + 1440
+    return punched_at.date(), minute
+
+
+def enqueue(employee_id, punched_at=None, timeout=ENQUEUE_TIMEOUT):
+    """
+    打卡放入内存队列，立即返回 PunchTicket（不等待写入）
+    队列已满且 timeout 秒内没有空位时返回 None，调用方应提示稍后重试
+    """
+    start_writer()
+    ticket = PunchTicket(str(employee_id).strip(), punched_at or datetime.now())
+    try:
+        _queue.put(ticket, timeout=timeout)
+    except queue.Full:
+        with _stats_lock:
+            _stats['rejected'] += 1
+        return None
+    return ticket
+
+
+def submit_punch(employee_id, punched_at=None, timeout=ACK_TIMEOUT):
+    """
+    员工打卡（上班/下班），等打卡已提交到数据库后返回 (是否成功, 提示信息)
+    返回成功即已持久化：写入使用 synchronous=FULL，断电也不会丢失
+    """
+    ticket = enqueue(employee_id, punched_at)
+    if ticket is None:
+        return False, "打卡人数过多，请稍后重试"
+    return ticket.wait(timeout)
+
+
+def _collect_batch(first):
+    """第一条打卡之后在 FLUSH_INTERVAL 内尽量多取，整批最多 FLUSH_ROWS 条"""
+    batch = [first]
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while len(batch) < FLUSH_ROWS:
+        try:
+            batch.append(_queue.get_nowait())
+            continue
+        except queue.Empty:
+            pass
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _departments(cursor, employee_ids):
+    """{员工编号: 部门}，不存在的员工不在结果中"""
+    ids = list(employee_ids)
+    found = {}
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[start:start + LOOKUP_CHUNK]
+        cursor.execute(
+            f"SELECT employee_id, department FROM employees WHERE employee_id IN ({', '.join('?' for _ in chunk)})",
+            chunk
+        )
+        found.update(cursor.fetchall())
+    return found
+
+
+def _existing_punches(cursor, employee_id, work_date):
+    """某员工某天已保存的打卡分钟数"""
+    row = cursor.execute(
+        "SELECT punches FROM attendance_records WHERE employee_id = ? AND work_date = ?",
+        (employee_id, work_date)
+    ).fetchone()
+    return [] if row is None else punches.unpack(row[0]).tolist()
+
+
+def _write_batch(batch):
+    """
+    一个写事务内合并一批打卡：同一员工同一天的打卡并入当天的考勤记录（同一分钟的重复打卡只记一次），
+    按当天适用的规则版本重新计算状态和工时。返回 [(凭证, 是否成功, 提示信息), ...]
+    """
+    outcomes = []
+    with db.get_connection() as conn:
+        # 确认前必须落盘：本事务使用 FULL 同步，提交后恢复连接池的默认设置
+        conn.execute("PRAGMA synchronous=FULL")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            departments = _departments(cursor, {ticket.employee_id for ticket in batch})
+            resolve = rules.rule_resolver()
+
+            days = {}
+            for ticket in batch:
+                if ticket.employee_id not in departments:
+                    outcomes.append((ticket, False, f"员工编号 {ticket.employee_id} 不存在"))
+                    continue
+                day, minute = work_day_of(ticket.punched_at)
+                days.setdefault((ticket.employee_id, day), []).append((minute, ticket))
+
+            changed = []
+            for (employee_id, day), entries in days.items():
+                rule_set = resolve(day, departments[employee_id])
+                if rule_set is None:
+                    outcomes.extend((ticket, False, f"未找到 {day} 适用的考勤规则") for _, ticket in entries)
+                    continue
+                minutes = set(_existing_punches(cursor, employee_id, day.isoformat()))
+                minutes.update(minute for minute, _ in entries)
+                changed.append((employee_id, day, sorted(minutes), rule_set))
+                outcomes.extend(
+                    (ticket, True, f"打卡成功：{ticket.punched_at:%H:%M}") for _, ticket in entries
+                )
+
+            if changed:
+                # 与 Excel 导入相同的计算和写入方式（按员工和日期 UPSERT，记录 id 不变）；
+                # 汇总表只标记待刷新，不占用打卡的写事务
+                import_excel.write_records([], rules_batch.build_records(changed), refresh_summaries=False)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+    return outcomes
+
+
+def _flush(batch):
+    """写入一批打卡并通知等待的调用方；写入失败时整批返回失败"""
+    try:
+        outcomes = _write_batch(batch)
+    except Exception as e:
+        outcomes = [(ticket, False, f"打卡写入失败: {e}") for ticket in batch]
+    written = sum(1 for _, success, _ in outcomes if success)
+    if written:
+        dashboard.invalidate_cache()
+    with _stats_lock:
+        _stats['flushes'] += 1
+        _stats['punches'] += written
+        _stats['last_batch'] = len(batch)
+        _stats['max_batch'] = max(_stats['max_batch'], len(batch))
+    for ticket, success, msg in outcomes:
+        ticket.resolve(success, msg)
+
+
+def _refresh_summaries():
+    """队列空闲时刷新汇总表（读取汇总的函数也会先刷新，这里只是提前完成）"""
+    try:
+        summaries.refresh_dirty()
+    except Exception as e:
+        print(f"刷新汇总表失败: {e}")
+
+
+def _run_writer():
+    """写入线程：持续取出打卡并组提交，队列空闲时刷新汇总表，收到停止信号后写完剩余的打卡再退出"""
+    dirty = False
+    while not (_stop.is_set() and _queue.empty()):
+        try:
+            first = _queue.get(timeout=0.1)
+        except queue.Empty:
+            if dirty:
+                _refresh_summaries()
+                dirty = False
+            continue
+        _flush(_collect_batch(first))
+        dirty = True
+    if dirty:
+        _refresh_summaries()
+
+
+def start_writer():
+    """启动进程内的打卡写入线程（重复调用只启动一个）"""
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _stop.clear()
+            _writer = threading.Thread(target=_run_writer, name='attendance-punches', daemon=True)
+            _writer.start()
+
+
+def stop_writer(timeout=ACK_TIMEOUT):
+    """写完队列中的打卡后停止写入线程（测试、进程退出前使用）"""
+    global _writer
+    with _writer_lock:
+        writer = _writer
+        _writer = None
+    if writer is not None:
+        _stop.set()
+        writer.join(timeout)
+
+
+def pending_count():
+    """队列中等待写入的打卡数"""
+    return _queue.qsize()
+
+
+def get_stats():
+    """写入统计：组提交次数、已写入打卡数、因队列已满被拒绝的次数、最近/最大批次大小"""
+    with _stats_lock:
+        return dict(_stats, pending=_queue.qsize())
@@ -0,0 +1,86 @@
+import re
+import numpy as np
+
+# 打卡时间的二进制格式：按时间升序的 uint16 小端数组，每个值为相对当天 00:00 的分钟数，
+# “次日”打卡为 1440 + 分钟数（最大 2879），一天 N 次打卡占 2N 字节
+DTYPE = np.dtype('<u2')
+NEXT_DAY = 1440
+MAX_MINUTE = 2 * 1440 - 1
+
+# 一次打卡的文本形式：'HH:MM' 或 '次日HH:MM'
+_TIME = r'(次日)?(\d{1,2}):(\d{1,2})'
+_PUNCH = re.compile('^' + _TIME + '$')
+_PUNCH_IN_TEXT = re.compile(_TIME)
+
+
+def _minute_of(next_day, hour, minute):
+    hour, minute = int(hour), int(minute)
+    if hour >= 24 or minute >= 60:
+        return None
+    return (NEXT_DAY if next_day else 0) + hour * 60 + minute
+
+
+def parse_minute(value):
+    """'HH:MM' 或 '次日HH:MM' 转换为分钟数（次日加 1440），无法解析返回 None"""
+    match = _PUNCH.match((value or '').strip())
+    return _minute_of(*match.groups()) if match else None
+
+
+def parse_text(check_times_str):
+    """'HH:MM;次日HH:MM' 格式的打卡字符串解析为升序分钟数列表，无法解析的片段跳过"""
+    minutes = [parse_minute(part) for part in (check_times_str or '').split(';')]
+    return sorted(minute for minute in minutes if minute is not None)
+
+
+def find_minutes(text):
+    """找出一段文本（如月报单元格）中出现的全部打卡时间，返回升序分钟数列表"""
+    minutes = [_minute_of(*groups) for groups in _PUNCH_IN_TEXT.findall(text or '')]
+    return sorted(minute for minute in minutes if minute is not None)
+
+
+def format_minutes(minutes, separator=';'):
+    """分钟数序列转换为 'HH:MM;次日HH:MM' 格式"""
+    parts = []
+    for minute in minutes:
+        prefix = '次日' if minute >= NEXT_DAY else ''
+        minute %= NEXT_DAY
+        parts.append(f"{prefix}{minute // 60:02d}:{minute % 60:02d}")
+    return separator.join(parts)
+
+
+def pack(minutes):
+    """升序分钟数序列打包为 BLOB，没有打卡返回 None"""
+    if len(minutes) == 0:
+        return None
+    return np.asarray(minutes, dtype=DTYPE).tobytes()
+
+
+def pack_text(check_times_str):
+    """打卡字符串直接转换为 BLOB"""
+    return pack(parse_text(check_times_str))
+
+
+def unpack(blob):
+    """BLOB 解码为只读的 uint16 数组（直接引用 bytes 的内存，不复制）"""
+    if not blob:
+        return np.empty(0, dtype=DTYPE)
+    return np.frombuffer(blob, dtype=DTYPE)
+
+
+def to_text(blob, separator=';'):
+    """BLOB 转换回 'HH:MM;次日HH:MM' 格式，用于显示"""
+    return format_minutes(unpack(blob).tolist(), separator)
+
+
+def decode_groups(blobs):
+    """
+    把多行的打卡 BLOB 拼成批量引擎使用的扁平数组
+    返回 (punches, offsets)：第 i 行的打卡为 punches[offsets[i]:offsets[i+1]]，组内已升序
+    所有 BLOB 只拼接一次，punches 直接引用拼接结果的内存，不逐条解析
+    """
+    lengths = np.fromiter((len(blob) // DTYPE.itemsize if blob else 0 for blob in blobs),
+                          dtype=np.int64, count=len(blobs))
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    punches = np.frombuffer(b''.join(blob for blob in blobs if blob), dtype=DTYPE)
+    return punches, offsets
@@ -0,0 +1,208 @@
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from collections import namedtuple
+from datetime import date
+from modules import (dashboard, db, employees, export_report, jobs, reports, rules, rules_batch,
+                     shift_engine, summaries, tracing)
+
+# 登记的查询入口：call(sample) 用示例参数调用实际的业务函数，执行到的每条语句都会做 EXPLAIN QUERY PLAN
+# hot 为 True 时计划中不能出现 SCAN（全表/全索引扫描），allow 为允许的 SCAN 明细前缀及原因
+QueryCase = namedtuple('QueryCase', ['name', 'call', 'hot', 'allow'], defaults=(True, None))
+
+# 配置、队列类的小表，行数与数据规模无关，任何查询都可以扫描
+SMALL_TABLES = {
+    'users', 'shifts', 'shift_rules', 'attendance_rules', 'attendance_rule_versions',
+    'summary_dirty_days', 'summary_dirty_months', 'schema_version', 'archive_partitions',
+}
+
+# 最近打卡记录按创建时间索引倒序读取，LIMIT 后即停止，不随数据量增长
+RECENT_RECORDS_SCAN = {'SCAN ar USING INDEX idx_attendance_records_created_at': "按创建时间索引倒序读取，LIMIT 后停止"}
+
+_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+_NOT_ALIASES = {'ON', 'WHERE', 'JOIN', 'LEFT', 'INNER', 'CROSS', 'GROUP', 'ORDER', 'LIMIT', 'USING', 'AS'}
+
+# 修改 reports.py、employees.py 等模块的查询或新增热点查询时，在这里登记
+CATALOG = [
+    QueryCase('reports.get_today_attendance', lambda s: reports.get_today_attendance()),
+    QueryCase('reports.get_late_count', lambda s: reports.get_late_count()),
+    QueryCase('reports.get_overtime_hours', lambda s: reports.get_overtime_hours()),
+    QueryCase('reports.get_recent_records', lambda s: reports.get_recent_records(), allow=RECENT_RECORDS_SCAN),
+    QueryCase('reports.get_attendance_records_page',
+              lambda s: reports.get_attendance_records_page()),
+    QueryCase('reports.get_attendance_records_page(department, dates)',
+              lambda s: reports.get_attendance_records_page(
+                  department=s['department'], start_date=s['start'], end_date=s['end'])),
+    QueryCase('reports.get_attendance_records_page(employee_id)',
+              lambda s: reports.get_attendance_records_page(employee_id=s['employee_id'])),
+    QueryCase('reports.get_attendance_records_page(status, cursor)',
+              lambda s: reports.get_attendance_records_page(
+                  status='迟到', cursor=reports.get_attendance_records_page(limit=10)[1])),
+    QueryCase('reports.get_shift_records_page(morning, department)',
+              lambda s: reports.get_shift_records_page('morning', department=s['department'])),
+    QueryCase('reports.get_shift_records_page(logistics, dates)',
+              lambda s: reports.get_shift_records_page('logistics', start_date=s['start'], end_date=s['end'])),
+    QueryCase('employees.get_employees_page(department)',
+              lambda s: employees.get_employees_page(department=s['department'])),
+    QueryCase('employees.get_employee_by_id', lambda s: employees.get_employee_by_id(s['employee_id'])),
+    QueryCase('employees.get_employees_by_department',
+              lambda s: employees.get_employees_by_department(s['department'])),
+    QueryCase('employees.search_employees(fts)', lambda s: employees.search_employees(s['employee_id'][:6])),
+    QueryCase('employees.search_employees_ranked(fts)',
+              lambda s: employees.search_employees_ranked(s['employee_id'][:6])),
+    # 一两个字的搜索词无法使用 trigram 索引，按设计退回 LIKE 扫描
+    QueryCase('employees.search_employees(short)', lambda s: employees.search_employees(s['name'][:1]),
+              hot=False),
+    QueryCase('employees.get_all_employees', lambda s: employees.get_all_employees(), hot=False),
+    QueryCase('dashboard._query_snapshot', lambda s: dashboard._query_snapshot(s['day']),
+              allow=dict(RECENT_RECORDS_SCAN, **{
+                  'SCAN r': "rule 为只有一行的规则 CTE",
+                  'SCAN employees USING COVERING INDEX': "员工总数 COUNT(*) 只能扫描，已使用最小的覆盖索引",
+              })),
+    QueryCase('summaries.get_employee_daily',
+              lambda s: summaries.get_employee_daily(s['employee_id'], s['start'], s['end'])),
+    QueryCase('summaries.get_department_daily',
+              lambda s: summaries.get_department_daily(s['department'], s['start'], s['end'])),
+    QueryCase('summaries.get_department_monthly',
+              lambda s: summaries.get_department_monthly(s['month'], s['department'])),
+    QueryCase('export_report.iter_month_rows(department)',
+              lambda s: list(export_report.iter_month_rows(
+                  date.fromisoformat(s['start']), date.fromisoformat(s['end']), s['department']))),
+    QueryCase('shift_engine.process_range',
+              lambda s: shift_engine.process_range(s['day'], s['day'])),
+    QueryCase('rules_batch.recompute_range(department)',
+              lambda s: rules_batch.recompute_range(s['day'], s['day'], [s['department']])),
+    QueryCase('rules.schedule_recompute', lambda s: rules.schedule_recompute(s['end'], s['department'])),
+    QueryCase('jobs.has_active_jobs', lambda s: jobs.has_active_jobs()),
+    QueryCase('jobs.list_jobs', lambda s: jobs.list_jobs(),
+              allow={'SCAN jobs': "按 id 倒序读取最新的任务，LIMIT 后停止"}),
+    QueryCase('jobs.claim_next', lambda s: jobs.claim_next()),
+]
+
+
+def sample_values():
+    """从当前数据库取一组示例参数：最新出勤日期所在月份、记录最多的部门及其中一名员工"""
+    with db.get_connection() as conn:
+        row = conn.execute('''
+            SELECT e.department, e.employee_id, e.name
+            FROM employees e
+            JOIN attendance_records ar ON ar.employee_id = e.employee_id
+            GROUP BY e.department
+            ORDER BY COUNT(*) DESC, e.department
+            LIMIT 1
+        ''').fetchone()
+        if row is None:
+            raise ValueError("数据库中没有考勤记录，无法生成示例参数")
+        department, employee_id, name = row
+        start, end = conn.execute(
+            "SELECT MIN(work_date), MAX(work_date) FROM attendance_records"
+        ).fetchone()
+    return {
+        'department': department, 'employee_id': employee_id, 'name': name,
+        'start': start, 'end': end, 'day': end, 'month': end[:7],
+    }
+
+
+def explain(conn, statement, parameters=()):
+    """返回语句的 EXPLAIN QUERY PLAN 明细列表"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+def table_aliases(statement):
+    """语句中 FROM/JOIN 后的 {别名: 表名}（查询计划中的 SCAN/SEARCH 显示的是别名）"""
+    aliases = {}
+    for table, alias in _ALIAS.findall(statement):
+        if alias.upper() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def scan_violations(plan, allow=None, aliases=None):
+    """计划中不允许的 SCAN 明细（常量行、虚拟表索引、小表和 allow 中的前缀除外）"""
+    violations = []
+    for detail in plan:
+        if not detail.startswith('SCAN ') or detail.startswith('SCAN CONSTANT ROW'):
+            continue
+        name = detail.split()[1]
+        if 'VIRTUAL TABLE INDEX' in detail or (aliases or {}).get(name, name) in SMALL_TABLES:
+            continue
+        if any(detail.startswith(prefix) for prefix in (allow or {})):
+            continue
+        violations.append(detail)
+    return violations
+
+
+def _explainable(query):
+    """只检查用 execute 执行的查询、修改语句和 INSERT ... SELECT（executemany 没有保留参数）"""
+    if query.get('parameters') is None:
+        return False
+    statement = query['statement'].lstrip().upper()
+    if statement.startswith('INSERT'):
+        return 'SELECT' in statement
+    return statement.startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE'))
+
+
+def check_case(case, sample):
+    """
+    执行一个登记入口并检查其中每条语句的查询计划
+    返回 (语句结果列表, 问题列表)：语句结果为 {'site', 'sql', 'plan', 'violations'}
+    """
+    with tracing.run(case.name, enabled=True, record=False, capture_params=True) as run:
+        case.call(sample)
+
+    statements, problems = [], []
+    with db.get_connection() as conn:
+        for query in run.queries:
+            if not _explainable(query):
+                continue
+            plan = explain(conn, query['statement'], query['parameters'])
+            aliases = table_aliases(query['statement'])
+            violations = scan_violations(plan, case.allow, aliases) if case.hot else []
+            statements.append({'site': query['site'], 'sql': query['sql'],
+                               'plan': plan, 'violations': violations})
+            problems.extend(f"{case.name} @ {query['site']}: {detail}" for detail in violations)
+    if not statements:
+        problems.append(f"{case.name}: 没有执行任何可检查的查询，请更新查询目录")
+    return statements, problems
+
+
+def check_all(cases=None, sample=None):
+    """检查全部登记入口，返回 ({入口名称: 语句结果列表}, 问题列表)"""
+    sample = sample or sample_values()
+    report, problems = {}, []
+    for case in cases or CATALOG:
+        report[case.name], case_problems = check_case(case, sample)
+        problems.extend(case_problems)
+    return report, problems
+
+
+def _copy_database(source, target):
+    """用 SQLite 备份接口复制数据库（部分入口会写入，检查在副本上进行）"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+if __name__ == '__main__':
+    # 对指定数据库（默认 data/attendance.db）的副本打印查询计划，有热点查询全表扫描时返回 1
+    source_path = sys.argv[1] if len(sys.argv) > 1 else db.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.set_db_path(os.path.join(tmp_dir, 'query_plans.db'))
+        _copy_database(source_path, db.DB_PATH)
+        plan_report, plan_problems = check_all()
+        db.close_all()
+    for case_name, case_statements in plan_report.items():
+        print(f"== {case_name}")
+        for item in case_statements:
+            print(f"   {item['site']}: {item['sql'][:100]}")
+            for detail in item['plan']:
+                marker = '!!' if detail in item['violations'] else '  '
+                print(f"     {marker} {detail}")
+    for problem in plan_problems:
+        print(f"全表扫描: {problem}")
+    sys.exit(1 if plan_problems else 0)
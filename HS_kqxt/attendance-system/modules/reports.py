@@ -1,113 +1,85 @@
-import sqlite3
-import os
-from datetime import datetime
+import calendar
+from datetime import datetime, time
+from modules import archive, db, pagination, punches, rules
 
-# 数据库文件路径（与其他模块保持一致）
-DB_PATH = os.path.join("data", "attendance.db")
-
-def init_attendance_records():
-    """初始化考勤记录表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 创建考勤记录表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS attendance_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id TEXT NOT NULL,
-        check_in_time TIMESTAMP,
-        check_out_time TIMESTAMP,
-        work_hours REAL,
-        overtime_hours REAL,
-        status TEXT,
-        notes TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("考勤记录表初始化完成")
+# work_date 为出勤日期，check_in_ts/check_out_ts 为打卡时间的整数秒（见 migrations v2）
+def to_epoch(dt):
+    """把打卡时间转换为与 check_in_ts/check_out_ts 相同口径的整数秒"""
+    return calendar.timegm(dt.timetuple())
 
 def get_today_attendance():
     """获取今日出勤人数"""
     today = datetime.now().strftime('%Y-%m-%d')
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(DISTINCT employee_id) 
-        FROM attendance_records 
-        WHERE DATE(check_in_time) = ?
-    """, (today,))
-    count = cursor.fetchone()[0]
-    conn.close()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(DISTINCT employee_id) 
+            FROM attendance_records 
+            WHERE work_date = ?
+            AND check_in_ts IS NOT NULL
+        """, (today,))
+        count = cursor.fetchone()[0]
     return count
 
 def get_late_count():
     """获取今日迟到人数"""
     today = datetime.now().strftime('%Y-%m-%d')
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 获取考勤规则中的迟到阈值和上班时间
-    cursor.execute("SELECT late_threshold, work_start_time FROM attendance_rules ORDER BY updated_at DESC LIMIT 1")
-    rule = cursor.fetchone()
-    late_threshold = rule[0] if rule else 15  # 默认15分钟
-    work_start_time = rule[1] if rule else '09:00'  # 默认上班时间
-    
-    # 计算迟到时间阈值（上班时间 + 迟到阈值）
-    today_str = today
-    work_start_datetime = datetime.strptime(f"{today_str} {work_start_time}", "%Y-%m-%d %H:%M")
-    late_cutoff = work_start_datetime.timestamp() + (late_threshold * 60)
-    
-    # 查询今日迟到的员工
-    cursor.execute("""
-        SELECT COUNT(DISTINCT employee_id) 
-        FROM attendance_records 
-        WHERE DATE(check_in_time) = ?
-        AND strftime('%s', check_in_time) > ?
-    """, (today, late_cutoff))
-    
-    count = cursor.fetchone()[0]
-    conn.close()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # 迟到时间阈值（上班时间 + 迟到阈值），规则来自进程内缓存
+        rule_set = rules.get_rule_set()
+        late_threshold = rule_set.late_threshold if rule_set else 15  # 默认15分钟
+        work_start_time = rule_set.work_start if rule_set else time(9, 0)  # 默认上班时间
+        work_start_datetime = datetime.strptime(f"{today} {work_start_time:%H:%M}", "%Y-%m-%d %H:%M")
+        late_cutoff = to_epoch(work_start_datetime) + (late_threshold * 60)
+        
+        # 查询今日迟到的员工
+        cursor.execute("""
+            SELECT COUNT(DISTINCT employee_id) 
+            FROM attendance_records 
+            WHERE work_date = ?
+            AND check_in_ts > ?
+        """, (today, late_cutoff))
+        
+        count = cursor.fetchone()[0]
     return count
 
 def get_overtime_hours():
     """获取今日总加班小时数"""
     today = datetime.now().strftime('%Y-%m-%d')
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 查询今日所有记录的加班时长并求和
-    cursor.execute("""
-        SELECT SUM(overtime_hours) 
-        FROM attendance_records 
-        WHERE DATE(check_out_time) = ?
-        AND overtime_hours IS NOT NULL
-    """, (today,))
-    
-    total_overtime = cursor.fetchone()[0] or 0.0
-    conn.close()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # 查询今日所有记录的加班时长并求和（加班计入出勤日期，跨天下班不会漏算）
+        cursor.execute("""
+            SELECT SUM(overtime_hours) 
+            FROM attendance_records 
+            WHERE work_date = ?
+            AND check_out_ts IS NOT NULL
+            AND overtime_hours IS NOT NULL
+        """, (today,))
+        
+        total_overtime = cursor.fetchone()[0] or 0.0
     return round(total_overtime, 2)
 
 def get_recent_records(limit=10):
     """获取最近的打卡记录"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT ar.employee_id, e.name, e.department, 
-               ar.check_in_time, ar.check_out_time, 
-               ar.status, e.avatar
-        FROM attendance_records ar
-        JOIN employees e ON ar.employee_id = e.employee_id
-        ORDER BY ar.created_at DESC LIMIT ?
-    """, (limit,))
-    records = cursor.fetchall()
-    conn.close()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ar.employee_id, e.name, e.department, 
+                   ar.check_in_time, ar.check_out_time, 
+                   ar.status, e.avatar, ar.id
+            FROM attendance_records ar
+            JOIN employees e ON ar.employee_id = e.employee_id
+            ORDER BY ar.created_at DESC LIMIT ?
+        """, (limit,))
+        records = cursor.fetchall()
     
     return [
         {
+            'id': r[7],
             'avatar': r[6],
             'name': r[1],
             'department': r[2],
@@ -118,4 +90,103 @@ def get_recent_records(limit=10):
                            'bg-danger/10 text-danger' if r[5] in ['迟到', '早退'] else
                            'bg-warning/10 text-warning'
         } for r in records
-    ]
\ No newline at end of file
+    ]
+
+def _date_filters(column, start_date, end_date, conditions, params):
+    """追加日期范围条件"""
+    if start_date:
+        conditions.append(f"{column} >= ?")
+        params.append(str(start_date))
+    if end_date:
+        conditions.append(f"{column} <= ?")
+        params.append(str(end_date))
+
+def get_attendance_records_page(department=None, start_date=None, end_date=None, status=None,
+                                employee_id=None, cursor=None, limit=pagination.DEFAULT_PAGE_SIZE):
+    """
+    分页获取考勤记录（按出勤日期、记录 ID 倒序）
+    可按部门、日期范围、状态和员工筛选；cursor 为上一页返回的游标
+    返回 (记录字典列表, 下一页游标)，没有下一页时游标为 None
+    """
+    limit = pagination.page_size(limit)
+    conditions, params = ["ar.work_date IS NOT NULL"], []
+    _date_filters("ar.work_date", start_date, end_date, conditions, params)
+    if employee_id:
+        conditions.append("ar.employee_id = ?")
+        params.append(employee_id)
+    if department:
+        conditions.append("ar.employee_id IN (SELECT employee_id FROM employees WHERE department = ?)")
+        params.append(department)
+    if status:
+        conditions.append("ar.status = ?")
+        params.append(status)
+    keyset, keyset_params = pagination.keyset_condition(['ar.work_date', 'ar.id'], cursor)
+    if keyset:
+        conditions.append(keyset)
+        params.extend(keyset_params)
+    
+    query = f"""
+        SELECT ar.id, ar.employee_id, e.name, e.department, ar.work_date,
+               ar.check_in_time, ar.check_out_time, ar.work_hours, ar.overtime_hours,
+               ar.status, ar.punches
+        FROM {{schema}}.attendance_records ar
+        LEFT JOIN employees e ON ar.employee_id = e.employee_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY ar.work_date DESC, ar.id DESC
+    """
+    # 已归档月份的记录在 data/archive/ 的按月文件中，只附加与日期范围重叠的月份
+    with db.get_connection() as conn:
+        rows, next_cursor = archive.fetch_page(conn, query, params, limit, ['work_date', 'id'],
+                                               start_date, end_date, cursor)
+    # 打卡时间以二进制保存，返回前转换为 'HH:MM;次日HH:MM' 字符串
+    for row in rows:
+        row['check_times'] = punches.to_text(row.pop('punches'))
+    return rows, next_cursor
+
+# 班次处理结果表
+SHIFT_RECORD_TABLES = {
+    'morning': 'production_morning_records',
+    'logistics': 'logistics_records',
+}
+
+def get_shift_records_page(kind='morning', department=None, start_date=None, end_date=None,
+                           status=None, cursor=None, limit=pagination.DEFAULT_PAGE_SIZE):
+    """
+    分页获取班次处理结果（kind: morning 生产部早班 / logistics 后勤部），按日期、ID 倒序
+    返回 (记录字典列表, 下一页游标)，没有下一页时游标为 None
+    """
+    table = SHIFT_RECORD_TABLES.get(kind)
+    if not table:
+        raise ValueError(f"未知的班次记录类型: {kind}")
+    limit = pagination.page_size(limit)
+    conditions, params = [], []
+    _date_filters("r.check_date", start_date, end_date, conditions, params)
+    if department:
+        conditions.append("r.employee_id IN (SELECT employee_id FROM employees WHERE department = ?)")
+        params.append(department)
+    if status:
+        conditions.append("r.status = ?")
+        params.append(status)
+    keyset, keyset_params = pagination.keyset_condition(['r.check_date', 'r.id'], cursor)
+    if keyset:
+        conditions.append(keyset)
+        params.extend(keyset_params)
+    
+    query = f"""
+        SELECT r.*, e.name, e.department
+        FROM {{schema}}.{table} r
+        LEFT JOIN employees e ON r.employee_id = e.employee_id
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.check_date DESC, r.id DESC"
+    with db.get_connection() as conn:
+        rows, next_cursor = archive.fetch_page(conn, query, params, limit, ['check_date', 'id'],
+                                               start_date, end_date, cursor)
+    # 早班结果的打卡时间以二进制保存，返回前转换回字符串
+    for row in rows:
+        if 'original_punches' in row:
+            blob = row.pop('original_punches')
+            if blob:
+                row['original_check_times'] = punches.to_text(blob)
+    return rows, next_cursor
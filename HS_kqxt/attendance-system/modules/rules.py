@@ -1,107 +1,245 @@
-import sqlite3
-import os
-from datetime import datetime, time
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+from modules import db, dashboard, punches, summaries
 
-# 数据库文件路径（与其他模块保持一致）
-DB_PATH = os.path.join("data", "attendance.db")
+# 解析后的考勤规则：时间字段为 datetime.time，work_days 为 1-7 的集合，raw 为原始行
+# version_id / effective_from / department 为规则版本的 id、生效日期和适用部门（None 为全部部门）
+RuleSet = namedtuple('RuleSet', [
+    'version', 'updated_at',
+    'work_start', 'work_end', 'lunch_start', 'lunch_end', 'overtime_start',
+    'late_threshold', 'early_leave_threshold', 'daily_standard_hours',
+    'work_days', 'raw',
+    'version_id', 'effective_from', 'department',
+], defaults=(None, None, None))
 
-def init_attendance_rules():
-    """初始化考勤规则表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 创建考勤规则表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS attendance_rules (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        work_start_time TIME NOT NULL DEFAULT '09:00',  -- 上班时间
-        work_end_time TIME NOT NULL DEFAULT '18:00',    -- 下班时间
-        late_threshold INTEGER NOT NULL DEFAULT 15,     -- 迟到阈值(分钟)
-        early_leave_threshold INTEGER NOT NULL DEFAULT 15,  -- 早退阈值(分钟)
-        lunch_start_time TIME NOT NULL DEFAULT '12:00', -- 午休开始时间
-        lunch_end_time TIME NOT NULL DEFAULT '13:00',   -- 午休结束时间
-        overtime_start_time TIME NOT NULL DEFAULT '19:00',  -- 加班开始时间
-        daily_standard_hours REAL NOT NULL DEFAULT 8.0,  -- 每日标准工时(小时)
-        work_days TEXT NOT NULL DEFAULT '1,2,3,4,5',    -- 工作日(1-周一, 7-周日)
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- 最后更新时间
+# 可修改的规则字段
+RULE_FIELDS = [
+    'work_start_time', 'work_end_time', 'late_threshold',
+    'early_leave_threshold', 'lunch_start_time', 'lunch_end_time',
+    'overtime_start_time', 'daily_standard_hours', 'work_days'
+]
+
+# 规则版本的查询列（updated_at 沿用旧 attendance_rules 的字段名，前端据此显示）
+RULE_VERSION_COLUMNS = (
+    "id, " + ", ".join(RULE_FIELDS) + ", effective_from, department, created_at AS updated_at"
+)
+
+# 检查版本表是否被其他进程修改的最短间隔(秒)：间隔内直接使用缓存，热循环中查规则不访问数据库
+RULES_CHECK_SECONDS = 1.0
+
+_rules_lock = threading.Lock()
+_rules_cache = {
+    'key': None,      # (数据库代数, 规则版本, 版本表标记)，任一变化即重新读取
+    'versions': None,
+    'checked': 0.0,   # 上次确认版本表标记的时间（monotonic）
+}
+_rules_version = 0    # update_attendance_rules 每次成功更新后递增（只对本进程有效）
+
+
+def _parse_rule_set(rule, version):
+    """把一个规则版本行解析为 RuleSet，时间格式不对时抛出 ValueError"""
+    def parse_time(value):
+        return datetime.strptime(value, '%H:%M').time()
+
+    work_days = frozenset(
+        int(day) for day in (rule.get('work_days') or '1,2,3,4,5').split(',')
+        if day.strip().isdigit()
     )
-    ''')
-    
-    # 检查是否存在默认规则，不存在则创建
-    cursor.execute("SELECT id FROM attendance_rules LIMIT 1")
-    if not cursor.fetchone():
-        cursor.execute('''
-        INSERT INTO attendance_rules DEFAULT VALUES
-        ''')
-        print("已创建默认考勤规则")
-    
-    conn.commit()
-    conn.close()
-    print("考勤规则表初始化完成")
+    return RuleSet(
+        version=version,
+        updated_at=rule.get('updated_at'),
+        work_start=parse_time(rule['work_start_time']),
+        work_end=parse_time(rule['work_end_time']),
+        lunch_start=parse_time(rule['lunch_start_time']),
+        lunch_end=parse_time(rule['lunch_end_time']),
+        overtime_start=parse_time(rule['overtime_start_time']),
+        late_threshold=rule['late_threshold'],
+        early_leave_threshold=rule['early_leave_threshold'],
+        daily_standard_hours=rule['daily_standard_hours'],
+        work_days=work_days,
+        raw=rule,
+        version_id=rule.get('id'),
+        effective_from=rule.get('effective_from'),
+        department=rule.get('department'),
+    )
+
+
+def _load_rule_versions():
+    """从数据库读取全部规则版本行，按生效日期、id 升序"""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {RULE_VERSION_COLUMNS} FROM attendance_rule_versions ORDER BY effective_from, id"
+        )
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _versions_stamp():
+    """规则版本表的标记：版本只追加不修改，其他进程（如独立的任务进程）新增版本后标记即变化"""
+    with db.get_connection() as conn:
+        return conn.execute("SELECT COUNT(*), MAX(id) FROM attendance_rule_versions").fetchone()
+
+
+def get_rule_versions():
+    """
+    获取全部已解析的规则版本（RuleSet 元组，按生效日期、id 升序）
+    结果在进程内缓存，本进程更新规则或切换数据库后立即重新读取；
+    其他进程新增的版本最多 RULES_CHECK_SECONDS 秒后读到
+    """
+    local_key = (db.pool_generation(), _rules_version)
+    now = monotonic()
+    with _rules_lock:
+        cached = _rules_cache['key']
+        if cached is not None and cached[:2] == local_key and now - _rules_cache['checked'] < RULES_CHECK_SECONDS:
+            return _rules_cache['versions']
+
+    key = local_key + (_versions_stamp(),)
+    with _rules_lock:
+        if _rules_cache['key'] == key:
+            _rules_cache['checked'] = now
+            return _rules_cache['versions']
+
+    versions = tuple(_parse_rule_set(rule, key[1]) for rule in _load_rule_versions())
+
+    with _rules_lock:
+        # 读取期间本进程修改了规则时不写回缓存，下次调用重新读取
+        if key[:2] == (db.pool_generation(), _rules_version):
+            _rules_cache['key'] = key
+            _rules_cache['versions'] = versions
+            _rules_cache['checked'] = now
+    return versions
+
+
+def rule_set_for(day, department=None, versions=None):
+    """
+    某部门某天适用的规则版本：该部门已生效的专用版本优先，其次为已生效的全部门版本
+    day 为 date 或 'YYYY-MM-DD'，没有适用的规则返回 None
+    """
+    versions = get_rule_versions() if versions is None else versions
+    day = str(day)
+    fallback = None
+    for rule_set in reversed(versions):
+        if rule_set.effective_from > day:
+            continue
+        if rule_set.department is not None and rule_set.department == department:
+            return rule_set
+        if rule_set.department is None and fallback is None:
+            fallback = rule_set
+    return fallback
+
+
+def rule_resolver(versions=None):
+    """返回按 (日期, 部门) 查找规则版本的函数，批量处理时同一键只查找一次"""
+    versions = get_rule_versions() if versions is None else versions
+    resolved = {}
+
+    def resolve(day, department=None):
+        key = (str(day), department)
+        if key not in resolved:
+            resolved[key] = rule_set_for(key[0], department, versions)
+        return resolved[key]
+
+    return resolve
+
+
+def get_rule_set():
+    """获取今天对全部部门生效的考勤规则（RuleSet），没有规则时返回 None"""
+    return rule_set_for(date.today())
+
+
+def invalidate_rules_cache():
+    """使考勤规则缓存失效（直接修改 attendance_rule_versions 表后调用）"""
+    global _rules_version
+    with _rules_lock:
+        _rules_version += 1
+
 
 def get_attendance_rules():
-    """获取当前考勤规则"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT * FROM attendance_rules ORDER BY updated_at DESC LIMIT 1
-    ''')
-    
-    rule = cursor.fetchone()
-    if not rule:
-        conn.close()
+    """获取当前考勤规则（字典副本，来自进程内缓存）"""
+    rule_set = get_rule_set()
+    return dict(rule_set.raw) if rule_set else None
+
+
+def _next_version_date(effective_from, department):
+    """同一适用范围内晚于 effective_from 的下一个版本的生效日期，没有返回 None"""
+    for rule_set in get_rule_versions():
+        if rule_set.department == department and rule_set.effective_from > effective_from:
+            return rule_set.effective_from
+    return None
+
+
+def schedule_recompute(effective_from, department=None):
+    """
+    为新规则版本安排重新计算：只涉及生效日期到同范围下一个版本之前的日期，
+    部门专用版本只涉及该部门。范围内没有考勤记录时不安排，返回任务 id 或 None
+    """
+    next_date = _next_version_date(effective_from, department)
+    end_date = str(date.fromisoformat(next_date) - timedelta(days=1)) if next_date else None
+
+    conditions, params = ["work_date >= ?"], [effective_from]
+    if end_date:
+        conditions.append("work_date <= ?")
+        params.append(end_date)
+    if department is not None:
+        conditions.append("employee_id IN (SELECT employee_id FROM employees WHERE department = ?)")
+        params.append(department)
+    with db.get_connection() as conn:
+        affected = conn.execute(
+            f"SELECT 1 FROM attendance_records WHERE {' AND '.join(conditions)} LIMIT 1", params
+        ).fetchone()
+    if not affected:
         return None
-    
-    # 转换为字典
-    columns = [desc[0] for desc in cursor.description]
-    result = dict(zip(columns, rule))
-    
-    conn.close()
-    return result
 
-def update_attendance_rules(rule_data):
-    """更新考勤规则"""
+    from modules import jobs
+    job_id, _ = jobs.submit_recompute(
+        effective_from, end_date, [department] if department is not None else None
+    )
+    return job_id
+
+
+def update_attendance_rules(rule_data, effective_from=None, department=None, created_by=None):
+    """
+    新增一个考勤规则版本（不修改已有版本，之前的日期继续使用当时的规则）
+    effective_from: 生效日期，默认今天；department: 只对该部门生效，默认全部部门
+    未提供的字段沿用生效日期当天该范围适用的规则；受影响的已有记录由后台任务重新计算
+    """
+    fields = {key: value for key, value in rule_data.items() if key in RULE_FIELDS}
+    if not fields:
+        return True, "没有需要更新的字段"
+    effective_from = str(effective_from or date.today())
+
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 构建更新语句
-        update_fields = []
-        values = []
-        
-        valid_fields = [
-            'work_start_time', 'work_end_time', 'late_threshold',
-            'early_leave_threshold', 'lunch_start_time', 'lunch_end_time',
-            'overtime_start_time', 'daily_standard_hours', 'work_days'
-        ]
-        
-        for key, value in rule_data.items():
-            if key in valid_fields:
-                update_fields.append(f"{key} = ?")
-                values.append(value)
-        
-        if not update_fields:
-            conn.close()
-            return True, "没有需要更新的字段"
-        
-        # 获取最新的规则ID（假设我们只维护一条规则记录）
-        cursor.execute("SELECT id FROM attendance_rules ORDER BY updated_at DESC LIMIT 1")
-        rule_id = cursor.fetchone()[0]
-        
-        values.append(rule_id)
-        query = f"UPDATE attendance_rules SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
-        
-        cursor.execute(query, tuple(values))
-        conn.commit()
-        conn.close()
-        return True, "考勤规则更新成功"
-    
+        date.fromisoformat(effective_from)
+        base = rule_set_for(effective_from, department)
+        if base is None:
+            return False, "未找到考勤规则"
+        rule = {key: base.raw[key] for key in RULE_FIELDS}
+        rule.update(fields)
+        # 先解析一次，时间格式不对时不写入
+        _parse_rule_set(rule, None)
+
+        with db.get_connection() as conn:
+            conn.execute(
+                f"INSERT INTO attendance_rule_versions "
+                f"(effective_from, department, created_by, {', '.join(RULE_FIELDS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in RULE_FIELDS)})",
+                [effective_from, department, created_by] + [rule[key] for key in RULE_FIELDS]
+            )
+
+        invalidate_rules_cache()
+        dashboard.invalidate_cache()
+        job_id = schedule_recompute(effective_from, department)
     except Exception as e:
-        conn.rollback()
-        conn.close()
         return False, f"更新失败: {str(e)}"
 
+    msg = f"考勤规则更新成功，自 {effective_from} 起生效"
+    if job_id:
+        msg += f"，受影响的考勤记录将重新计算（任务 #{job_id}）"
+    return True, msg
+
 def is_work_day(weekday):
     """
     检查指定星期是否为工作日
@@ -110,12 +248,11 @@ def is_work_day(weekday):
     # 转换为1-7格式（1=周一，7=周日）
     converted_weekday = weekday + 1
     
-    rules = get_attendance_rules()
-    if not rules:
+    rule_set = get_rule_set()
+    if not rule_set:
         return False
         
-    work_days = rules.get('work_days', '1,2,3,4,5')
-    return str(converted_weekday) in work_days.split(',')
+    return converted_weekday in rule_set.work_days
 
 def calculate_work_hours(check_in, check_out, lunch_start, lunch_end):
     """
@@ -221,66 +358,8 @@ def check_attendance_status(check_in, check_out, rules):
     
     return status
 
-import os
-import sqlite3
 from datetime import datetime, time, timedelta
 
-# 数据库路径
-DB_PATH = os.path.join("data", "attendance.db")
-
-def init_shift_tables():
-    """初始化班次和打卡规则表"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 创建班次表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS shifts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,  -- 班次名称：早班、中班、夜班
-        department TEXT NOT NULL,   -- 所属部门
-        system_rest_time TIME NOT NULL,  -- 系统休息时间
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # 创建详细打卡规则表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS shift_rules (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        shift_id INTEGER NOT NULL,
-        rule_type TEXT NOT NULL,  -- 上班、午休、下班等
-        start_time TIME,
-        end_time TIME,
-        processing_logic TEXT NOT NULL,  -- 处理逻辑标识
-        FOREIGN KEY (shift_id) REFERENCES shifts(id)
-    )
-    ''')
-    
-    # 创建生产部早班记录特殊表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS production_morning_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id TEXT NOT NULL,
-        check_date DATE NOT NULL,
-        original_check_times TEXT NOT NULL,  -- 原始打卡时间，分号分隔
-        work_start_time TIME,  -- 计算后的上班时间
-        work_end_time TIME,    -- 计算后的下班时间
-        noon_leave_time TIME,  -- 午休下班时间
-        noon_start_time TIME,  -- 午休上班时间
-        day_overtime_hours REAL DEFAULT 0,  -- 白天加班时长
-        night_overtime_hours REAL DEFAULT 0,  -- 晚上加班时长
-        status TEXT,  -- 出勤状态
-        status_note TEXT,  -- 状态说明
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print("班次相关表初始化完成")
-
 def process_morning_shift(employee_id, check_date, check_times_str):
     """
     处理生产部早班打卡记录
@@ -291,18 +370,22 @@ def process_morning_shift(employee_id, check_date, check_times_str):
     # 系统休息时间：次日05:00
     system_rest_time = time(5, 0)
     
-    # 解析打卡时间
+    # 解析打卡时间，“次日HH:MM”单独存放（只可能是跨零点的下班卡）
     check_times = []
+    next_day_times = []
     for time_str in check_times_str.split(';'):
+        time_str = time_str.strip()
+        target = next_day_times if time_str.startswith('次日') else check_times
         try:
             # 假设时间格式为HH:MM
-            check_time = datetime.strptime(time_str.strip(), "%H:%M").time()
-            check_times.append(check_time)
+            check_time = datetime.strptime(time_str[2:] if target is next_day_times else time_str, "%H:%M").time()
+            target.append(check_time)
         except ValueError:
             continue  # 跳过无效时间格式
     
     # 排序打卡时间
     check_times.sort()
+    next_day_times.sort()
     
     result = {
         'employee_id': employee_id,
@@ -369,21 +452,24 @@ def process_morning_shift(employee_id, check_date, check_times_str):
     # 处理下午17:30下班打卡
     evening_checks = [t for t in check_times if is_time_between(t, time(13,30), system_rest_time)]
     evening_checks += [t for t in check_times if is_time_between(t, time(0,0), system_rest_time)]  # 跨天的情况
+    next_day_checks = [t for t in next_day_times if t <= system_rest_time]
     
-    if evening_checks:
-        # 取最后一次打卡作为下班时间
-        last_evening = evening_checks[-1]
+    if evening_checks or next_day_checks:
+        # 取最后一次打卡作为下班时间，有次日打卡时取次日的最后一次
+        last_evening = next_day_checks[-1] if next_day_checks else evening_checks[-1]
         
         # 打卡时间取整点
         rounded_time = round_time_to_hour(last_evening)
         result['work_end_time'] = rounded_time
         
-        # 计算晚上加班时长
+        # 计算晚上加班时长（次日下班加上 24 小时）
         work_end_std = time(17, 30)
-        if last_evening > work_end_std:
+        if next_day_checks or last_evening > work_end_std:
             # 计算分钟差
             overtime_minutes = (rounded_time.hour - work_end_std.hour) * 60
             overtime_minutes += (rounded_time.minute - work_end_std.minute)
+            if next_day_checks:
+                overtime_minutes += 24 * 60
             result['night_overtime_hours'] = round(overtime_minutes / 60, 1)
     else:
         # 未打卡记为缺卡
@@ -396,31 +482,53 @@ def process_morning_shift(employee_id, check_date, check_times_str):
 
 def save_morning_shift_result(result):
     """保存早班处理结果到数据库"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    INSERT INTO production_morning_records 
-    (employee_id, check_date, original_check_times, work_start_time, work_end_time,
-     noon_leave_time, noon_start_time, day_overtime_hours, night_overtime_hours,
-     status, status_note)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    save_morning_shift_results([result])
+
+def _format_time(value):
+    """time 转换为 HH:MM 字符串，None 保持不变"""
+    return value.strftime("%H:%M") if value else None
+
+def save_morning_shift_results(results):
+    """
+    批量保存早班处理结果，同一员工同一天已有记录时覆盖
+    所有结果在一个事务内写入，重复处理同一个月不会产生重复行
+    """
+    # 打卡时间只保存二进制格式（modules.punches）
+    rows = [(
         result['employee_id'],
         result['check_date'],
-        result['original_check_times'],
-        result['work_start_time'].strftime("%H:%M") if result['work_start_time'] else None,
-        result['work_end_time'].strftime("%H:%M") if result['work_end_time'] else None,
-        result['noon_leave_time'].strftime("%H:%M") if result['noon_leave_time'] else None,
-        result['noon_start_time'].strftime("%H:%M") if result['noon_start_time'] else None,
+        result['original_punches'] if 'original_punches' in result
+        else punches.pack_text(result['original_check_times']),
+        _format_time(result['work_start_time']),
+        _format_time(result['work_end_time']),
+        _format_time(result['noon_leave_time']),
+        _format_time(result['noon_start_time']),
         result['day_overtime_hours'],
         result['night_overtime_hours'],
         result['status'],
         result['status_note']
-    ))
-    
-    conn.commit()
-    conn.close()
+    ) for result in results]
+    
+    with db.get_connection() as conn:
+        conn.executemany('''
+        INSERT INTO production_morning_records 
+        (employee_id, check_date, original_punches,
+         work_start_time, work_end_time, noon_leave_time, noon_start_time,
+         day_overtime_hours, night_overtime_hours, status, status_note)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(employee_id, check_date) DO UPDATE SET
+            original_punches = excluded.original_punches,
+            work_start_time = excluded.work_start_time,
+            work_end_time = excluded.work_end_time,
+            noon_leave_time = excluded.noon_leave_time,
+            noon_start_time = excluded.noon_start_time,
+            day_overtime_hours = excluded.day_overtime_hours,
+            night_overtime_hours = excluded.night_overtime_hours,
+            status = excluded.status,
+            status_note = excluded.status_note
+        ''', rows)
+        summaries.refresh_dirty()
+    return len(rows)
 
 def is_time_between(check_time, start_time, end_time):
     """检查时间是否在指定区间内"""
@@ -448,40 +556,34 @@ def process_logistics_department(employee_id, check_date, check_times_str):
     
     status = "出勤" if has_check_in else "休息"
     
-    # 保存结果
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # 确保有后勤部打卡记录表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS logistics_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id TEXT NOT NULL,
-        check_date DATE NOT NULL,
-        has_check_in INTEGER NOT NULL,  -- 1表示有打卡，0表示无打卡
-        status TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
-    )
-    ''')
-    
-    cursor.execute('''
-    INSERT INTO logistics_records 
-    (employee_id, check_date, has_check_in, status)
-    VALUES (?, ?, ?, ?)
-    ''', (
-        employee_id,
-        check_date,
-        1 if has_check_in else 0,
-        status
-    ))
-    
-    conn.commit()
-    conn.close()
-    
-    return {
+    result = {
         'employee_id': employee_id,
         'check_date': check_date,
         'status': status,
         'has_check_in': has_check_in
-    }
\ No newline at end of file
+    }
+    
+    # 保存结果
+    save_logistics_results([result])
+    
+    return result
+
+def save_logistics_results(results):
+    """批量保存后勤部处理结果，同一员工同一天已有记录时覆盖"""
+    rows = [(
+        result['employee_id'],
+        result['check_date'],
+        1 if result['has_check_in'] else 0,
+        result['status']
+    ) for result in results]
+    
+    with db.get_connection() as conn:
+        conn.executemany('''
+        INSERT INTO logistics_records 
+        (employee_id, check_date, has_check_in, status)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(employee_id, check_date) DO UPDATE SET
+            has_check_in = excluded.has_check_in,
+            status = excluded.status
+        ''', rows)
+    return len(rows)
\ No newline at end of file
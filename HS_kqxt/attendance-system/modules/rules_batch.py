@@ -0,0 +1,314 @@
+import calendar
+from datetime import datetime, timedelta
+import numpy as np
+from modules import dashboard, db, punches as punch_codec, rules, summaries
+
+SECONDS_PER_DAY = 24 * 3600
+
+# 批量结果中的状态编码，与导入时的状态判断一致
+STATUS_NORMAL, STATUS_LATE, STATUS_EARLY_LEAVE, STATUS_MISSING = 0, 1, 2, 3
+STATUS_NAMES = np.array(['正常', '迟到', '早退', '缺卡'], dtype=object)
+
+
+def _seconds_of(value):
+    """datetime.time 转换为一天中的秒数"""
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def to_seconds(values):
+    """
+    把一列打卡时间转换为整数秒（与 check_in_ts/check_out_ts 同口径）
+    支持 datetime64 数组（NaT 为无打卡）和整数秒数组（NaN/None 为无打卡）
+    返回 (seconds, valid)
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        valid = ~np.isnat(values)
+        seconds = values.astype('datetime64[s]').astype(np.int64)
+    else:
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        seconds = np.where(valid, values, 0).astype(np.int64)
+    return np.where(valid, seconds, 0), valid
+
+
+def _round_hours(values):
+    """
+    保留两位小数，逐个使用内置 round，保证与单条计算写入的值完全一致
+    （np.round 先乘 100 再取整，在 x.xx5 附近与 round 结果不同）
+    """
+    return np.fromiter((round(v, 2) for v in values.tolist()), dtype=np.float64, count=len(values))
+
+
+def _day_start(seconds):
+    """每个时间所在日期零点的秒数"""
+    return seconds - seconds % SECONDS_PER_DAY
+
+
+def calculate_work_hours_batch(check_in, check_out, valid_in, valid_out, lunch_start, lunch_end):
+    """
+    批量计算实际工作时长（扣除与午休重叠的部分），与 rules.calculate_work_hours 一致
+    check_in/check_out 为整数秒数组，lunch_start/lunch_end 为 datetime.time
+    """
+    day = _day_start(check_in)
+    overlap_start = np.maximum(check_in, day + _seconds_of(lunch_start))
+    overlap_end = np.minimum(check_out, day + _seconds_of(lunch_end))
+    # 与单条计算相同的运算顺序（先换算分钟再换算小时），保证浮点结果一致
+    lunch_overlap = np.maximum(0, (overlap_end - overlap_start) / 60)
+    hours = ((check_out - check_in) / 60 - lunch_overlap) / 60
+    return np.where(valid_in & valid_out, _round_hours(hours), 0.0)
+
+
+def calculate_overtime_batch(check_out, valid_out, work_end, lunch_end, overtime_start):
+    """批量计算加班时长，与 rules.calculate_overtime 一致"""
+    day = _day_start(check_out)
+    base = day + max(_seconds_of(work_end), _seconds_of(lunch_end))
+    calc_start = np.maximum(base, day + _seconds_of(overtime_start))
+    hours = (check_out - calc_start) / 3600
+    return np.where(valid_out & (check_out > calc_start), _round_hours(hours), 0.0)
+
+
+def check_attendance_status_batch(check_in, check_out, rule_set):
+    """
+    批量计算考勤状态、迟到/早退分钟数、工作时长和加班时长
+    check_in/check_out: datetime64 数组或整数秒数组，缺卡为 NaT/NaN
+    rule_set: rules.get_rule_set() 返回的已解析规则
+    返回各列的 NumPy 数组，status 为状态编码（见 STATUS_NAMES）
+    """
+    check_in, valid_in = to_seconds(check_in)
+    check_out, valid_out = to_seconds(check_out)
+
+    # 迟到/早退分钟数按整分钟截断，超过阈值才计为迟到/早退
+    late_seconds = check_in - (_day_start(check_in) + _seconds_of(rule_set.work_start))
+    late_minutes = np.where(valid_in & (late_seconds > 0), late_seconds // 60, 0)
+    is_late = valid_in & (late_seconds > rule_set.late_threshold * 60)
+
+    early_seconds = _day_start(check_out) + _seconds_of(rule_set.work_end) - check_out
+    early_minutes = np.where(valid_out & (early_seconds > 0), early_seconds // 60, 0)
+    is_early_leave = valid_out & (early_seconds > rule_set.early_leave_threshold * 60)
+
+    status = np.full(len(check_in), STATUS_NORMAL, dtype=np.int8)
+    status[is_early_leave] = STATUS_EARLY_LEAVE
+    status[is_late] = STATUS_LATE
+    status[~valid_out] = STATUS_MISSING
+
+    return {
+        'status': status,
+        'is_late': is_late,
+        'is_early_leave': is_early_leave,
+        'late_minutes': late_minutes,
+        'early_minutes': early_minutes,
+        'work_hours': calculate_work_hours_batch(
+            check_in, check_out, valid_in, valid_out, rule_set.lunch_start, rule_set.lunch_end
+        ),
+        'overtime_hours': calculate_overtime_batch(
+            check_out, valid_out, rule_set.work_end, rule_set.lunch_end, rule_set.overtime_start
+        ),
+    }
+
+
+def _time_text(seconds):
+    """整数秒转换为 'YYYY-MM-DD HH:MM:SS'（与 check_in_time/check_out_time 同口径）"""
+    return (datetime(1970, 1, 1) + timedelta(seconds=int(seconds))).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_records(entries):
+    """
+    把一批员工日打卡转换为 attendance_records 的行元组（列顺序见 import_excel.write_records）
+    entries: [(员工号, 出勤日期 date, 升序打卡分钟数, 当天适用的规则版本), ...]
+    第一次打卡为上班、最后一次为下班（只有一次打卡时缺下班卡），按规则版本分组批量计算状态、工时和加班
+    """
+    count = len(entries)
+    if count == 0:
+        return []
+    day_start = np.fromiter((calendar.timegm(day.timetuple()) for _, day, _, _ in entries),
+                            dtype=np.int64, count=count)
+    check_in = day_start + np.fromiter((punches[0] for _, _, punches, _ in entries),
+                                       dtype=np.int64, count=count) * 60
+    check_out = day_start + np.fromiter(
+        (punches[-1] if len(punches) > 1 else np.nan for _, _, punches, _ in entries),
+        dtype=np.float64, count=count) * 60
+
+    groups = {}
+    for index, (_, _, _, rule_set) in enumerate(entries):
+        groups.setdefault(rule_set.version_id, (rule_set, []))[1].append(index)
+    status = np.empty(count, dtype=np.int8)
+    work_hours = np.empty(count)
+    overtime_hours = np.empty(count)
+    for rule_set, indexes in groups.values():
+        indexes = np.array(indexes)
+        batch = check_attendance_status_batch(check_in[indexes], check_out[indexes], rule_set)
+        status[indexes] = batch['status']
+        work_hours[indexes] = batch['work_hours']
+        overtime_hours[indexes] = batch['overtime_hours']
+
+    records = []
+    for i, (employee_id, day, punches, rule_set) in enumerate(entries):
+        has_out = len(punches) > 1
+        records.append((
+            employee_id,
+            _time_text(check_in[i]),
+            _time_text(check_out[i]) if has_out else None,
+            day.isoformat(),
+            int(check_in[i]),
+            int(check_out[i]) if has_out else None,
+            float(work_hours[i]),
+            float(overtime_hours[i]),
+            STATUS_NAMES[status[i]],
+            punch_codec.pack(punches),
+            rule_set.version_id,
+        ))
+    return records
+
+
+def load_range_timestamps(start_date, end_date):
+    """
+    读取一段日期内全部考勤记录的员工号、出勤日期、部门和打卡秒数
+    返回 (employee_ids, work_dates, departments, check_in, check_out)
+    """
+    with db.get_connection() as conn:
+        rows = conn.execute('''
+            SELECT ar.employee_id, ar.work_date, e.department, ar.check_in_ts, ar.check_out_ts
+            FROM attendance_records ar
+            LEFT JOIN employees e ON e.employee_id = ar.employee_id
+            WHERE ar.work_date BETWEEN ? AND ?
+        ''', (str(start_date), str(end_date))).fetchall()
+
+    employee_ids = np.array([r[0] for r in rows], dtype=object)
+    work_dates = [r[1] for r in rows]
+    departments = [r[2] for r in rows]
+    check_in = np.array([r[3] for r in rows], dtype=np.float64)
+    check_out = np.array([r[4] for r in rows], dtype=np.float64)
+    return employee_ids, work_dates, departments, check_in, check_out
+
+
+def _batch_by_rule(work_dates, departments, check_in, check_out, resolve):
+    """
+    按每行 (日期, 部门) 当时生效的规则版本分组批量计算，结果按原顺序放回
+    没有适用规则的行状态为正常、各项为 0
+    """
+    groups = {}
+    for index, (work_date, department) in enumerate(zip(work_dates, departments)):
+        rule_set = resolve(work_date, department)
+        if rule_set is not None:
+            groups.setdefault(rule_set.version_id, (rule_set, []))[1].append(index)
+
+    count = len(check_in)
+    result = {
+        'status': np.full(count, STATUS_NORMAL, dtype=np.int8),
+        'is_late': np.zeros(count, dtype=bool),
+        'is_early_leave': np.zeros(count, dtype=bool),
+        'work_hours': np.zeros(count),
+        'overtime_hours': np.zeros(count),
+    }
+    for rule_set, indexes in groups.values():
+        indexes = np.array(indexes)
+        batch = check_attendance_status_batch(check_in[indexes], check_out[indexes], rule_set)
+        for key, values in result.items():
+            values[indexes] = batch[key]
+    return result
+
+
+def month_close(start_date, end_date):
+    """
+    月度结算：一次向量化计算一段日期内所有员工的出勤天数、迟到/早退次数、工时和加班
+    每天按员工部门使用当时生效的规则版本；返回 {员工号: {...}}
+    """
+    employee_ids, work_dates, departments, check_in, check_out = load_range_timestamps(start_date, end_date)
+    if len(employee_ids) == 0:
+        return {}
+
+    batch = _batch_by_rule(work_dates, departments, check_in, check_out, rules.rule_resolver())
+    keys, owner = np.unique(employee_ids, return_inverse=True)
+
+    def total(values):
+        return np.bincount(owner, weights=values, minlength=len(keys))
+
+    days = np.bincount(owner, minlength=len(keys))
+    late = total(batch['is_late'].astype(np.float64))
+    early = total(batch['is_early_leave'].astype(np.float64))
+    missing = total((batch['status'] == STATUS_MISSING).astype(np.float64))
+    work_hours = total(batch['work_hours'])
+    overtime_hours = total(batch['overtime_hours'])
+
+    return {
+        employee_id: {
+            'attendance_days': int(days[i]),
+            'late_count': int(late[i]),
+            'early_leave_count': int(early[i]),
+            'missing_count': int(missing[i]),
+            'work_hours': round(float(work_hours[i]), 2),
+            'overtime_hours': round(float(overtime_hours[i]), 2),
+        } for i, employee_id in enumerate(keys)
+    }
+
+
+# 重新计算时每个写事务更新的记录数
+RECOMPUTE_BATCH_SIZE = 5000
+
+
+def _stale_rows(rows, resolve):
+    """
+    按 (日期, 部门) 找出计算时使用的规则版本与当前应使用的版本不同的记录
+    返回 {规则版本 id: (规则版本, [行, ...])}
+    """
+    groups = {}
+    for row in rows:
+        rule_set = resolve(row[1], row[2])
+        if rule_set is not None and row[5] != rule_set.version_id:
+            groups.setdefault(rule_set.version_id, (rule_set, []))[1].append(row)
+    return groups
+
+
+def recompute_range(start_date, end_date=None, departments=None, progress=None):
+    """
+    按各日期、部门当时生效的规则版本重新计算考勤状态、工时和加班
+    只处理记录的规则版本与应使用版本不一致的行（规则版本写入后不再修改，版本一致即结果有效）
+    end_date 为 None 表示不限结束日期；departments 为 None 表示全部部门
+    progress 为可选回调 progress(已处理数, 总数)；返回更新的记录数
+    """
+    conditions, params = ["ar.work_date >= ?"], [str(start_date)]
+    if end_date:
+        conditions.append("ar.work_date <= ?")
+        params.append(str(end_date))
+    if departments:
+        conditions.append(f"e.department IN ({', '.join('?' for _ in departments)})")
+        params.extend(departments)
+    with db.get_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT ar.id, ar.work_date, e.department, ar.check_in_ts, ar.check_out_ts,
+                   ar.rule_version_id
+            FROM attendance_records ar
+            LEFT JOIN employees e ON e.employee_id = ar.employee_id
+            WHERE {' AND '.join(conditions)}
+        ''', params).fetchall()
+
+    groups = _stale_rows(rows, rules.rule_resolver())
+    total = sum(len(group) for _, group in groups.values())
+    updates = []
+    for rule_set, group in groups.values():
+        check_in = np.array([row[3] for row in group], dtype=np.float64)
+        check_out = np.array([row[4] for row in group], dtype=np.float64)
+        batch = check_attendance_status_batch(check_in, check_out, rule_set)
+        updates.extend(zip(
+            STATUS_NAMES[batch['status']].tolist(),
+            batch['work_hours'].tolist(),
+            batch['overtime_hours'].tolist(),
+            [rule_set.version_id] * len(group),
+            [row[0] for row in group],
+        ))
+
+    for start in range(0, len(updates), RECOMPUTE_BATCH_SIZE):
+        with db.get_connection() as conn:
+            conn.executemany('''
+                UPDATE attendance_records
+                SET status = ?, work_hours = ?, overtime_hours = ?, rule_version_id = ?
+                WHERE id = ?
+            ''', updates[start:start + RECOMPUTE_BATCH_SIZE])
+            summaries.refresh_dirty()
+        if progress:
+            progress(min(start + RECOMPUTE_BATCH_SIZE, total), total)
+    if total:
+        # 看板快照包含状态统计和最近记录
+        dashboard.invalidate_cache()
+    return total
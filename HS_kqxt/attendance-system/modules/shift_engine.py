@@ -0,0 +1,324 @@
+import threading
+from collections import namedtuple
+from datetime import time
+import numpy as np
+from modules import db, punches as punch_codec, rules
+
+# 查表范围：当天和次日，共 2880 分钟
+LOOKUP_MINUTES = 2 * 1440
+NO_TIME = -1
+# 下班区间跨零点时次日打卡在 end_key 中的偏移，排在当天所有打卡之后
+NEXT_DAY_KEY = 2 * 1440
+
+# shift_rules.processing_logic -> 查表中的标志位
+START_ON_TIME = 1      # 正常上班区间，记为区间结束时间（标准上班时间）
+START_LATE = 2         # 迟到区间，记实际打卡时间并计算迟到分钟
+NOON = 4               # 午休区间，第一次打卡记区间开始为午休下班
+NOON_EARLY_RETURN = 8  # 午休提前上班区间，第二次打卡落在此区间时记区间结束并计白天加班
+END = 16               # 下班区间，取班次顺序上的最后一次打卡并取整到半点
+NIGHT_OVERTIME = 32    # 晚上加班区间，下班时间晚于区间开始的部分计晚上加班
+ANY_PUNCH = 64         # 出勤区间，有任一打卡即出勤（后勤部）
+
+LOGIC_FLAGS = {
+    'start_on_time': START_ON_TIME,
+    'start_late': START_LATE,
+    'noon': NOON,
+    'noon_early_return': NOON_EARLY_RETURN,
+    'end': END,
+    'night_overtime': NIGHT_OVERTIME,
+    'any_punch': ANY_PUNCH,
+}
+
+# 编译后的班次：flags/end_key 为按分钟查表的数组，其余为区间边界（分钟）
+CompiledShift = namedtuple('CompiledShift', [
+    'shift_id', 'name', 'department', 'kind',
+    'flags', 'end_key', 'end_wraps',
+    'standard_start', 'noon_leave', 'noon_end', 'early_return', 'overtime_start',
+])
+
+_engine_lock = threading.Lock()
+_engine = None
+
+
+def _window(start, end):
+    """区间包含的分钟下标；开始晚于结束且都在当天时按当天跨零点处理（与 is_time_between 一致）"""
+    if start <= end:
+        return np.arange(start, end + 1)
+    return np.concatenate([np.arange(start, 1440), np.arange(0, end + 1)])
+
+
+def compile_shift(shift_id, name, department, shift_rules):
+    """
+    把一个班次的规则行编译为按分钟查表的结构
+    shift_rules: [(processing_logic, start_time, end_time), ...]
+    """
+    flags = np.zeros(LOOKUP_MINUTES, dtype=np.uint8)
+    end_key = np.full(LOOKUP_MINUTES, NO_TIME, dtype=np.int32)
+    bounds = {}
+    end_wraps = False
+    for logic, start_time, end_time in shift_rules:
+        flag = LOGIC_FLAGS.get(logic)
+        start, end = punch_codec.parse_minute(start_time), punch_codec.parse_minute(end_time)
+        if flag is None or start is None or end is None:
+            raise ValueError(f"班次 {name} 的规则无法识别: {logic} {start_time}-{end_time}")
+        minutes = _window(start, end)
+        flags[minutes] |= flag
+        bounds[flag] = (start, end)
+        if flag == END:
+            # 下班区间按班次顺序排序：跨零点时零点之后的打卡排在最后
+            key = minutes.copy()
+            end_wraps = start > end
+            if end_wraps:
+                key[minutes <= end] += 1440
+                # 导入时“次日”打卡记为 1440 + 分钟数，落在区间的零点之后部分，排在当天的打卡之后
+                next_day = np.arange(1440, 1440 + end + 1)
+                flags[next_day] |= flag
+                end_key[next_day] = next_day + 1440
+            end_key[minutes] = key
+
+    kind = 'attendance' if ANY_PUNCH in bounds else 'segmented'
+    return CompiledShift(
+        shift_id=shift_id,
+        name=name,
+        department=department,
+        kind=kind,
+        flags=flags,
+        end_key=end_key,
+        end_wraps=end_wraps,
+        standard_start=bounds.get(START_ON_TIME, (None, None))[1],
+        noon_leave=bounds.get(NOON, (None, None))[0],
+        noon_end=bounds.get(NOON, (None, None))[1],
+        early_return=bounds.get(NOON_EARLY_RETURN, (None, None))[1],
+        overtime_start=bounds.get(NIGHT_OVERTIME, (None, None))[0],
+    )
+
+
+def load_shifts():
+    """从 shifts / shift_rules 读取并编译全部班次，返回 {部门: CompiledShift}"""
+    with db.get_connection() as conn:
+        shift_rows = conn.execute(
+            "SELECT id, name, department FROM shifts ORDER BY id"
+        ).fetchall()
+        rule_rows = conn.execute(
+            "SELECT shift_id, processing_logic, start_time, end_time FROM shift_rules ORDER BY id"
+        ).fetchall()
+
+    rules_by_shift = {}
+    for shift_id, logic, start_time, end_time in rule_rows:
+        rules_by_shift.setdefault(shift_id, []).append((logic, start_time, end_time))
+
+    compiled = {}
+    for shift_id, name, department in shift_rows:
+        # 同一部门有多个班次时默认使用最早建立的班次
+        if department not in compiled:
+            compiled[department] = compile_shift(
+                shift_id, name, department, rules_by_shift.get(shift_id, [])
+            )
+    return compiled
+
+
+def get_engine():
+    """获取编译好的班次表，进程内只编译一次"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = load_shifts()
+        return _engine
+
+
+def reload_shifts():
+    """班次或规则修改后调用，下次处理时重新编译"""
+    global _engine
+    with _engine_lock:
+        _engine = None
+
+
+def _nth_in_group(mask, group, n_groups, nth=0):
+    """每组中第 nth 个满足 mask 的打卡下标，没有则为 -1"""
+    idx = np.flatnonzero(mask)
+    result = np.full(n_groups, -1, dtype=np.int64)
+    if len(idx) == 0:
+        return result
+    owner = group[idx]
+    rank = np.arange(len(idx)) - np.searchsorted(owner, owner, side='left')
+    hit = rank == nth
+    result[owner[hit]] = idx[hit]
+    return result
+
+
+def _take(values, idx, default):
+    """按下标取值，下标为 -1 的位置填默认值"""
+    result = np.full(len(idx), default, dtype=np.int64)
+    hit = idx >= 0
+    result[hit] = values[idx[hit]]
+    return result
+
+
+def _group_max(values, offsets, default):
+    """每组的最大值，空组为默认值"""
+    result = np.full(len(offsets) - 1, default, dtype=np.int64)
+    non_empty = np.flatnonzero(np.diff(offsets) > 0)
+    if len(non_empty):
+        result[non_empty] = np.maximum.reduceat(values, offsets[:-1][non_empty])
+    return result
+
+
+def compute_segmented(shift, punches, offsets):
+    """按编译好的分段班次（上班/午休/下班）批量计算，返回各列数组"""
+    n = len(offsets) - 1
+    group = np.repeat(np.arange(n), np.diff(offsets))
+    flags = shift.flags[punches]
+
+    # 上班：第一次落在上班或迟到区间的打卡，落在正常上班区间记为标准上班时间
+    first_idx = _nth_in_group((flags & (START_ON_TIME | START_LATE)) != 0, group, n)
+    present = first_idx >= 0
+    first = _take(punches, first_idx, NO_TIME)
+    late = present & ((_take(flags, first_idx, 0) & START_ON_TIME) == 0)
+    work_start = np.where(present, np.where(late, first, shift.standard_start), NO_TIME)
+    late_minutes = np.where(late, first - shift.standard_start, 0)
+
+    # 午休：区间内第一次打卡记为午休下班，第二次决定午休上班时间
+    noon_leave = np.full(n, NO_TIME, dtype=np.int64)
+    noon_start = np.full(n, NO_TIME, dtype=np.int64)
+    day_overtime = np.zeros(n, dtype=np.float64)
+    if shift.noon_leave is not None:
+        noon_mask = (flags & NOON) != 0
+        has_noon = present & (_nth_in_group(noon_mask, group, n, 0) >= 0)
+        second_idx = _nth_in_group(noon_mask, group, n, 1)
+        has_second = present & (second_idx >= 0)
+        noon_leave[has_noon] = shift.noon_leave
+        noon_start[has_second] = shift.noon_end
+        if shift.early_return is not None:
+            early = has_second & ((_take(flags, second_idx, 0) & NOON_EARLY_RETURN) != 0)
+            noon_start[early] = shift.early_return
+            day_overtime[early] = (shift.noon_end - shift.early_return) / 60
+
+    # 下班：下班区间内按班次顺序的最后一次打卡，取整到半点
+    best = _group_max(shift.end_key[punches], offsets, NO_TIME)
+    has_end = present & (best >= 0)
+    next_day = best >= NEXT_DAY_KEY
+    last_end = np.where(next_day, best - NEXT_DAY_KEY,
+                        np.where(shift.end_wraps & (best >= 1440), best - 1440, best))
+    rounded = last_end - last_end % 30
+    work_end = np.where(has_end, rounded, NO_TIME)
+
+    night_overtime = np.zeros(n, dtype=np.float64)
+    if shift.overtime_start is not None:
+        # 次日下班一定晚于加班区间开始，加班时长算到次日的下班时间
+        in_overtime = has_end & (next_day | ((shift.flags[np.maximum(last_end, 0)] & NIGHT_OVERTIME) != 0))
+        end_minute = np.where(next_day, rounded + 1440, rounded)
+        night_overtime = np.where(in_overtime, np.round((end_minute - shift.overtime_start) / 60, 1), 0.0)
+
+    status = np.full(n, '正常', dtype=object)
+    status[late] = '迟到'
+    status[present & ~has_end] = '缺卡'
+    status[~present] = '缺勤'
+
+    return {
+        'work_start_time': work_start,
+        'work_end_time': work_end,
+        'noon_leave_time': noon_leave,
+        'noon_start_time': noon_start,
+        'day_overtime_hours': day_overtime,
+        'night_overtime_hours': night_overtime,
+        'late_minutes': late_minutes,
+        'status': status,
+    }
+
+
+def _to_time(minute):
+    """分钟数转换为当天的 time，NO_TIME 返回 None"""
+    if minute == NO_TIME:
+        return None
+    minute = int(minute) % 1440
+    return time(minute // 60, minute % 60)
+
+
+def _status_note(status, late_minutes):
+    """状态说明，与 rules.process_morning_shift 一致"""
+    if status == '缺勤':
+        return '未在规定时间内打上班卡'
+    note = f"迟到{late_minutes}分钟" if late_minutes else ''
+    if status == '缺卡':
+        note += '; 未在规定时间内打下班卡' if note else '未在规定时间内打下班卡'
+    return note
+
+
+def run_shift(shift, employee_ids, check_dates, punch_blobs):
+    """
+    用一个编译好的班次处理一批员工日打卡，返回结果字典列表
+    punch_blobs: 每人每天的打卡 BLOB（modules.punches 格式），直接解码，不解析字符串
+    """
+    punches, offsets = punch_codec.decode_groups(punch_blobs)
+
+    if shift.kind == 'attendance':
+        # 次日打卡也记在当天的出勤里（与 rules.process_logistics_department 一致）
+        has_punch = _group_max(((shift.flags[punches % 1440] & ANY_PUNCH) != 0).astype(np.int64), offsets, 0)
+        return [{
+            'employee_id': employee_id,
+            'check_date': check_date,
+            'status': '出勤' if punched else '休息',
+            'has_check_in': bool(punched),
+        } for employee_id, check_date, punched in zip(employee_ids, check_dates, has_punch)]
+
+    batch = compute_segmented(shift, punches, offsets)
+    results = []
+    for i, (employee_id, check_date, punch_blob) in enumerate(
+            zip(employee_ids, check_dates, punch_blobs)):
+        results.append({
+            'employee_id': employee_id,
+            'check_date': check_date,
+            'original_punches': punch_blob,
+            'work_start_time': _to_time(batch['work_start_time'][i]),
+            'work_end_time': _to_time(batch['work_end_time'][i]),
+            'noon_leave_time': _to_time(batch['noon_leave_time'][i]),
+            'noon_start_time': _to_time(batch['noon_start_time'][i]),
+            'day_overtime_hours': float(batch['day_overtime_hours'][i]),
+            'night_overtime_hours': float(batch['night_overtime_hours'][i]),
+            'status': batch['status'][i],
+            'status_note': _status_note(batch['status'][i], int(batch['late_minutes'][i])),
+        })
+    return results
+
+
+def process_range(start_date, end_date, progress=None):
+    """
+    按员工所属部门的班次批量处理一段日期内的打卡，并批量覆盖写入结果表
+    每个部门单独提交；progress 为可选回调 progress(已处理数, 总数)，每个部门提交后调用一次，
+    回调抛出异常（如任务被取消）时已提交的部门保留，其余部门不再处理
+    返回 {部门: 处理条数}，没有配置班次的部门不处理
+    """
+    engine = get_engine()
+    with db.get_connection() as conn:
+        rows = conn.execute('''
+            SELECT e.department, ar.employee_id, ar.work_date, ar.punches
+            FROM attendance_records ar
+            JOIN employees e ON ar.employee_id = e.employee_id
+            WHERE ar.work_date BETWEEN ? AND ?
+            ORDER BY e.department, ar.employee_id, ar.work_date
+        ''', (str(start_date), str(end_date))).fetchall()
+
+    by_department = {}
+    for department, employee_id, work_date, punch_blob in rows:
+        if department in engine:
+            columns = by_department.setdefault(department, ([], [], []))
+            columns[0].append(employee_id)
+            columns[1].append(work_date)
+            columns[2].append(punch_blob)
+
+    processed = {}
+    total = sum(len(columns[0]) for columns in by_department.values())
+    done = 0
+    for department, (employee_ids, check_dates, punch_blobs) in by_department.items():
+        shift = engine[department]
+        results = run_shift(shift, employee_ids, check_dates, punch_blobs)
+        with db.get_connection():
+            if shift.kind == 'attendance':
+                rules.save_logistics_results(results)
+            else:
+                rules.save_morning_shift_results(results)
+        processed[department] = len(results)
+        done += len(employee_ids)
+        if progress:
+            progress(done, total)
+    return processed
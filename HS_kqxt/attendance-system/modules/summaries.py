@@ -0,0 +1,186 @@
+import sys
+from modules import db
+
+# 按员工/日聚合考勤记录和班次处理结果；{source} 为考勤记录的来源（全部或待刷新的日期）
+DAILY_SUMMARY_SQL = """
+    INSERT INTO daily_employee_summary
+    (employee_id, work_date, department, record_count, check_in_ts, check_out_ts,
+     is_late, is_early_leave, is_missing, work_hours, overtime_hours,
+     day_overtime_hours, night_overtime_hours)
+    SELECT ar.employee_id, ar.work_date, COALESCE(e.department, '无'), COUNT(*),
+           MIN(ar.check_in_ts), MAX(ar.check_out_ts),
+           MAX(ar.status = '迟到'), MAX(ar.status = '早退'), MAX(ar.status = '缺卡'),
+           COALESCE(SUM(ar.work_hours), 0), COALESCE(SUM(ar.overtime_hours), 0),
+           COALESCE(MAX(p.day_overtime_hours), 0), COALESCE(MAX(p.night_overtime_hours), 0)
+    FROM {source}
+    LEFT JOIN employees e ON e.employee_id = ar.employee_id
+    LEFT JOIN production_morning_records p
+           ON p.employee_id = ar.employee_id AND p.check_date = ar.work_date
+    WHERE ar.work_date IS NOT NULL
+    GROUP BY ar.employee_id, ar.work_date
+"""
+
+# 由日汇总聚合部门/月汇总；{source} 为日汇总的来源（全部或受影响的部门月份）
+MONTHLY_SUMMARY_SQL = """
+    INSERT INTO monthly_department_summary
+    (month, department, employee_count, attendance_days, late_count, early_leave_count,
+     missing_count, work_hours, overtime_hours, day_overtime_hours, night_overtime_hours)
+    SELECT substr(s.work_date, 1, 7), s.department, COUNT(DISTINCT s.employee_id),
+           SUM(s.check_in_ts IS NOT NULL), SUM(s.is_late), SUM(s.is_early_leave),
+           SUM(s.is_missing), ROUND(SUM(s.work_hours), 2), ROUND(SUM(s.overtime_hours), 2),
+           ROUND(SUM(s.day_overtime_hours), 2), ROUND(SUM(s.night_overtime_hours), 2)
+    FROM {source}
+    GROUP BY substr(s.work_date, 1, 7), s.department
+"""
+
+# 月份不在已归档月份中
+NOT_ARCHIVED = "NOT IN (SELECT month FROM archive_partitions)"
+
+
+def _ensure_work_tables(cursor):
+    """当前连接上的临时表：本次刷新涉及的部门月份"""
+    cursor.execute('''
+    CREATE TEMP TABLE IF NOT EXISTS summary_dirty_months (
+        month TEXT NOT NULL,
+        department TEXT NOT NULL,
+        PRIMARY KEY (month, department)
+    )
+    ''')
+
+
+def _collect_dirty_months(cursor):
+    """
+    记录待刷新日期所在的部门月份（刷新前后各调用一次，覆盖员工调动部门的情况）
+    待刷新表没有统计信息，CROSS JOIN 固定由它驱动连接，避免规划器改为扫描整个日汇总表
+    """
+    cursor.execute('''
+    INSERT OR IGNORE INTO summary_dirty_months
+    SELECT substr(s.work_date, 1, 7), s.department
+    FROM summary_dirty_days d
+    CROSS JOIN daily_employee_summary s
+      ON s.employee_id = d.employee_id AND s.work_date = d.work_date
+    ''')
+
+
+def refresh_dirty():
+    """
+    增量刷新汇总表：只重算触发器标记过的 (员工, 日期) 及其所在的部门月份
+    在调用方的事务内执行（导入、班次处理写入后调用），返回刷新的天数
+    """
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM summary_dirty_days")
+        dirty_count = cursor.fetchone()[0]
+        if not dirty_count:
+            return 0
+        if not conn.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+
+        _ensure_work_tables(cursor)
+        cursor.execute("DELETE FROM summary_dirty_months")
+        _collect_dirty_months(cursor)
+        cursor.execute('''
+        DELETE FROM daily_employee_summary
+        WHERE (employee_id, work_date) IN (SELECT employee_id, work_date FROM summary_dirty_days)
+        ''')
+        cursor.execute(DAILY_SUMMARY_SQL.format(source='''summary_dirty_days d
+            JOIN attendance_records ar
+              ON ar.work_date = d.work_date AND ar.employee_id = d.employee_id'''))
+        _collect_dirty_months(cursor)
+
+        cursor.execute('''
+        DELETE FROM monthly_department_summary
+        WHERE (month, department) IN (SELECT month, department FROM summary_dirty_months)
+        ''')
+        cursor.execute(MONTHLY_SUMMARY_SQL.format(source="""summary_dirty_months m
+            JOIN daily_employee_summary s
+              ON s.department = m.department
+             AND s.work_date BETWEEN m.month || '-01' AND m.month || '-31'"""))
+
+        cursor.execute("DELETE FROM summary_dirty_days")
+        cursor.execute("DELETE FROM summary_dirty_months")
+    return dirty_count
+
+
+def rebuild():
+    """
+    清空并按热库中的考勤记录重建汇总表（回填历史数据或修复不一致时使用），返回日汇总行数
+    已归档月份的明细不在热库中，其汇总保持不变（见 modules.archive）
+    """
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(f"DELETE FROM daily_employee_summary WHERE substr(work_date, 1, 7) {NOT_ARCHIVED}")
+        cursor.execute(f"DELETE FROM monthly_department_summary WHERE month {NOT_ARCHIVED}")
+        cursor.execute(DAILY_SUMMARY_SQL.format(
+            source=f"(SELECT * FROM attendance_records WHERE substr(work_date, 1, 7) {NOT_ARCHIVED}) ar"))
+        cursor.execute(MONTHLY_SUMMARY_SQL.format(
+            source=f"daily_employee_summary s WHERE substr(s.work_date, 1, 7) {NOT_ARCHIVED}"))
+        cursor.execute("DELETE FROM summary_dirty_days")
+        cursor.execute("SELECT COUNT(*) FROM daily_employee_summary")
+        return cursor.fetchone()[0]
+
+
+def get_employee_daily(employee_id, start_date, end_date):
+    """获取员工一段日期内的日汇总"""
+    refresh_dirty()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT * FROM daily_employee_summary
+        WHERE employee_id = ? AND work_date BETWEEN ? AND ?
+        ORDER BY work_date
+        ''', (employee_id, str(start_date), str(end_date)))
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_department_daily(department, start_date, end_date):
+    """按日期汇总某部门一段日期内的出勤、迟到和工时（图表使用）"""
+    refresh_dirty()
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT work_date, COUNT(*) AS employee_count, SUM(is_late) AS late_count,
+               ROUND(SUM(work_hours), 2) AS work_hours,
+               ROUND(SUM(overtime_hours), 2) AS overtime_hours
+        FROM daily_employee_summary
+        WHERE department = ? AND work_date BETWEEN ? AND ?
+        GROUP BY work_date
+        ORDER BY work_date
+        ''', (department, str(start_date), str(end_date)))
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_department_monthly(month=None, department=None):
+    """获取部门月汇总，month 为 'YYYY-MM'，不传则返回全部月份"""
+    refresh_dirty()
+    query = "SELECT * FROM monthly_department_summary WHERE 1 = 1"
+    params = []
+    if month:
+        query += " AND month = ?"
+        params.append(month)
+    if department:
+        query += " AND department = ?"
+        params.append(department)
+    query += " ORDER BY month, department"
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+if __name__ == '__main__':
+    # 命令行：python -m modules.summaries rebuild | refresh
+    from modules import migrations
+    migrations.ensure_schema()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    if command == 'rebuild':
+        print(f"已重建汇总表：{rebuild()} 条员工日汇总")
+    elif command == 'refresh':
+        print(f"已刷新 {refresh_dirty()} 个员工日期")
+    else:
+        print("用法: python -m modules.summaries [rebuild|refresh]")
+        sys.exit(1)
@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# 设置 ATTENDANCE_TRACE=1 对每次页面运行都开启追踪；管理员也可以在调试面板中只为自己的会话开启
+ENABLED = os.environ.get("ATTENDANCE_TRACE") == "1"
+
+# 每次运行写一行 JSON，文件超过 LOG_MAX_BYTES 后轮转，保留 LOG_BACKUPS 个旧文件
+LOG_PATH = os.path.join("data", "logs", "trace.jsonl")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+
+MAX_QUERIES = 500     # 每次运行最多记录的语句数，超出的只计数
+SQL_PREVIEW = 300     # 记录的 SQL 最大长度
+RECENT_RUNS = 20      # 调试面板保留的最近运行次数
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 确定调用位置时跳过的文件（连接池和追踪本身）
+_SKIP_FILES = {
+    os.path.abspath(__file__),
+    os.path.join(_APP_DIR, "modules", "db.py"),
+}
+
+_local = threading.local()
+_recent = deque(maxlen=RECENT_RUNS)
+_recent_lock = threading.Lock()
+_logger = None
+_log_file = None
+_logger_lock = threading.Lock()
+
+
+def _call_site():
+    """执行语句的应用代码位置，如 'modules/reports.py:120 get_recent_records'"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+            relative = os.path.relpath(filename, _APP_DIR).replace(os.sep, "/")
+            return f"{relative}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class _Run:
+    """一次页面运行（或一次命令行调用）内收集的阶段耗时和语句"""
+
+    def __init__(self, label, capture_params=False):
+        self.label = label
+        self.capture_params = capture_params
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat(timespec="milliseconds")
+        self.phases = []
+        self.queries = []
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.notes = {}
+        self.current_query = None   # 正在执行的语句，sqlite3 追踪回调把展开后的 SQL 记到这里
+
+    def on_trace(self, statement):
+        """sqlite3 追踪回调：记录绑定参数后的 SQL，并统计触发器等子语句的条数"""
+        query = self.current_query
+        if query is None:
+            return
+        query["statements"] += 1
+        if query["expanded"] is None and not statement.startswith("BEGIN"):
+            query["expanded"] = statement[:SQL_PREVIEW]
+
+    def start_query(self, sql, parameters=None):
+        query = {
+            "sql": " ".join(sql.split())[:SQL_PREVIEW],
+            "expanded": None,
+            "site": _call_site(),
+            "ms": 0.0,
+            "rows": 0,
+            "statements": 0,
+        }
+        if self.capture_params:
+            # 完整的 SQL 和参数，供 EXPLAIN QUERY PLAN 等工具重新执行（不写入日志）
+            query["statement"] = sql
+            query["parameters"] = parameters
+        self.query_count += 1
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append(query)
+        self.current_query = query
+        return query
+
+    def add_time(self, query, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        query["ms"] += elapsed
+        self.query_ms += elapsed
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "query_count": self.query_count,
+            "query_ms": round(self.query_ms, 3),
+            "dropped_queries": self.query_count - len(self.queries),
+            "phases": self.phases,
+            "queries": [dict(q, ms=round(q["ms"], 3)) for q in self.queries],
+            "notes": self.notes,
+        }
+
+
+class _TracedCursor:
+    """记录 execute/executemany 的耗时、影响行数，以及取回结果的行数和耗时"""
+
+    def __init__(self, cursor, run):
+        self._cursor = cursor
+        self._run = run
+        self._query = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _execute(self, method, sql, argument, parameters=None):
+        query = self._run.start_query(sql, parameters)
+        started = time.perf_counter()
+        try:
+            method(sql, argument)
+        finally:
+            self._run.add_time(query, started)
+            self._run.current_query = None
+            if self._cursor.rowcount > 0:
+                query["rows"] = self._cursor.rowcount
+            self._query = query
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._execute(self._cursor.execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._execute(self._cursor.executemany, sql, seq_of_parameters)
+
+    def _fetched(self, count, started):
+        if self._query is not None:
+            self._query["rows"] += count
+            self._run.add_time(self._query, started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(0 if row is None else 1, started)
+        return row
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(len(rows), started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows), started)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = next(self._cursor)
+        except StopIteration:
+            self._fetched(0, started)
+            raise
+        self._fetched(1, started)
+        return row
+
+
+class _TracedConnection:
+    """包装连接池借出的连接，其余属性（in_transaction 等）直接转发"""
+
+    def __init__(self, conn, run):
+        self._conn = conn
+        self._run = run
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return _TracedCursor(self._conn.cursor(), self._run)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _timed(self, name, method):
+        query = self._run.start_query(name)
+        started = time.perf_counter()
+        try:
+            method()
+        finally:
+            self._run.add_time(query, started)
+            self._run.current_query = None
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._timed("COMMIT", self._conn.commit)
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._timed("ROLLBACK", self._conn.rollback)
+
+
+def current_run():
+    """当前线程正在追踪的运行，未开启时返回 None"""
+    return getattr(_local, "run", None)
+
+
+def attach(conn):
+    """
+    连接池借出连接时调用：当前线程正在追踪时注册 sqlite3 追踪回调并返回包装后的连接，
+    否则原样返回（未开启追踪时没有额外开销）
+    """
+    run = current_run()
+    if run is None:
+        return conn
+    conn.set_trace_callback(run.on_trace)
+    return _TracedConnection(conn, run)
+
+
+def detach(conn):
+    """连接归还前移除追踪回调"""
+    conn.set_trace_callback(None)
+
+
+def _get_logger():
+    """JSON 行日志，第一次写入时（或运行目录变化后）创建目录和轮转文件处理器"""
+    global _logger, _log_file
+    path = os.path.abspath(LOG_PATH)
+    with _logger_lock:
+        if _log_file != path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("attendance.trace")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            for old_handler in list(logger.handlers):
+                logger.removeHandler(old_handler)
+                old_handler.close()
+            logger.addHandler(handler)
+            _logger, _log_file = logger, path
+        return _logger
+
+
+@contextmanager
+def run(label, enabled=None, record=True, capture_params=False):
+    """
+    追踪一次运行：期间当前线程的所有数据库语句和 phase() 阶段都会被记录，
+    结束后写入 JSON 行日志并保留在 recent_runs() 中。enabled 为 None 时按 ENABLED 决定
+    record 为 False 时只把结果留给调用方（yield 的 _Run），不写日志；
+    capture_params 为 True 时额外保留每条语句的完整 SQL 和参数（executemany 的参数除外）
+    """
+    if not (ENABLED if enabled is None else enabled) or current_run() is not None:
+        yield None
+        return
+
+    traced = _Run(label, capture_params)
+    _local.run = traced
+    try:
+        yield traced
+    finally:
+        _local.run = None
+        if record:
+            _publish(traced.to_dict())
+
+
+def _publish(data):
+    """保存到最近运行列表并写入 JSON 行日志"""
+    with _recent_lock:
+        _recent.append(data)
+    try:
+        _get_logger().info(json.dumps(data, ensure_ascii=False, default=str))
+    except OSError as e:
+        print(f"写入追踪日志失败: {e}")
+
+
+@contextmanager
+def phase(name):
+    """记录一个阶段的耗时和期间执行的语句数，未开启追踪时什么也不做"""
+    traced = current_run()
+    if traced is None:
+        yield
+        return
+    started = time.perf_counter()
+    first_query = traced.query_count
+    try:
+        yield
+    finally:
+        traced.phases.append({
+            "name": name,
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+            "queries": traced.query_count - first_query,
+        })
+
+
+def note(key, value):
+    """在当前运行中附加调试数据（代替直接 print），未开启追踪时忽略"""
+    traced = current_run()
+    if traced is not None:
+        traced.notes[key] = value
+
+
+def recent_runs():
+    """最近完成的运行，最新的在前"""
+    with _recent_lock:
+        return list(reversed(_recent))
+
+
+def summarize_queries(run_data, limit=20):
+    """按 SQL 聚合一次运行的语句：次数、总耗时、行数和调用位置，按总耗时降序"""
+    groups = {}
+    for query in run_data["queries"]:
+        group = groups.setdefault(query["sql"], {
+            "sql": query["sql"], "count": 0, "total_ms": 0.0, "rows": 0, "sites": set(),
+        })
+        group["count"] += 1
+        group["total_ms"] += query["ms"]
+        group["rows"] += query["rows"]
+        if query["site"]:
+            group["sites"].add(query["site"])
+    result = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)[:limit]
+    for group in result:
+        group["total_ms"] = round(group["total_ms"], 3)
+        group["sites"] = ", ".join(sorted(group["sites"]))
+    return result
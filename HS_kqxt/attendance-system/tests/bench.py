@@ -0,0 +1,329 @@
+"""
+热点路径基准测试：看板数据、Excel 导入、班次处理、员工搜索、月报导出、实时打卡写入
+
+每个规模（考勤记录条数）在独立的临时数据库中运行，结果写成 JSON，便于比较不同提交：
+    python -m tests.bench --scales 1000 10000 100000 --output bench-before.json
+    python -m tests.bench compare bench-before.json bench-after.json
+"""
+import argparse
+import calendar
+import json
+import math
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+import app
+from modules import (dashboard, db, employees, export_report, import_excel, migrations,
+                     punch_ingest, punches, rules, shift_engine)
+from tests import datagen
+
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_START = (2025, 7)
+# 非破坏性操作的重复次数，取中位数
+DEFAULT_REPEAT = 5
+# 标量班次处理最多调用的次数（早班每次调用都单独提交一个写事务，超过时按比例抽样）
+SCALAR_LIMIT = 500
+# 搜索词：编号前缀、完整编号、姓氏、部门、三字以上的全文检索
+# 实时打卡：模拟换班时 PUNCH_THREADS 个终端同时提交，每个终端等确认后再提交下一条，共 PUNCH_LIMIT 条
+PUNCH_THREADS = 200
+PUNCH_LIMIT = 20000
+SEARCH_KEYWORDS = ['HS0001', 'HS000123', '王', '生产部', '后勤部', '张伟', 'HS00', '品质部']
+
+
+def _log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _measure(func, repeat):
+    """调用 func repeat 次，返回耗时统计（秒）和最后一次的返回值"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return {
+        'runs': repeat,
+        'min': min(times),
+        'median': statistics.median(times),
+        'max': max(times),
+    }, result
+
+
+def _use_database(path):
+    """切换到指定数据库并重置各模块的进程内缓存"""
+    db.set_db_path(path)
+    migrations.migrate()
+    rules.invalidate_rules_cache()
+    shift_engine.reload_shifts()
+    dashboard.invalidate_cache()
+
+
+def _month_range(start, months):
+    last_year, last_month = list(datagen.iter_months(start, months))[-1]
+    return (date(start[0], start[1], 1),
+            date(last_year, last_month, calendar.monthrange(last_year, last_month)[1]))
+
+
+def _employees_for_scale(scale, start, months, seed):
+    """按平均每人每月的打卡天数估算达到 scale 条记录所需的员工数"""
+    sample = datagen.generate_employees(50, seed)
+    days = sum(len(list(datagen.month_punches(employee, year, month, seed)))
+               for employee in sample for year, month in datagen.iter_months(start, months))
+    return max(1, math.ceil(scale * len(sample) / max(days, 1)))
+
+
+def bench_import(workdir, files):
+    """月报导入到空数据库（会写入数据，只运行一次）"""
+    _use_database(os.path.join(workdir, 'bench.db'))
+    messages = []
+
+    def run():
+        for path in files:
+            ok, message = import_excel.import_attendance_from_excel(path, os.path.basename(path))
+            if not ok:
+                raise RuntimeError(message)
+            messages.append(message)
+
+    stats, _ = _measure(run, 1)
+    stats['message'] = '；'.join(messages)
+    return stats
+
+
+def _shift_rows(department, start_date, end_date):
+    with db.get_connection() as conn:
+        return conn.execute('''
+            SELECT ar.employee_id, ar.work_date, ar.punches
+            FROM attendance_records ar
+            JOIN employees e ON ar.employee_id = e.employee_id
+            WHERE e.department = ? AND ar.work_date BETWEEN ? AND ?
+            ORDER BY ar.employee_id, ar.work_date
+        ''', (department, str(start_date), str(end_date))).fetchall()
+
+
+def bench_scalar_shift(func, department, start_date, end_date):
+    """逐条调用 rules.process_morning_shift / process_logistics_department，per_call_us 为单次耗时"""
+    rows = _shift_rows(department, start_date, end_date)
+    step = max(1, math.ceil(len(rows) / SCALAR_LIMIT))
+    sample = [(employee_id, work_date, punches.to_text(blob)) for employee_id, work_date, blob in rows[::step]]
+
+    def run():
+        for employee_id, work_date, check_times in sample:
+            func(employee_id, work_date, check_times)
+
+    stats, _ = _measure(run, 1)
+    stats['calls'] = len(sample)
+    stats['rows'] = len(rows)
+    stats['per_call_us'] = stats['median'] / max(len(sample), 1) * 1e6
+    return stats
+
+
+def bench_punch_ingest(employee_list, day):
+    """并发调用 punch_ingest.submit_punch，per_second 为确认落盘的打卡吞吐"""
+    count = min(PUNCH_LIMIT, len(employee_list) * 2)
+    start = datetime.combine(day, datetime.min.time()) + timedelta(hours=7)
+    # 每名员工 07:00 后上班、17:00 后下班各打一次卡，分散到不同终端
+    planned = []
+    for i in range(count):
+        shift, index = divmod(i, len(employee_list))
+        planned.append((employee_list[index]['employee_id'],
+                        start + timedelta(hours=10 * shift, seconds=index % 3600)))
+    failures = []
+
+    def terminal(offset):
+        for employee_id, punched_at in planned[offset::PUNCH_THREADS]:
+            ok, msg = punch_ingest.submit_punch(employee_id, punched_at)
+            if not ok:
+                failures.append(msg)
+
+    def run():
+        threads = [threading.Thread(target=terminal, args=(offset,)) for offset in range(PUNCH_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    try:
+        stats, _ = _measure(run, 1)
+    finally:
+        punch_ingest.stop_writer()
+    stats['punches'] = count
+    stats['failed'] = len(failures)
+    stats['per_second'] = count / stats['median'] if stats['median'] else 0
+    stats['max_batch'] = punch_ingest.get_stats()['max_batch']
+    return stats
+
+
+def bench_search(repeat):
+    def run():
+        for keyword in SEARCH_KEYWORDS:
+            employees.search_employees(keyword)
+            employees.search_employees_ranked(keyword)
+
+    stats, _ = _measure(run, repeat)
+    stats['queries'] = len(SEARCH_KEYWORDS) * 2
+    return stats
+
+
+def bench_backend_data(repeat):
+    """app.get_backend_data：cold 为每次先清空看板缓存，warm 为命中缓存"""
+    def cold():
+        dashboard.invalidate_cache()
+        return app.get_backend_data()
+
+    cold_stats, _ = _measure(cold, repeat)
+    warm_stats, _ = _measure(app.get_backend_data, repeat)
+    return cold_stats, warm_stats
+
+
+def bench_export(workdir, start_date, end_date, file_format, repeat):
+    path = os.path.join(workdir, f"export.{file_format}")
+    stats, _ = _measure(
+        lambda: export_report.export_to_file(path, start_date, end_date, file_format=file_format), repeat
+    )
+    stats['bytes'] = os.path.getsize(path)
+    return stats
+
+
+def run_scale(scale, start=DEFAULT_START, months=1, repeat=DEFAULT_REPEAT, seed=datagen.DEFAULT_SEED):
+    """在临时目录中生成 scale 条记录规模的数据并运行全部基准，返回结果字典"""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{scale}-")
+    old_path, old_cwd = db.DB_PATH, os.getcwd()
+    try:
+        os.chdir(workdir)
+        os.makedirs('data', exist_ok=True)
+        employee_count = _employees_for_scale(scale, start, months, seed)
+        employee_list = datagen.generate_employees(employee_count, seed)
+        start_date, end_date = _month_range(start, months)
+
+        _log(f"[{scale}] 生成 {employee_count} 名员工的月报 ...")
+        files = datagen.write_month_reports(os.path.join(workdir, 'xlsx'), employee_list, start, months, seed)
+        benchmarks = {}
+
+        _log(f"[{scale}] Excel 导入 ...")
+        benchmarks['import_excel'] = bench_import(workdir, files)
+        with db.get_connection() as conn:
+            records = conn.execute("SELECT COUNT(*) FROM attendance_records").fetchone()[0]
+
+        _log(f"[{scale}] 班次处理 ...")
+        stats, result = _measure(lambda: shift_engine.process_range(start_date, end_date), 1)
+        stats['processed'] = result
+        benchmarks['shift_process_range'] = stats
+        benchmarks['process_morning_shift'] = bench_scalar_shift(
+            rules.process_morning_shift, '生产部', start_date, end_date)
+        benchmarks['process_logistics_department'] = bench_scalar_shift(
+            rules.process_logistics_department, '后勤部', start_date, end_date)
+
+        _log(f"[{scale}] 看板数据、搜索 ...")
+        benchmarks['get_backend_data_cold'], benchmarks['get_backend_data_warm'] = bench_backend_data(repeat)
+        benchmarks['search'] = bench_search(repeat)
+
+        _log(f"[{scale}] 月报导出 ...")
+        export_repeat = max(1, repeat // 2)
+        benchmarks['export_xlsx'] = bench_export(workdir, start_date, end_date, 'xlsx', export_repeat)
+        benchmarks['export_csv'] = bench_export(workdir, start_date, end_date, 'csv', export_repeat)
+
+        _log(f"[{scale}] 实时打卡 ...")
+        benchmarks['punch_ingest'] = bench_punch_ingest(employee_list, end_date + timedelta(days=1))
+
+        return {
+            'scale': scale,
+            'employees': employee_count,
+            'records': records,
+            'months': months,
+            'benchmarks': benchmarks,
+        }
+    finally:
+        os.chdir(old_cwd)
+        db.set_db_path(old_path)
+        rules.invalidate_rules_cache()
+        shift_engine.reload_shifts()
+        dashboard.invalidate_cache()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, months=1, repeat=DEFAULT_REPEAT, seed=datagen.DEFAULT_SEED):
+    """运行全部规模的基准，返回可写入 JSON 的结果"""
+    import numpy
+    import openpyxl
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'numpy': numpy.__version__,
+            'openpyxl': openpyxl.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': [run_scale(scale, months=months, repeat=repeat, seed=seed) for scale in scales],
+    }
+
+
+def compare(before, after):
+    """比较两次结果的中位数耗时，返回表格文本行"""
+    lines = [f"{'规模':>8}  {'基准':<30}{'之前(ms)':>12}{'之后(ms)':>12}{'变化':>9}"]
+    previous = {result['scale']: result['benchmarks'] for result in before['results']}
+    for result in after['results']:
+        old = previous.get(result['scale'], {})
+        for name, stats in result['benchmarks'].items():
+            if name not in old:
+                continue
+            old_ms, new_ms = old[name]['median'] * 1000, stats['median'] * 1000
+            change = f"{(new_ms / old_ms - 1) * 100:+.1f}%" if old_ms else '-'
+            lines.append(f"{result['scale']:>8}  {name:<30}{old_ms:>12.2f}{new_ms:>12.2f}{change:>9}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="考勤系统热点路径基准测试")
+    sub = parser.add_subparsers(dest='command')
+    compare_parser = sub.add_parser('compare', help="比较两次基准结果")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="考勤记录条数")
+    parser.add_argument('--months', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--seed', type=int, default=datagen.DEFAULT_SEED)
+    parser.add_argument('--output', help="结果 JSON 文件，默认为 bench-<提交>.json")
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.before, encoding='utf-8') as f:
+            before = json.load(f)
+        with open(args.after, encoding='utf-8') as f:
+            after = json.load(f)
+        print('\n'.join(compare(before, after)))
+        return
+
+    data = run(args.scales, args.months, args.repeat, args.seed)
+    output = args.output or f"bench-{data['meta']['commit'] or 'local'}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    for result in data['results']:
+        _log(f"规模 {result['scale']}（{result['employees']}名员工，{result['records']}条记录）")
+        for name, stats in result['benchmarks'].items():
+            _log(f"  {name:<30}{stats['median'] * 1000:>10.2f} ms")
+    _log(f"结果已写入 {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from modules import dashboard, db, migrations, rules, shift_engine  # noqa: E402
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """在临时目录中使用全新的数据库，结束后恢复原数据库路径"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data', exist_ok=True)
+    old_path = db.DB_PATH
+    path = str(tmp_path / 'data' / 'test.db')
+    db.set_db_path(path)
+    migrations.migrate()
+    rules.invalidate_rules_cache()
+    shift_engine.reload_shifts()
+    dashboard.invalidate_cache()
+    yield path
+    db.set_db_path(old_path)
+    rules.invalidate_rules_cache()
+    shift_engine.reload_shifts()
+    dashboard.invalidate_cache()
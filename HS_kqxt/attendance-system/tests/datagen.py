@@ -0,0 +1,215 @@
+"""
+可复现的测试数据生成器：N 名员工、M 个月的打卡数据，输出为数据库或钉钉“上下班打卡_月报”Excel
+
+同一 seed 生成的数据完全相同；每名员工每个月使用独立的随机序列，
+因此改变员工数或月份数不会影响其他员工/月份已生成的数据。
+
+命令行：
+    python -m tests.datagen --employees 200 --months 2 --start 2025-07 --db data/bench.db
+    python -m tests.datagen --employees 200 --months 2 --start 2025-07 --xlsx-dir out/
+"""
+import argparse
+import calendar
+import os
+import random
+from datetime import date
+from openpyxl import Workbook
+from modules import db, export_report, import_excel, migrations, punches as punch_codec, rules, rules_batch, shift_engine
+
+DEFAULT_SEED = 20250701
+
+# (部门, 占比)；生产部、后勤部有默认班次，其余部门只按考勤规则计算
+DEPARTMENTS = [('生产部', 0.5), ('后勤部', 0.2), ('品质部', 0.15), ('行政部', 0.15)]
+
+_SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘'
+_GIVEN = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华建国志红梅鹏飞'
+
+# 各种情况出现的概率（工作日）
+P_ABSENT = 0.04           # 整天无打卡
+P_LATE = 0.12             # 迟到
+P_MISSING_IN = 0.03       # 缺上班卡
+P_NOON = 0.85             # 有午休打卡
+P_EARLY_RETURN = 0.2      # 午休提前回岗（12:30 之前）
+P_OVERTIME = 0.35         # 晚上加班
+P_CROSS_MIDNIGHT = 0.05   # 加班到次日
+P_MISSING_OUT = 0.05      # 缺下班卡
+P_DUPLICATE = 0.05        # 同一时间附近重复打卡
+P_WEEKEND_WORK = 0.1      # 周末加班
+
+
+def generate_employees(count, seed=DEFAULT_SEED):
+    """生成 count 名员工，返回 [{'employee_id', 'name', 'department'}, ...]"""
+    rng = random.Random(f"{seed}:employees")
+    names, weights = zip(*DEPARTMENTS)
+    employees = []
+    for index in range(count):
+        name = rng.choice(_SURNAMES) + ''.join(rng.choice(_GIVEN) for _ in range(rng.randint(1, 2)))
+        employees.append({
+            'employee_id': f"HS{index + 1:06d}",
+            'name': name,
+            'department': rng.choices(names, weights)[0],
+        })
+    return employees
+
+
+def iter_months(start, months):
+    """从 (年, 月) 开始的 months 个月，产出 (年, 月)"""
+    year, month = start
+    for _ in range(months):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _workday_punches(rng):
+    """一个工作日的打卡分钟数（未排序，可能有重复）"""
+    punches = []
+    if rng.random() >= P_MISSING_IN:
+        if rng.random() < P_LATE:
+            punches.append(rng.randint(8 * 60 + 1, 9 * 60 + 30))
+        else:
+            punches.append(rng.randint(7 * 60 + 40, 8 * 60))
+    if rng.random() < P_NOON:
+        punches.append(rng.randint(12 * 60, 12 * 60 + 10))
+        if rng.random() < P_EARLY_RETURN:
+            punches.append(rng.randint(12 * 60 + 20, 12 * 60 + 29))
+        else:
+            punches.append(rng.randint(12 * 60 + 31, 13 * 60 + 30))
+    if rng.random() >= P_MISSING_OUT:
+        roll = rng.random()
+        if roll < P_CROSS_MIDNIGHT:
+            punches.append(1440 + rng.randint(0, 2 * 60))
+        elif roll < P_CROSS_MIDNIGHT + P_OVERTIME:
+            punches.append(rng.randint(19 * 60, 22 * 60 + 30))
+        else:
+            punches.append(rng.randint(17 * 60 + 30, 18 * 60))
+    return punches
+
+
+def month_punches(employee, year, month, seed=DEFAULT_SEED):
+    """
+    一名员工一个月的打卡，产出 (日期, 升序分钟数元组)，没有打卡的日期不产出
+    分钟数与 import_excel.parse_punch_cell 一致：次日打卡为 1440 + 分钟数
+    """
+    rng = random.Random(f"{seed}:{employee['employee_id']}:{year}-{month:02d}")
+    for day_number in range(1, calendar.monthrange(year, month)[1] + 1):
+        day = date(year, month, day_number)
+        if day.weekday() >= 5:
+            punches = _workday_punches(rng) if rng.random() < P_WEEKEND_WORK else []
+        elif rng.random() < P_ABSENT:
+            punches = []
+        else:
+            punches = _workday_punches(rng)
+        if punches and rng.random() < P_DUPLICATE:
+            duplicate = rng.choice(punches)
+            punches.append(min(duplicate + rng.randint(0, 2), 2 * 1440 - 1))
+        if punches:
+            yield day, tuple(sorted(punches))
+
+
+def iter_punches(employees, start, months, seed=DEFAULT_SEED):
+    """全部员工 months 个月的打卡，产出 (员工, 日期, 分钟数元组)，按月份、员工顺序"""
+    for year, month in iter_months(start, months):
+        for employee in employees:
+            for day, punches in month_punches(employee, year, month, seed):
+                yield employee, day, punches
+
+
+def _cell_text(punches):
+    """打卡转换为月报单元格文本，如 '正常- 07:59; 12:01; 次日00:30'"""
+    return '正常- ' + punch_codec.format_minutes(punches, '; ')
+
+
+def write_month_report(directory, employees, year, month, seed=DEFAULT_SEED):
+    """
+    生成一个月的“上下班打卡_月报”Excel（与钉钉导出的表头一致，可直接导入）
+    返回文件路径
+    """
+    start = date(year, month, 1)
+    end = date(year, month, calendar.monthrange(year, month)[1])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, export_report.export_file_name(start, end))
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(import_excel.MONTHLY_SHEET)
+    for row in export_report.header_rows(start, end):
+        sheet.append(row)
+    summary_width = len(export_report.SUMMARY_COLUMNS) - 1
+    for employee in employees:
+        by_day = dict(month_punches(employee, year, month, seed))
+        cells = []
+        for day_number in range(1, end.day + 1):
+            day = date(year, month, day_number)
+            if day in by_day:
+                cells.append(_cell_text(by_day[day]))
+            elif day.weekday() < 5:
+                cells.append('缺卡(上班); \n 缺卡(下班);')
+            else:
+                cells.append('正常（未排班）')
+        sheet.append([employee['name'], employee['employee_id'], '', employee['department']]
+                     + [None] * summary_width + cells)
+    workbook.save(path)
+    return path
+
+
+def write_month_reports(directory, employees, start, months, seed=DEFAULT_SEED):
+    """每个月生成一个月报文件，返回文件路径列表"""
+    return [write_month_report(directory, employees, year, month, seed)
+            for year, month in iter_months(start, months)]
+
+
+def build_database(path, employees, start, months, seed=DEFAULT_SEED, process_shifts=True):
+    """
+    把生成的数据直接写入数据库（与导入月报的结果相同，但不经过 Excel）
+    process_shifts 为 True 时按班次处理生产部、后勤部的打卡。返回写入的考勤记录数
+    """
+    db.set_db_path(path)
+    migrations.migrate()
+    shift_engine.reload_shifts()
+    resolve = rules.rule_resolver()
+
+    employee_batch = [dict(employee, hire_date=f"{start[0]}-{start[1]:02d}-01") for employee in employees]
+    entries = []
+    count = 0
+    for employee, day, punches in iter_punches(employees, start, months, seed):
+        entries.append((employee['employee_id'], day, punches, resolve(day, employee['department'])))
+        if len(entries) >= import_excel.BATCH_SIZE:
+            import_excel.write_records(employee_batch, rules_batch.build_records(entries))
+            count += len(entries)
+            employee_batch, entries = [], []
+    import_excel.write_records(employee_batch, rules_batch.build_records(entries))
+    count += len(entries)
+
+    if process_shifts:
+        months_list = list(iter_months(start, months))
+        last_year, last_month = months_list[-1]
+        shift_engine.process_range(
+            date(start[0], start[1], 1),
+            date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+        )
+    return count
+
+
+def _parse_month(value):
+    year, month = value.split('-')
+    return int(year), int(month)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="生成可复现的考勤测试数据")
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--months', type=int, default=1)
+    parser.add_argument('--start', type=_parse_month, default=(2025, 7), help="起始月份 YYYY-MM")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--db', help="写入的数据库文件")
+    parser.add_argument('--xlsx-dir', help="月报 Excel 的输出目录")
+    args = parser.parse_args()
+    if not args.db and not args.xlsx_dir:
+        parser.error("至少指定 --db 或 --xlsx-dir")
+
+    employee_list = generate_employees(args.employees, args.seed)
+    if args.db:
+        total = build_database(args.db, employee_list, args.start, args.months, args.seed)
+        print(f"已写入 {args.db}：{len(employee_list)}名员工，{total}条考勤记录")
+    if args.xlsx_dir:
+        for file_path in write_month_reports(args.xlsx_dir, employee_list, args.start, args.months, args.seed):
+            print(f"已生成 {file_path}")
@@ -0,0 +1,112 @@
+import os
+from datetime import date
+import pytest
+from modules import archive, db, export_report, import_excel, reports, summaries
+from tests import datagen
+
+
+@pytest.fixture
+def two_months(temp_db):
+    """2025 年 7、8 两个月的数据（含班次处理结果）"""
+    datagen.build_database(temp_db, datagen.generate_employees(40), (2025, 7), 2)
+    return temp_db
+
+
+def _all_pages(fetch, **filters):
+    rows, cursor = [], None
+    while True:
+        page, cursor = fetch(cursor=cursor, limit=37, **filters)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+
+
+def _hot_count(table, column, month):
+    with db.get_connection() as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM {table} WHERE substr({column}, 1, 7) = ?", (month,)
+        ).fetchone()[0]
+
+
+def test_archived_month_is_routed_transparently(two_months):
+    records = _all_pages(reports.get_attendance_records_page)
+    july = _all_pages(reports.get_attendance_records_page, start_date='2025-07-20', end_date='2025-08-10')
+    morning = _all_pages(lambda **kw: reports.get_shift_records_page('morning', **kw))
+    export = list(export_report.iter_month_rows(date(2025, 7, 1), date(2025, 7, 31), '生产部'))
+    monthly = summaries.get_department_monthly('2025-07')
+
+    ok, message = archive.archive_month('2025-07')
+    assert ok, message
+    assert os.path.exists(os.path.join(archive.archive_dir(), 'attendance_2025-07.db'))
+    assert _hot_count('attendance_records', 'work_date', '2025-07') == 0
+    assert _hot_count('production_morning_records', 'check_date', '2025-07') == 0
+    assert [month for month, _ in archive.partitions('2025-07-15', '2025-09-01')] == ['2025-07']
+    assert archive.partitions('2025-08-01', '2025-08-31') == []
+
+    assert _all_pages(reports.get_attendance_records_page) == records
+    assert _all_pages(reports.get_attendance_records_page,
+                      start_date='2025-07-20', end_date='2025-08-10') == july
+    assert _all_pages(lambda **kw: reports.get_shift_records_page('morning', **kw)) == morning
+    assert list(export_report.iter_month_rows(date(2025, 7, 1), date(2025, 7, 31), '生产部')) == export
+
+    # 汇总保留在热库，重建时也不受影响
+    assert summaries.get_department_monthly('2025-07') == monthly
+    summaries.rebuild()
+    assert summaries.get_department_monthly('2025-07') == monthly
+    with db.get_connection() as conn:
+        # 归档后的连接不残留附加的数据库
+        assert not [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith('archive_')]
+
+
+def test_archive_rejects_open_and_empty_months(two_months):
+    assert archive.archive_month(date.today().strftime('%Y-%m'))[0] is False
+    assert archive.archive_month('2025-13')[0] is False
+    assert archive.archive_month('2024-01') == (False, "2024-01 没有需要归档的记录")
+    assert archive.archivable_months(2, today=date(2025, 9, 15)) == ['2025-07']
+    assert archive.archivable_months(1, today=date(2025, 9, 15)) == ['2025-07', '2025-08']
+
+
+def test_late_rows_are_merged_into_existing_partition(two_months):
+    assert archive.archive_month('2025-07')[0]
+    assert archive.archive_month('2025-07') == (False, "2025-07 没有需要归档的记录")
+    with db.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO logistics_records (employee_id, check_date, has_check_in, status) "
+            "VALUES ('HS000001', '2025-07-31', 1, '补录')"
+        )
+    ok, message = archive.archive_month('2025-07')
+    assert ok and "后勤 1 条" in message
+    rows, _ = reports.get_shift_records_page('logistics', start_date='2025-07-31', end_date='2025-07-31',
+                                             limit=500)
+    # 唯一键相同时热库中的新记录覆盖归档中的旧记录
+    assert [row['status'] for row in rows if row['employee_id'] == 'HS000001'] == ['补录']
+    assert _hot_count('logistics_records', 'check_date', '2025-07') == 0
+
+
+def test_archive_survives_new_hot_columns(two_months):
+    export = list(export_report.iter_month_rows(date(2025, 7, 20), date(2025, 8, 10)))
+    assert archive.archive_month('2025-07')[0]
+    with db.get_connection() as conn:
+        conn.execute("ALTER TABLE attendance_records ADD COLUMN remark TEXT")
+        conn.execute("ALTER TABLE logistics_records ADD COLUMN remark TEXT")
+    assert list(export_report.iter_month_rows(date(2025, 7, 20), date(2025, 8, 10))) == export
+
+    with db.get_connection() as conn:
+        conn.execute(
+            "INSERT INTO logistics_records (employee_id, check_date, has_check_in, status, remark) "
+            "VALUES ('HS000001', '2025-07-31', 1, '补录', '后补')"
+        )
+    ok, message = archive.archive_month('2025-07')
+    assert ok, message
+    rows, _ = reports.get_shift_records_page('logistics', start_date='2025-07-31', end_date='2025-07-31',
+                                             limit=500)
+    assert [row['status'] for row in rows if row['employee_id'] == 'HS000001'] == ['补录']
+
+
+def test_archived_month_cannot_be_reimported(two_months, tmp_path):
+    employees = datagen.generate_employees(40)
+    path = datagen.write_month_report(str(tmp_path / 'xlsx'), employees, 2025, 7)
+    assert archive.archive_month('2025-07')[0]
+    ok, message = import_excel.import_attendance_from_excel(path)
+    assert not ok and "2025-07 已归档" in message
+    assert _hot_count('attendance_records', 'work_date', '2025-07') == 0
@@ -0,0 +1,15 @@
+from modules import bulk_import, db
+from tests import datagen
+
+
+def test_broken_file_fails_alone(temp_db, tmp_path):
+    employees = datagen.generate_employees(5)
+    good = datagen.write_month_report(str(tmp_path / 'xlsx'), employees, 2025, 7)
+    broken = tmp_path / 'broken.xlsx'
+    broken.write_bytes(b'not a workbook')
+
+    ok, message = bulk_import.bulk_import([str(broken), good], workers=1)
+    assert not ok
+    assert "broken.xlsx" in message and "导入完成：1个文件，5名员工" in message
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM attendance_records").fetchone()[0] > 0
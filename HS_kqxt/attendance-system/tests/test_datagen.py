@@ -0,0 +1,93 @@
+import os
+from modules import db, import_excel
+from tests import bench, datagen
+
+START = (2025, 7)
+
+
+def _all_punches(employees, months=1, seed=datagen.DEFAULT_SEED):
+    return [(employee['employee_id'], day, punches)
+            for employee, day, punches in datagen.iter_punches(employees, START, months, seed)]
+
+
+def test_generator_is_deterministic():
+    employees = datagen.generate_employees(30)
+    assert employees == datagen.generate_employees(30)
+    assert _all_punches(employees) == _all_punches(datagen.generate_employees(30))
+    assert _all_punches(employees) != _all_punches(employees, seed=1)
+
+
+def test_more_employees_keep_existing_data():
+    small = datagen.generate_employees(10)
+    large = datagen.generate_employees(20)
+    assert large[:10] == small
+    small_ids = {employee['employee_id'] for employee in small}
+    assert [p for p in _all_punches(large) if p[0] in small_ids] == _all_punches(small)
+
+
+def test_generator_covers_edge_cases():
+    employees = datagen.generate_employees(200)
+    departments = {employee['department'] for employee in employees}
+    assert {'生产部', '后勤部'} <= departments
+
+    punches = [p for _, _, p in _all_punches(employees)]
+    assert any(len(p) == 1 for p in punches)                              # 缺卡
+    assert any(8 * 60 < p[0] < 12 * 60 for p in punches)                  # 迟到
+    assert any(p[-1] >= 1440 for p in punches)                            # 次日
+    assert any(b - a <= 2 for p in punches for a, b in zip(p, p[1:]))     # 重复打卡
+    days_with_punches = {(employee_id, day) for employee_id, day, _ in _all_punches(employees)}
+    assert len(days_with_punches) < len(employees) * 23                   # 缺勤
+
+
+def test_month_report_round_trip(temp_db, tmp_path):
+    employees = datagen.generate_employees(25)
+    path = datagen.write_month_report(str(tmp_path / 'xlsx'), employees, *START)
+    assert os.path.basename(path) == '上下班打卡_月报_20250701-20250731.xlsx'
+
+    parsed = [(employee['employee_id'], day, punches)
+              for employee, day, punches in import_excel.iter_month_report(path)]
+    assert parsed == _all_punches(employees)
+
+    ok, message = import_excel.import_attendance_from_excel(path)
+    assert ok, message
+    with db.get_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM attendance_records").fetchone()[0]
+        departments = dict(conn.execute("SELECT employee_id, department FROM employees").fetchall())
+    assert count == len(parsed)
+    assert departments == {employee['employee_id']: employee['department'] for employee in employees}
+
+
+def test_build_database_matches_import(temp_db, tmp_path):
+    employees = datagen.generate_employees(25)
+    count = datagen.build_database(temp_db, employees, START, 1)
+    with db.get_connection() as conn:
+        direct = conn.execute(
+            "SELECT employee_id, work_date, status, work_hours, overtime_hours, punches "
+            "FROM attendance_records ORDER BY employee_id, work_date"
+        ).fetchall()
+        shifts = conn.execute("SELECT COUNT(*) FROM production_morning_records").fetchone()[0]
+    assert count == len(direct) == len(_all_punches(employees))
+    assert shifts > 0
+
+    path = datagen.write_month_report(str(tmp_path / 'xlsx'), employees, *START)
+    imported_db = str(tmp_path / 'data' / 'imported.db')
+    bench._use_database(imported_db)
+    ok, message = import_excel.import_attendance_from_excel(path)
+    assert ok, message
+    with db.get_connection() as conn:
+        imported = conn.execute(
+            "SELECT employee_id, work_date, status, work_hours, overtime_hours, punches "
+            "FROM attendance_records ORDER BY employee_id, work_date"
+        ).fetchall()
+    assert imported == direct
+
+
+def test_bench_smoke():
+    result = bench.run_scale(200, repeat=1)
+    assert result['records'] > 0
+    for name in ('import_excel', 'shift_process_range', 'process_morning_shift',
+                 'process_logistics_department', 'get_backend_data_cold', 'get_backend_data_warm',
+                 'search', 'export_xlsx', 'export_csv', 'punch_ingest'):
+        assert result['benchmarks'][name]['median'] >= 0
+    assert result['benchmarks']['export_csv']['bytes'] > 0
+    assert result['benchmarks']['punch_ingest']['failed'] == 0
@@ -0,0 +1,73 @@
+import os
+import time
+from modules import db, jobs, shift_engine
+from tests import datagen
+
+
+def _shift_result_count():
+    with db.get_connection() as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                   for table in ('production_morning_records', 'logistics_records'))
+
+
+def test_reprocess_reports_progress_and_can_be_cancelled(temp_db, monkeypatch):
+    datagen.build_database(temp_db, datagen.generate_employees(40), (2025, 7), 1, process_shifts=False)
+    assert len(shift_engine.get_engine()) >= 2
+
+    job_id, _ = jobs.submit_reprocess('2025-07-01', '2025-07-31', created_by='admin')
+    assert jobs.claim_next()[0] == job_id
+    # 处理完第一个部门后请求取消，剩下的部门不再处理
+    run_shift = shift_engine.run_shift
+
+    def run_then_cancel(*args):
+        jobs.cancel(job_id)
+        return run_shift(*args)
+
+    monkeypatch.setattr(shift_engine, 'run_shift', run_then_cancel)
+    jobs.run_job(job_id, 'reprocess', {'start': '2025-07-01', 'end': '2025-07-31'})
+    job = jobs.get_job(job_id)
+    assert job['status'] == jobs.CANCELLED
+    assert 0 < job['progress'] < 100
+    first_department = _shift_result_count()
+    assert first_department > 0
+
+    monkeypatch.setattr(shift_engine, 'run_shift', run_shift)
+    calls = []
+    processed = shift_engine.process_range('2025-07-01', '2025-07-31',
+                                           progress=lambda done, total: calls.append((done, total)))
+    assert len(calls) == len(processed)
+    assert calls[-1][0] == calls[-1][1] == sum(processed.values())
+    assert _shift_result_count() > first_department
+
+
+def test_active_jobs_filtered_by_user(temp_db):
+    jobs.submit_reprocess('2025-07-01', '2025-07-31', created_by='bob')
+    assert jobs.has_active_jobs() and jobs.has_active_jobs(created_by='bob')
+    assert not jobs.has_active_jobs(created_by='alice')
+
+
+def test_heartbeat_runs_without_progress(temp_db, monkeypatch):
+    monkeypatch.setattr(jobs, 'HEARTBEAT_SECONDS', 0.05)
+
+    def slow_reprocess(job_id, payload, report):
+        # 不报告进度的长任务：把心跳改旧后等待定时心跳刷新
+        with db.get_connection() as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = '2000-01-01 00:00:00' WHERE id = ?", (job_id,))
+        time.sleep(0.3)
+        return True, 'ok', None
+
+    monkeypatch.setitem(jobs.HANDLERS, 'reprocess', slow_reprocess)
+    job_id, _ = jobs.submit_reprocess('2025-07-01', '2025-07-31')
+    jobs.run_job(*jobs.claim_next())
+    assert jobs.get_job(job_id)['heartbeat_at'] > '2000-01-01 00:00:00'
+
+
+def test_import_removes_upload(temp_db, tmp_path):
+    path = datagen.write_month_report(str(tmp_path / 'xlsx'), datagen.generate_employees(5), 2025, 7)
+    with open(path, 'rb') as f:
+        job_id, _ = jobs.submit_import([(os.path.basename(path), f.read())], created_by='alice')
+    upload = jobs.get_job(job_id)['payload']['files'][0]['path']
+    assert os.path.exists(upload)
+    jobs.run_pending(stop_when_idle=True)
+    assert jobs.get_job(job_id)['status'] == jobs.DONE
+    assert not os.path.exists(upload)
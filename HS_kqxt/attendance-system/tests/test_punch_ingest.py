@@ -0,0 +1,94 @@
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+import pytest
+from modules import db, import_excel, punch_ingest, punches, summaries
+
+
+@pytest.fixture
+def punch_db(temp_db):
+    """两名员工的临时数据库，测试结束时停止写入线程"""
+    import_excel.write_records([
+        {'employee_id': 'HS000001', 'name': '张三', 'department': '生产部', 'hire_date': '2025-01-01'},
+        {'employee_id': 'HS000002', 'name': '李四', 'department': '行政部', 'hire_date': '2025-01-01'},
+    ], [])
+    yield temp_db
+    punch_ingest.stop_writer()
+
+
+def _day_punches(employee_id, work_date):
+    # 新建连接读取，确认打卡已提交而不只是在连接池的连接中可见
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        row = conn.execute(
+            "SELECT punches FROM attendance_records WHERE employee_id = ? AND work_date = ?",
+            (employee_id, work_date)
+        ).fetchone()
+    finally:
+        conn.close()
+    return None if row is None else punches.unpack(row[0]).tolist()
+
+
+def _record_id(employee_id, work_date):
+    with db.get_connection() as conn:
+        return conn.execute(
+            "SELECT id FROM attendance_records WHERE employee_id = ? AND work_date = ?",
+            (employee_id, work_date)
+        ).fetchone()[0]
+
+
+def test_punches_merge_into_work_day(punch_db):
+    assert punch_ingest.submit_punch('HS000001', datetime(2025, 7, 1, 7, 58)) == (True, "打卡成功：07:58")
+    record_id = _record_id('HS000001', '2025-07-01')
+    ok, _ = punch_ingest.submit_punch('HS000001', datetime(2025, 7, 1, 17, 5))
+    assert ok
+    # 并入当天记录时原地更新，记录 id 不变
+    assert _record_id('HS000001', '2025-07-01') == record_id
+    # 同一分钟重复打卡只记一次，凌晨 05:00 前的打卡记入前一天
+    tickets = [punch_ingest.enqueue('HS000001', datetime(2025, 7, 1, 17, 5)),
+               punch_ingest.enqueue('HS000001', datetime(2025, 7, 2, 1, 30))]
+    assert all(ticket.wait()[0] for ticket in tickets)
+
+    assert _day_punches('HS000001', '2025-07-01') == [478, 1025, 1530]
+    assert _day_punches('HS000001', '2025-07-02') is None
+
+
+def test_unknown_employee_is_rejected_without_failing_batch(punch_db):
+    tickets = [punch_ingest.enqueue(employee_id, datetime(2025, 7, 1, 8, 0))
+               for employee_id in ('HS000002', 'HS999999')]
+    assert tickets[0].wait() == (True, "打卡成功：08:00")
+    assert tickets[1].wait() == (False, "员工编号 HS999999 不存在")
+    assert _day_punches('HS000002', '2025-07-01') == [480]
+
+
+def test_concurrent_punches_are_group_committed(punch_db):
+    results = []
+
+    def worker(employee_id, hour):
+        results.extend(punch_ingest.submit_punch(employee_id, datetime(2025, 7, 3, hour, minute))[0]
+                       for minute in range(0, 60, 3))
+
+    threads = [threading.Thread(target=worker, args=(employee_id, hour))
+               for employee_id in ('HS000001', 'HS000002') for hour in (8, 17)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 80 and all(results)
+    assert len(_day_punches('HS000001', '2025-07-03')) == 40
+    stats = punch_ingest.get_stats()
+    assert stats['punches'] >= 80 and stats['flushes'] < stats['punches']
+
+    # 汇总表延后刷新，读取时与逐条导入的结果一致
+    daily = summaries.get_employee_daily('HS000002', '2025-07-03', '2025-07-03')
+    assert daily[0]['check_in_ts'] is not None and daily[0]['work_hours'] > 0
+
+
+def test_full_queue_rejects_new_punches(punch_db, monkeypatch):
+    monkeypatch.setattr(punch_ingest, '_queue', queue.Queue(maxsize=1))
+    monkeypatch.setattr(punch_ingest, 'start_writer', lambda: None)
+    assert punch_ingest.enqueue('HS000001', datetime(2025, 7, 1, 8, 0), timeout=0) is not None
+    assert punch_ingest.submit_punch('HS000001', datetime(2025, 7, 1, 8, 1)) == (False, "打卡人数过多，请稍后重试")
+    assert punch_ingest.get_stats()['rejected'] >= 1
@@ -0,0 +1,39 @@
+from modules import db, import_excel, migrations, punches
+
+
+def test_text_and_blob_round_trip():
+    minutes = punches.parse_text('12:01;07:59; 次日00:30;bad;25:00')
+    assert minutes == [479, 721, 1470]
+    assert punches.format_minutes(minutes) == '07:59;12:01;次日00:30'
+    assert punches.to_text(punches.pack(minutes), '; ') == '07:59; 12:01; 次日00:30'
+    assert punches.parse_minute('次日05:00') == 1740 and punches.parse_minute('24:00') is None
+
+
+def test_month_report_cells_use_shared_parser():
+    assert import_excel.parse_punch_cell('正常- 07:59; 12:01; 次日00:30') == (479, 721, 1470)
+    assert import_excel.parse_punch_cell('正常- 08:02\n补卡申请（07-11 18:00）') == (482,)
+    assert import_excel.parse_punch_cell('休息') == ()
+    assert punches.find_minutes('迟到- 08:15;\n缺卡(下班)') == [495]
+
+
+def test_text_columns_are_converted_then_dropped(tmp_path, monkeypatch):
+    old_path = db.DB_PATH
+    db.set_db_path(str(tmp_path / 'legacy.db'))
+    try:
+        monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:12])
+        migrations.migrate()
+        with db.get_connection() as conn:
+            # v10 之后由其他途径写入、只有字符串的旧记录
+            conn.execute("INSERT INTO attendance_records (employee_id, work_date, check_times) "
+                         "VALUES ('HS000001', '2025-07-01', '07:58;次日00:30')")
+        monkeypatch.undo()
+        assert migrations.migrate()[0] == 13
+        with db.get_connection() as conn:
+            blob = conn.execute("SELECT punches FROM attendance_records").fetchone()[0]
+            columns = {table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                       for table in ('attendance_records', 'production_morning_records')}
+        assert punches.unpack(blob).tolist() == [478, 1470]
+        assert 'check_times' not in columns['attendance_records']
+        assert 'original_check_times' not in columns['production_morning_records']
+    finally:
+        db.set_db_path(old_path)
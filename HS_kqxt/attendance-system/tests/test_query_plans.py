@@ -0,0 +1,43 @@
+import pytest
+from modules import db, query_catalog, tracing
+from tests import datagen
+
+
+@pytest.fixture(scope="module")
+def seeded_db(tmp_path_factory):
+    """按生成器写入 120 名员工一个月的数据（未执行 ANALYZE，与新部署的数据库一致）"""
+    path = str(tmp_path_factory.mktemp("plans") / "plans.db")
+    old_path = db.DB_PATH
+    datagen.build_database(path, datagen.generate_employees(120), (2025, 7), 1)
+    yield query_catalog.sample_values()
+    db.set_db_path(old_path)
+
+
+@pytest.mark.parametrize("case", query_catalog.CATALOG, ids=lambda case: case.name)
+def test_hot_queries_use_indexes(seeded_db, case):
+    statements, problems = query_catalog.check_case(case, seeded_db)
+    assert statements
+    assert problems == []
+
+
+def test_checker_flags_function_wrapped_column(seeded_db):
+    def wrapped(sample):
+        with db.get_connection() as conn:
+            conn.execute("SELECT COUNT(*) FROM attendance_records WHERE DATE(work_date) = ?",
+                         (sample['day'],)).fetchone()
+
+    _, problems = query_catalog.check_case(query_catalog.QueryCase('wrapped', wrapped), seeded_db)
+    assert len(problems) == 1 and "SCAN attendance_records" in problems[0]
+
+
+def test_cold_cases_and_allowances_are_reported_not_failed(seeded_db):
+    assert query_catalog.scan_violations(["SCAN employees"], None) == ["SCAN employees"]
+    assert query_catalog.scan_violations(["SCAN summary_dirty_days", "SCAN CONSTANT ROW"]) == []
+    def like_search(sample):
+        with db.get_connection() as conn:
+            conn.execute("SELECT * FROM employees WHERE name LIKE ?", (f"%{sample['name'][:1]}%",)).fetchall()
+
+    case = query_catalog.QueryCase('cold', like_search, hot=False)
+    statements, problems = query_catalog.check_case(case, seeded_db)
+    assert problems == [] and "SCAN employees" in statements[0]['plan']
+    assert tracing.current_run() is None
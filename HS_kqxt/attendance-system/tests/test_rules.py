@@ -0,0 +1,82 @@
+import sqlite3
+from datetime import date
+import pytest
+from modules import dashboard, db, export_report, rules, rules_batch
+from tests import datagen
+
+
+@pytest.fixture
+def check_every_call(monkeypatch):
+    """每次读取规则都检查版本表，其他进程写入的版本立即可见"""
+    monkeypatch.setattr(rules, 'RULES_CHECK_SECONDS', 0)
+
+
+def _insert_version_elsewhere(effective_from, **fields):
+    """模拟其他进程（如网页进程）新增规则版本：独立连接写入，不经过本进程的缓存失效"""
+    columns = ', '.join(f"? AS {key}" if key in fields else key for key in rules.RULE_FIELDS)
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        with conn:
+            conn.execute(f'''
+            INSERT INTO attendance_rule_versions
+            (effective_from, department, {', '.join(rules.RULE_FIELDS)})
+            SELECT ?, NULL, {columns}
+            FROM attendance_rule_versions ORDER BY id LIMIT 1
+            ''', [effective_from] + [fields[key] for key in rules.RULE_FIELDS if key in fields])
+            return conn.execute("SELECT MAX(id) FROM attendance_rule_versions").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_versions_added_by_another_process_are_seen(temp_db, check_every_call):
+    datagen.build_database(temp_db, datagen.generate_employees(20), (2025, 7), 1, process_shifts=False)
+    first = rules.rule_set_for('2025-07-15')
+    version_id = _insert_version_elsewhere('2025-07-10', work_start_time='07:30')
+
+    assert rules.rule_set_for('2025-07-09').version_id == first.version_id
+    assert rules.rule_set_for('2025-07-15').version_id == version_id
+
+    generation = dashboard._cache['generation']
+    updated = rules_batch.recompute_range('2025-07-10')
+    assert dashboard._cache['generation'] > generation
+    with db.get_connection() as conn:
+        stale = conn.execute(
+            "SELECT COUNT(*) FROM attendance_records WHERE work_date >= '2025-07-10' AND rule_version_id != ?",
+            (version_id,)
+        ).fetchone()[0]
+    assert updated > 0 and stale == 0
+
+
+def test_past_periods_use_the_rules_in_force(temp_db, check_every_call):
+    datagen.build_database(temp_db, datagen.generate_employees(30), (2025, 7), 1, process_shifts=False)
+    start, end = date(2025, 7, 1), date(2025, 7, 31)
+    export = list(export_report.iter_month_rows(start, end))
+    closed = rules_batch.month_close(start, end)
+
+    # 今天起生效的新规则不影响过去月份的导出和月度结算
+    _insert_version_elsewhere(date.today().isoformat(), work_start_time='10:00',
+                              work_days='1,2,3,4,5,6', daily_standard_hours=10)
+    assert list(export_report.iter_month_rows(start, end)) == export
+    assert rules_batch.month_close(start, end) == closed
+
+    # 月中生效的版本只影响生效之后的日期
+    first_half = rules_batch.month_close(start, date(2025, 7, 15))
+    second_half = rules_batch.month_close(date(2025, 7, 16), end)
+    _insert_version_elsewhere('2025-07-16', work_start_time='07:30')
+    assert rules_batch.month_close(start, date(2025, 7, 15)) == first_half
+    late = sum(row['late_count'] for row in rules_batch.month_close(date(2025, 7, 16), end).values())
+    assert late > sum(row['late_count'] for row in second_half.values())
+
+
+def test_rule_lookups_do_not_query_each_call(temp_db, monkeypatch):
+    calls = []
+    stamp = rules._versions_stamp
+    monkeypatch.setattr(rules, '_versions_stamp', lambda: calls.append(1) or stamp())
+    first = rules.rule_set_for('2025-07-15')
+    for _ in range(1000):
+        assert rules.rule_set_for('2025-07-15') is first
+    assert len(calls) <= 1
+
+    # 本进程更新规则后不等检查间隔，立即读到新版本
+    ok, _ = rules.update_attendance_rules({'work_start_time': '07:30'})
+    assert ok and rules.get_rule_set().raw['work_start_time'] == '07:30'
@@ -0,0 +1,58 @@
+from datetime import time
+import pytest
+from modules import punches, rules, shift_engine
+from tests import datagen
+
+
+def test_cross_midnight_punch_ends_shift(temp_db):
+    shift = shift_engine.get_engine()['生产部']
+    blobs = [punches.pack([470, 1500]), punches.pack([470, 1080, 1470]), punches.pack([470, 1800])]
+    result = shift_engine.run_shift(shift, ['HS000001'] * 3, ['2025-07-01', '2025-07-02', '2025-07-03'], blobs)
+    # 次日01:00 下班：取整到 01:00，晚上加班从 17:30 算到次日 01:00
+    assert (result[0]['status'], result[0]['work_end_time'], result[0]['night_overtime_hours']) == \
+        ('正常', time(1, 0), 7.5)
+    # 次日打卡排在当天的下班卡之后
+    assert (result[1]['work_end_time'], result[1]['night_overtime_hours']) == (time(0, 30), 7.0)
+    # 次日 05:00 之后的打卡不属于本班次
+    assert (result[2]['status'], result[2]['work_end_time']) == ('缺卡', None)
+
+
+# 每类情况从生成的打卡中选取，逐条与标量函数 rules.process_* 的结果比较
+EQUIVALENCE_CASES = {
+    'late': lambda p: 480 < p[0] <= 720,
+    'missing_in': lambda p: p[0] > 720,
+    'missing_out': lambda p: p[0] <= 720 and max(p) < 810,
+    'duplicate': lambda p: any(b - a <= 2 for a, b in zip(p, p[1:])),
+    'early_return': lambda p: any(740 <= m < 750 for m in p),
+    'next_day': lambda p: max(p) >= 1440,
+}
+COMPARED_FIELDS = ('work_start_time', 'work_end_time', 'noon_leave_time', 'noon_start_time',
+                   'day_overtime_hours', 'night_overtime_hours', 'status', 'status_note')
+
+
+def _sample(case, limit=60):
+    match = EQUIVALENCE_CASES[case]
+    employees = datagen.generate_employees(300)
+    found = [punch_list for _, _, punch_list in datagen.iter_punches(employees, (2025, 7), 1)
+             if match(punch_list)]
+    assert found, case
+    return found[:limit]
+
+
+@pytest.mark.parametrize('case', sorted(EQUIVALENCE_CASES))
+def test_engine_matches_scalar_functions(temp_db, case):
+    sample = _sample(case)
+    engine = shift_engine.get_engine()
+    blobs = [punches.pack(punch_list) for punch_list in sample]
+    ids = [f"HS{i:06d}" for i in range(len(sample))]
+    dates = ['2025-07-01'] * len(sample)
+
+    morning = shift_engine.run_shift(engine['生产部'], ids, dates, blobs)
+    logistics = shift_engine.run_shift(engine['后勤部'], ids, dates, blobs)
+    for i, blob in enumerate(blobs):
+        text = punches.to_text(blob)
+        expected = rules.process_morning_shift(ids[i], dates[0], text)
+        assert {f: morning[i][f] for f in COMPARED_FIELDS} == {f: expected[f] for f in COMPARED_FIELDS}, text
+        expected = rules.process_logistics_department(ids[i], dates[0], text)
+        assert (logistics[i]['status'], logistics[i]['has_check_in']) == \
+            (expected['status'], expected['has_check_in']), text
@@ -0,0 +1,51 @@
+import json
+from modules import db, tracing
+
+
+def test_disabled_tracing_returns_plain_connection(temp_db):
+    with tracing.run("off", enabled=False) as run:
+        assert run is None
+        with db.get_connection() as conn:
+            assert not isinstance(conn, tracing._TracedConnection)
+
+
+def test_records_queries_phases_and_notes(temp_db):
+    with tracing.run("test", enabled=True):
+        with tracing.phase("read"):
+            with db.get_connection() as conn:
+                rows = conn.execute("SELECT username FROM users WHERE role = ?", ("admin",)).fetchall()
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM attendance_rule_versions")
+                fetched = list(cursor)
+        with tracing.phase("write"):
+            with db.get_connection() as conn:
+                conn.execute("INSERT INTO jobs (kind, status, payload) VALUES ('export', 'done', '{}')")
+        tracing.note("rows", len(rows))
+
+    run = tracing.recent_runs()[0]
+    assert run["label"] == "test"
+    assert [p["name"] for p in run["phases"]] == ["read", "write"]
+    assert run["phases"][0]["queries"] == 2
+
+    select, version_select, insert, commit = run["queries"][:4]
+    assert select["rows"] == len(rows) == 1
+    assert select["expanded"] == "SELECT username FROM users WHERE role = 'admin'"
+    assert select["site"].startswith("tests/test_tracing.py:")
+    assert version_select["rows"] == len(fetched)
+    assert insert["rows"] == 1 and insert["statements"] >= 1
+    assert commit["sql"] == "COMMIT"
+    assert run["notes"] == {"rows": 1}
+
+    summary = tracing.summarize_queries(run)
+    assert {group["sql"] for group in summary} >= {select["sql"], "COMMIT"}
+
+
+def test_runs_are_written_as_json_lines(temp_db):
+    with tracing.run("logged", enabled=True):
+        with db.get_connection() as conn:
+            conn.execute("SELECT 1").fetchone()
+
+    with open(tracing.LOG_PATH, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[-1]["label"] == "logged"
+    assert lines[-1]["query_count"] == 1